@@ -0,0 +1,130 @@
+"""
+Exporta o modelo YOLOv8 treinado (solar_v1.pt) para ONNX e, opcionalmente,
+gera uma versão INT8 (quantização estática) calibrada com imagens de treino.
+
+Uso:
+    python scripts/export_onnx.py                     # models/solar_v1.onnx
+    python scripts/export_onnx.py --int8              # + models/solar_v1.int8.onnx
+    python scripts/export_onnx.py --int8 --calibracao 200
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import shutil
+import sys
+
+import cv2
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+
+from src.services.detectors import YOLO_IMGSZ, letterbox, ultralytics_instalado  # noqa: E402
+
+
+class LeitorCalibracao:
+    """Entrega imagens de treino (mesmo pré-processamento da inferência) ao calibrador do ONNX Runtime."""
+
+    def __init__(self, arquivos, nome_entrada, tamanho):
+        self._arquivos = iter(arquivos)
+        self.nome_entrada = nome_entrada
+        self.tamanho = tamanho
+
+    def get_next(self):
+        for caminho in self._arquivos:
+            img = cv2.imread(caminho)
+            if img is not None:
+                return {self.nome_entrada: letterbox(img, self.tamanho)[0][None]}
+        return None
+
+
+def exportar_onnx(caminho_pt, caminho_onnx, tamanho):
+    from ultralytics import YOLO
+
+    print(f"📦 Exportando {caminho_pt} -> {caminho_onnx}")
+    gerado = YOLO(caminho_pt).export(format="onnx", imgsz=tamanho, dynamic=True, simplify=False)
+    if os.path.abspath(gerado) != os.path.abspath(caminho_onnx):
+        shutil.move(gerado, caminho_onnx)
+    return caminho_onnx
+
+
+def _nos_cabeca_deteccao(caminho_onnx):
+    """Nós do último módulo (cabeça Detect): ficam em FP32 para preservar as caixas."""
+    import onnx
+
+    nos = onnx.load(caminho_onnx).graph.node
+    indices = [int(m.group(1)) for n in nos for m in [re.match(r"/model\.(\d+)/", n.name)] if m]
+    if not indices:
+        return []
+    prefixo = f"/model.{max(indices)}/"
+    return [n.name for n in nos if n.name.startswith(prefixo)]
+
+
+def quantizar_int8(caminho_onnx, caminho_int8, pasta_calibracao, n_imagens, tamanho, quantizar_cabeca=False):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnxruntime as ort
+
+    arquivos = sorted(glob.glob(os.path.join(pasta_calibracao, "*.jpg")) +
+                      glob.glob(os.path.join(pasta_calibracao, "*.png")))
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhuma imagem de calibração em {pasta_calibracao}")
+    random.Random(0).shuffle(arquivos)
+    arquivos = arquivos[:n_imagens]
+    print(f"🎯 Calibrando INT8 com {len(arquivos)} imagens de {pasta_calibracao}")
+
+    preprocessado = caminho_int8 + ".prep.onnx"
+    quant_pre_process(caminho_onnx, preprocessado, skip_symbolic_shape=True)
+
+    nome_entrada = ort.InferenceSession(preprocessado, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    excluidos = [] if quantizar_cabeca else _nos_cabeca_deteccao(preprocessado)
+
+    try:
+        quantize_static(
+            preprocessado, caminho_int8,
+            calibration_data_reader=LeitorCalibracao(arquivos, nome_entrada, tamanho),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=excluidos,
+        )
+    finally:
+        os.remove(preprocessado)
+    print(f"✅ INT8 salvo em {caminho_int8} ({len(excluidos)} nós da cabeça mantidos em FP32)")
+    return caminho_int8
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default=os.path.join(RAIZ, "models", "solar_v1.pt"))
+    parser.add_argument("--saida", default=None, help="Caminho do .onnx (padrão: ao lado do .pt)")
+    parser.add_argument("--imgsz", type=int, default=YOLO_IMGSZ)
+    parser.add_argument("--int8", action="store_true", help="Gera também a versão quantizada INT8")
+    parser.add_argument("--calibracao", type=int, default=100, help="Nº de imagens de calibração")
+    parser.add_argument("--pasta-calibracao", default=os.path.join(RAIZ, "data", "dataset_solar", "train", "images"))
+    parser.add_argument("--quantizar-cabeca", action="store_true",
+                        help="Quantiza também a cabeça Detect (mais rápido, perde precisão nas caixas)")
+    args = parser.parse_args()
+
+    if not ultralytics_instalado():
+        print("❌ Erro: ultralytics não está instalado.")
+        return
+    if not os.path.exists(args.modelo):
+        print(f"❌ Erro: modelo '{args.modelo}' não encontrado.")
+        return
+
+    caminho_onnx = args.saida or os.path.splitext(args.modelo)[0] + ".onnx"
+    exportar_onnx(args.modelo, caminho_onnx, args.imgsz)
+    print(f"✅ ONNX salvo em {caminho_onnx}")
+
+    if args.int8:
+        caminho_int8 = os.path.splitext(caminho_onnx)[0] + ".int8.onnx"
+        quantizar_int8(caminho_onnx, caminho_int8, args.pasta_calibracao, args.calibracao, args.imgsz,
+                       args.quantizar_cabeca)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Compara os backends de inferência do modelo solar (PyTorch x ONNX FP32 x ONNX INT8):
+- Paridade: mAP50 e mAP50-95 no split valid/, calculados sobre a saída de detectar_lote de cada
+  detector (o mesmo pré e pós-processamento do scan) contra os rótulos de valid/labels.
+- Desempenho: latência (lote 1) e vazão (lote cheio) em CPU.
+
+Uso:
+    python scripts/testing/compare_backends.py [--onnx models/solar_v1.onnx] [--int8 models/solar_v1.int8.onnx]
+Sai com código 1 se a queda de mAP50 do ONNX FP32 ou do INT8 passar da tolerância de cada um.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(RAIZ)
+
+from src.services.detectors import DetectorOnnx, DetectorYolo, ort, ultralytics_instalado  # noqa: E402
+from src.services.detectors import YOLO_CONF, YOLO_IMGSZ, YOLO_LOTE  # noqa: E402
+
+
+# Confiança mínima na validação (como o validador do Ultralytics): a curva PR usa todas as caixas
+CONF_MAP = 0.001
+LIMIARES_IOU = np.linspace(0.5, 0.95, 10)
+
+
+def ler_rotulos(caminho, largura, altura):
+    """Caixas (x1, y1, x2, y2) em pixels de um arquivo de rótulos YOLO (classe cx cy w h normalizados)."""
+    caixas = []
+    if os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                partes = linha.split()
+                if len(partes) >= 5:
+                    cx, cy, w, h = (float(v) for v in partes[1:5])
+                    caixas.append([(cx - w / 2) * largura, (cy - h / 2) * altura,
+                                   (cx + w / 2) * largura, (cy + h / 2) * altura])
+    return np.array(caixas, dtype=float).reshape(-1, 4)
+
+
+def _iou(a, b):
+    """IoU entre cada caixa de a (n, 4) e de b (m, 4), em xyxy."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersecao = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersecao / np.maximum(area_a[:, None] + area_b[None, :] - intersecao, 1e-9)
+
+
+def _casar(previstas, confs, reais):
+    """
+    Verdadeiros positivos (n, limiares) das caixas previstas: em ordem de confiança, cada
+    previsão fica com a caixa real livre de maior IoU acima do limiar (casamento 1:1, como no COCO).
+    """
+    vp = np.zeros((len(previstas), len(LIMIARES_IOU)), dtype=bool)
+    if not len(previstas) or not len(reais):
+        return vp
+    ious = _iou(previstas, reais)
+    for t, limiar in enumerate(LIMIARES_IOU):
+        livres = np.ones(len(reais), dtype=bool)
+        for i in np.argsort(-confs, kind="stable"):
+            candidatos = np.where(livres & (ious[i] >= limiar), ious[i], -1)
+            j = int(candidatos.argmax())
+            if candidatos[j] >= 0:
+                vp[i, t] = True
+                livres[j] = False
+    return vp
+
+
+def _precisao_media(vp, confs, n_reais):
+    """AP por limiar de IoU: área sob a curva PR com interpolação de 101 pontos (COCO)."""
+    if not n_reais or not len(vp):
+        return np.zeros(len(LIMIARES_IOU))
+    ordem = np.argsort(-confs, kind="stable")
+    vp_acum = np.cumsum(vp[ordem], axis=0)
+    fp_acum = np.cumsum(~vp[ordem], axis=0)
+    pontos = np.linspace(0, 1, 101)
+    aps = []
+    for t in range(len(LIMIARES_IOU)):
+        recall = vp_acum[:, t] / n_reais
+        # Envelope: precisão máxima com recall maior ou igual; zero além do recall alcançado
+        precisao = np.maximum.accumulate((vp_acum[:, t] / (vp_acum[:, t] + fp_acum[:, t]))[::-1])[::-1]
+        indices = np.searchsorted(recall, pontos, side="left")
+        aps.append(np.where(indices < len(recall), precisao[np.minimum(indices, len(recall) - 1)], 0.0).mean())
+    return np.array(aps)
+
+
+def avaliar_map(detector, imagens, rotulos, lote):
+    """
+    (mAP50, mAP50-95) das detecções de detector.detectar_lote contra os rótulos.
+    O dataset tem uma classe só (painel), então o casamento ignora a classe.
+    """
+    vps, confs, n_reais = [], [], 0
+    for i in range(0, len(imagens), lote):
+        resultados = detector.detectar_lote(imagens[i:i + lote])
+        for resultado, reais in zip(resultados, rotulos[i:i + lote]):
+            deteccoes = resultado['deteccoes']
+            previstas = np.array([[d['x'], d['y'], d['x'] + d['w'], d['y'] + d['h']] for d in deteccoes],
+                                 dtype=float).reshape(-1, 4)
+            conf = np.array([d.get('conf', 1.0) for d in deteccoes], dtype=float)
+            vps.append(_casar(previstas, conf, reais))
+            confs.append(conf)
+            n_reais += len(reais)
+    aps = _precisao_media(np.concatenate(vps), np.concatenate(confs), n_reais)
+    return float(aps[0]), float(aps.mean())
+
+
+def medir_desempenho(detector, imagens, lote, repeticoes=3):
+    """Latência mediana por imagem (lote 1) e vazão em imagens/s com lotes cheios."""
+    detector.detectar_lote(imagens[:1])  # aquecimento (carrega o modelo)
+
+    latencias = []
+    for _ in range(repeticoes):
+        for img in imagens:
+            inicio = time.perf_counter()
+            detector.detectar_lote([img])
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for i in range(0, len(imagens), lote):
+            detector.detectar_lote(imagens[i:i + lote])
+    vazao = repeticoes * len(imagens) / (time.perf_counter() - inicio)
+    return statistics.median(latencias) * 1000, vazao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default=os.path.join(RAIZ, "models", "solar_v1.pt"))
+    parser.add_argument("--onnx", default=os.path.join(RAIZ, "models", "solar_v1.onnx"))
+    parser.add_argument("--int8", default=os.path.join(RAIZ, "models", "solar_v1.int8.onnx"))
+    parser.add_argument("--dados", default=os.path.join(RAIZ, "data", "dataset_solar", "data.yaml"))
+    parser.add_argument("--lote", type=int, default=YOLO_LOTE)
+    parser.add_argument("--threads", type=int, default=0, help="intra_op_num_threads do ONNX Runtime (0 = padrão)")
+    parser.add_argument("--tolerancia", type=float, default=0.01, help="Queda máxima de mAP50 aceita no FP32")
+    parser.add_argument("--tolerancia-int8", type=float, default=0.03, help="Queda máxima de mAP50 aceita no INT8")
+    parser.add_argument("--relatorio", default=os.path.join(RAIZ, "runs", "comparacao_backends.md"))
+    parser.add_argument("--sem-map", action="store_true", help="Pula a validação de mAP (só desempenho)")
+    args = parser.parse_args()
+
+    if not ultralytics_instalado() or ort is None:
+        print("❌ Erro: precisa de ultralytics e onnxruntime instalados.")
+        return 1
+
+    # Um detector com a confiança do scan (desempenho) e outro com CONF_MAP (mAP) por backend
+    backends = [("PyTorch", args.modelo, lambda conf: DetectorYolo(args.modelo, conf=conf, device="cpu"))]
+    if os.path.exists(args.onnx):
+        backends.append(("ONNX FP32", args.onnx, lambda conf: DetectorOnnx(args.onnx, conf=conf, threads=args.threads)))
+    if os.path.exists(args.int8):
+        backends.append(("ONNX INT8", args.int8, lambda conf: DetectorOnnx(args.int8, conf=conf, threads=args.threads)))
+
+    pasta_valid = os.path.join(os.path.dirname(args.dados), "valid")
+    arquivos = sorted(glob.glob(os.path.join(pasta_valid, "images", "*.jpg")))
+    imagens = [cv2.imread(f) for f in arquivos]
+    rotulos = [ler_rotulos(os.path.join(pasta_valid, "labels", os.path.splitext(os.path.basename(f))[0] + ".txt"),
+                           img.shape[1], img.shape[0]) for f, img in zip(arquivos, imagens)]
+    print(f"📂 {len(imagens)} imagens de validação ({sum(map(len, rotulos))} caixas) em {pasta_valid}")
+
+    linhas = []
+    for nome, caminho, criar_detector in backends:
+        print(f"⏱️  {nome}: {caminho}")
+        detector = criar_detector(YOLO_CONF)
+        map50, map5095 = (None, None) if args.sem_map else avaliar_map(criar_detector(CONF_MAP), imagens, rotulos,
+                                                                       args.lote)
+        latencia, vazao = medir_desempenho(detector, imagens, args.lote)
+        linhas.append({'nome': nome, 'map50': map50, 'map': map5095, 'latencia': latencia, 'vazao': vazao,
+                       'tamanho_mb': os.path.getsize(caminho) / 1e6})
+
+    base = linhas[0]
+    tabela = ["| Backend | mAP50 | mAP50-95 | Latência (ms/img) | Vazão (img/s) | Speedup | Tamanho (MB) |",
+              "|---|---|---|---|---|---|---|"]
+    for l in linhas:
+        m50 = f"{l['map50']:.4f}" if l['map50'] is not None else "-"
+        m = f"{l['map']:.4f}" if l['map'] is not None else "-"
+        tabela.append(f"| {l['nome']} | {m50} | {m} | {l['latencia']:.1f} | {l['vazao']:.1f} | "
+                      f"{l['vazao'] / base['vazao']:.2f}x | {l['tamanho_mb']:.1f} |")
+    relatorio = "\n".join(tabela)
+    print("\n" + relatorio)
+
+    os.makedirs(os.path.dirname(args.relatorio), exist_ok=True)
+    with open(args.relatorio, "w", encoding="utf-8") as f:
+        f.write(f"# Comparação de backends ({len(imagens)} imagens, imgsz={YOLO_IMGSZ}, lote={args.lote})\n\n")
+        f.write(relatorio + "\n")
+    print(f"\n📝 Relatório salvo em {args.relatorio}")
+
+    codigo = 0
+    for nome, tolerancia in (("ONNX FP32", args.tolerancia), ("ONNX INT8", args.tolerancia_int8)):
+        linha = next((l for l in linhas if l['nome'] == nome), None)
+        if linha and linha['map50'] is not None and base['map50'] - linha['map50'] > tolerancia:
+            print(f"❌ Paridade falhou: mAP50 PyTorch {base['map50']:.4f} x {nome} {linha['map50']:.4f} "
+                  f"(tolerância {tolerancia})")
+            codigo = 1
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Servidor Overpass falso para testes locais (sem rede, sem limite de requisições).
+
+Cada servidor responde em /api/interpreter com dados sintéticos conforme a consulta
+(edificações em volta de `around:`, subestações, ruas na caixa) e pode simular
+um espelho ruim: lento, fora do ar (504), com erro de execução ou devolvendo HTML.
+
+Uso:
+    python scripts/testing/overpass_stub.py --servidor 8901:ok --servidor 8902:lento:8
+    PVG_OVERPASS_URLS=http://127.0.0.1:8901/api/interpreter,http://127.0.0.1:8902/api/interpreter streamlit run app.py
+
+    python scripts/testing/overpass_stub.py --verificar
+Sobe um espelho bom, um lento e um fora do ar e confere corrida e castigo do
+ClienteOverpass; sai com código 1 se algo falhar.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(RAIZ)
+
+MODOS = ('ok', 'lento', 'erro', 'remark', 'html')
+M_POR_GRAU = 111320.0
+
+
+def _quadrado(lat, lon, lado_m):
+    d_lat = lado_m / 2 / M_POR_GRAU
+    d_lon = d_lat / np.cos(np.radians(lat))
+    cantos = [(lat - d_lat, lon - d_lon), (lat - d_lat, lon + d_lon), (lat + d_lat, lon + d_lon),
+              (lat + d_lat, lon - d_lon), (lat - d_lat, lon - d_lon)]
+    return [{'lat': round(a, 7), 'lon': round(b, 7)} for a, b in cantos]
+
+
+def resposta_sintetica(query, n_edificacoes=40):
+    """Elementos no formato do Overpass, determinísticos para a mesma consulta."""
+    rng = np.random.default_rng(int(hashlib.sha256(query.encode()).hexdigest()[:8], 16))
+    elementos = []
+    around = re.search(r'around:([\d.]+),(-?[\d.]+),(-?[\d.]+)', query)
+    if '"building"' in query and around:
+        raio, lat, lon = map(float, around.groups())
+        for i in range(n_edificacoes):
+            dist, ang = raio * np.sqrt(rng.uniform()), rng.uniform(0, 2 * np.pi)
+            la = lat + dist * np.sin(ang) / M_POR_GRAU
+            lo = lon + dist * np.cos(ang) / (M_POR_GRAU * np.cos(np.radians(lat)))
+            elementos.append({'type': 'way', 'id': 1_000_000 + i, 'tags': {'building': 'yes'},
+                              'center': {'lat': la, 'lon': lo}, 'geometry': _quadrado(la, lo, rng.uniform(8, 20))})
+    if '"power"="substation"' in query:
+        elementos += [
+            {'type': 'node', 'id': 1, 'lat': -10.9472, 'lon': -37.0731, 'tags': {'name': 'SE Stub Jardins'}},
+            {'type': 'way', 'id': 2, 'center': {'lat': -10.9167, 'lon': -37.05}, 'tags': {'name': 'SE Stub Centro'}},
+        ]
+    caixa = re.search(r'"highway"[^(]*\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)', query)
+    if caixa:
+        lat_min, lon_min, lat_max, lon_max = map(float, caixa.groups())
+        for i, la in enumerate(np.linspace(lat_min, lat_max, 5)):
+            elementos.append({'type': 'way', 'id': 5_000_000 + i, 'tags': {'highway': 'residential'},
+                              'geometry': [{'lat': la, 'lon': lon_min}, {'lat': la, 'lon': lon_max}]})
+    return {'version': 0.6, 'generator': 'overpass-stub', 'elements': elementos}
+
+
+def _handler(modo, atraso):
+    class _Handler(BaseHTTPRequestHandler):
+        def _responder(self, query):
+            self.server.requisicoes += 1
+            if atraso:
+                time.sleep(atraso)
+            if modo == 'erro':
+                self.send_error(504, "Gateway Timeout")
+                return
+            if modo == 'html':
+                corpo, tipo = b"<html><body>rate_limited</body></html>", "text/html"
+            elif modo == 'remark':
+                corpo = json.dumps({'elements': [], 'remark': 'runtime error: Query timed out'}).encode()
+                tipo = "application/json"
+            else:
+                corpo, tipo = json.dumps(resposta_sintetica(query)).encode(), "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            try:
+                self.wfile.write(corpo)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # o cliente desistiu: outro espelho venceu a corrida
+
+        def do_GET(self):
+            self._responder(parse_qs(urlparse(self.path).query).get('data', [''])[0])
+
+        def do_POST(self):
+            corpo = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+            self._responder(parse_qs(corpo).get('data', [''])[0])
+
+        def log_message(self, *args):
+            pass
+
+    return _Handler
+
+
+def iniciar_stub(porta=0, modo='ok', atraso=0.0):
+    """Sobe o servidor numa thread e devolve (servidor, url)."""
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), _handler(modo, atraso))
+    servidor.daemon_threads = True
+    servidor.requisicoes = 0
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/api/interpreter"
+
+
+def verificar():
+    from src.services.overpass_client import ClienteOverpass, ErroOverpass
+
+    _, bom = iniciar_stub(modo='ok', atraso=0.2)
+    _, lento = iniciar_stub(modo='lento', atraso=5)
+    fora, fora_url = iniciar_stub(modo='erro')
+    query = '[out:json]; way["building"](around:300,-10.93,-37.06); out geom;'
+    falhas = []
+
+    cliente = ClienteOverpass([lento, fora_url, bom], tentativas=2)
+    inicio = time.perf_counter()
+    dados = cliente.consultar(query)
+    corrida = time.perf_counter() - inicio
+    print(f"corrida: {len(dados['elements'])} elementos em {corrida:.2f} s")
+    if corrida > 2 or len(dados['elements']) != 40:
+        falhas.append("a corrida não ficou com o espelho bom")
+
+    antes = fora.requisicoes
+    cliente.consultar(query)
+    if fora.requisicoes != antes:
+        falhas.append("espelho fora do ar não ficou de castigo")
+
+    _, ruim = iniciar_stub(modo='remark')
+    _, html = iniciar_stub(modo='html')
+    try:
+        ClienteOverpass([ruim, html], tentativas=2).consultar(query)
+        falhas.append("erro de execução do Overpass passou como resposta válida")
+    except ErroOverpass as e:
+        print(f"espelhos ruins: {e}")
+
+    for falha in falhas:
+        print(f"❌ {falha}")
+    if not falhas:
+        print("✅ Cliente Overpass OK")
+    return 1 if falhas else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servidor", action="append", default=[], metavar="PORTA:MODO[:ATRASO]",
+                        help=f"Modos: {', '.join(MODOS)} (pode repetir)")
+    parser.add_argument("--verificar", action="store_true", help="Roda a verificação do ClienteOverpass e sai")
+    args = parser.parse_args()
+    if args.verificar:
+        return verificar()
+
+    urls = []
+    for spec in args.servidor or ["8901:ok"]:
+        porta, modo, *resto = spec.split(":")
+        if modo not in MODOS:
+            parser.error(f"modo inválido: {modo}")
+        urls.append(iniciar_stub(int(porta), modo, float(resto[0]) if resto else 0.0)[1])
+    print(f"PVG_OVERPASS_URLS={','.join(urls)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,27 @@
 import os
-from ultralytics import YOLO
+import sys
+import time
+
+import cv2
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(RAIZ)
+
+from src.services.detectors import DetectorYolo, YOLO_LOTE, ultralytics_instalado  # noqa: E402
 
 
 def main():
     # --- CONFIGURAÇÕES ---
-    caminho_modelo = r"C:\Users\Miguel Lucas\PycharmProjects\radix\models\solar_v1.pt"
+    caminho_modelo = os.getenv("PVG_MODELO_YOLO", os.path.join(RAIZ, "models", "solar_v1.pt"))
+
+    pasta_imagens = os.getenv("PVG_PASTA_TESTE", os.path.join(RAIZ, "data", "dataset_solar", "valid", "images"))
 
-    pasta_imagens = r"C:\Users\Miguel Lucas\PycharmProjects\radix\dataset_solar\valid\images"
+    if not ultralytics_instalado():
+        print("❌ Erro: ultralytics não está instalado.")
+        return
 
     print("🧠 Carregando o cérebro da IA...")
-    model = YOLO(caminho_modelo)
+    detector = DetectorYolo(caminho_modelo)
 
     if not os.path.exists(pasta_imagens):
         print(f"❌ Erro: A pasta '{pasta_imagens}' não existe.")
@@ -17,34 +29,29 @@ def main():
 
     arquivos = os.listdir(pasta_imagens)
 
-    imagens = [f for f in arquivos if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    imagens = sorted(f for f in arquivos if f.lower().endswith(('.png', '.jpg', '.jpeg')))
 
     print(f"📂 Encontrei {len(imagens)} imagens para analisar. Começando agora!\n")
 
-    for i, imagem_nome in enumerate(imagens):
-        caminho_completo = os.path.join(pasta_imagens, imagem_nome)
-
-        results = model.predict(source=caminho_completo, save=True, device='cpu', conf=0.25, verbose=False)
-
-        resultado = results[0]
-        qtd_paineis = len(resultado.boxes)
-
-        # --- RELATÓRIO INDIVIDUAL ---
-        print(f"[{i + 1}/{len(imagens)}] Arquivo: {imagem_nome}")
-        print(f"   ☀️  Painéis: {qtd_paineis}")
+    inicio = time.perf_counter()
+    for lote_inicio in range(0, len(imagens), YOLO_LOTE):
+        nomes = imagens[lote_inicio:lote_inicio + YOLO_LOTE]
+        lote = [cv2.imread(os.path.join(pasta_imagens, n)) for n in nomes]
 
-        if qtd_paineis > 20:
-            print("   🏭 Tipo: INDÚSTRIA / COMÉRCIO")
-        elif qtd_paineis > 0:
-            print("   🏠 Tipo: RESIDENCIAL")
-        else:
-            print("   ❌ Nada detectado")
+        resultados = detector.detectar_lote(lote)
 
-        print("-" * 30)
+        for i, (imagem_nome, resultado) in enumerate(zip(nomes, resultados), start=lote_inicio):
+            # --- RELATÓRIO INDIVIDUAL ---
+            print(f"[{i + 1}/{len(imagens)}] Arquivo: {imagem_nome}")
+            print(f"   ☀️  Caixas: {len(resultado['deteccoes'])} | Painéis estimados: {resultado['paineis_estimados']:.1f}")
+            print(f"   {resultado['classe']}")
+            print("-" * 30)
 
+    decorrido = time.perf_counter() - inicio
     print("\n✅ FIM DA ANÁLISE!")
-    print("As imagens com os quadrados desenhados estão na pasta 'runs/detect/predict'.")
+    print(f"⏱️  {len(imagens)} imagens em {decorrido:.1f}s "
+          f"({len(imagens) / decorrido:.1f} imagens/s total, {detector.imagens_por_segundo():.1f} imagens/s na inferência)")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,284 @@
+"""
+API HTTP da plataforma (Starlette/uvicorn), para outros sistemas e vários usuários.
+
+Todos os clientes compartilham o mesmo processo: executor de jobs, motor de análise,
+caches de tiles/Overpass e o SQLite dos jobs. Um scan igual a outro já em andamento
+devolve o job existente.
+
+    python -m src.api --porta 8000
+    curl -X POST localhost:8000/scans -d '{"cidade": "Aracaju", "subestacao": "Jardins"}'
+    curl -N localhost:8000/scans/<job_id>/resultados?seguir=1
+
+Rotas:
+    GET    /saude
+    GET    /subestacoes?cidade=Aracaju
+    POST   /scans                       {"subestacao", "latitude", "longitude"} ou {"cidade", "subestacao"};
+                                        opcionais: "modo" (edificacoes|hex|grid), "raio_km", "detector"
+    GET    /scans                       ?incompletos=1
+    GET    /scans/{job_id}
+    DELETE /scans/{job_id}              cancela (o job fica retomável)
+    GET    /scans/{job_id}/resultados   NDJSON, ou SSE com ?formato=sse; ?seguir=1 acompanha até o fim,
+                                        ?apenas_gd=1, ?por_edificacao=1
+    GET    /scans/{job_id}/resumo       por subestação; ?aneel=1 (&uf=SE) cruza com o espelho local da ANEEL
+    GET    /cache                       hits/misses dos caches dos serviços e dos tiles; ?disco=1 soma a ocupação
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from src.services.aneel_mirror import obter_espelho_aneel  # noqa: E402
+from src.services.cross_reference import cruzar_deteccoes, deteccoes_do_job, relatorio_por_subestacao  # noqa: E402
+from src.services.job_runner import FASES_ATIVAS, MODOS, obter_executor_jobs  # noqa: E402
+from src.services.job_store import STATUS_EXECUTANDO, STATUS_PENDENTE, obter_job_store  # noqa: E402
+from src.services.osm_service import buscar_subestacoes_osm  # noqa: E402
+from src.services.result_writer import linhas_por_edificacao  # noqa: E402
+from src.services.service_cache import estatisticas_cache  # noqa: E402
+from src.services.tile_cache import obter_tile_cache  # noqa: E402
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+API_HOST = os.getenv("PVG_API_HOST", "127.0.0.1")
+API_PORTA = int(os.getenv("PVG_API_PORTA", "8000"))
+# Com token definido, toda rota (menos /saude) exige "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("PVG_API_TOKEN")
+LINHAS_POR_LOTE = 500
+INTERVALO_SEGUIR_S = 1.0
+
+
+def _erro(status, mensagem):
+    return JSONResponse({'erro': mensagem}, status_code=status)
+
+
+def _autorizado(request):
+    return not API_TOKEN or request.headers.get('authorization') == f"Bearer {API_TOKEN}"
+
+
+def _rota(funcao):
+    """Autenticação e erros comuns; o corpo síncrono da rota roda no threadpool (SQLite, Overpass...)."""
+    async def _handler(request):
+        if not _autorizado(request):
+            return _erro(401, "token inválido")
+        try:
+            return await funcao(request)
+        except (ValueError, KeyError) as e:
+            return _erro(400, str(e))
+    return _handler
+
+
+def _flag(request, nome):
+    return request.query_params.get(nome, '').lower() in ('1', 'true', 'sim')
+
+
+def _job_publico(job):
+    """Job com progresso e fase da execução (se rodou neste processo)."""
+    store = obter_job_store()
+    estado = obter_executor_jobs().estado(job['id'])
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'fase': estado['fase'] if estado else None,
+        'erro': estado['erro'] if estado else None,
+        'criado_em': job['criado_em'],
+        'atualizado_em': job['atualizado_em'],
+        'parametros': {k: v for k, v in job['parametros'].items() if k != 'hsv_config'},
+        'progresso': store.progresso(job['id']),
+    }
+
+
+async def saude(request):
+    return JSONResponse({'ok': True, 'jobs_ativos': len(obter_executor_jobs().ativos())})
+
+
+@_rota
+async def subestacoes(request):
+    df = await run_in_threadpool(buscar_subestacoes_osm, request.query_params.get('cidade', 'Aracaju'))
+    return JSONResponse(json.loads(df.to_json(orient='records', force_ascii=False)))
+
+
+def _resolver_subestacao(dados):
+    """(nome, lat, lon) a partir de coordenadas ou de cidade + nome (busca parcial, como na CLI)."""
+    nome = dados.get('subestacao')
+    if dados.get('latitude') is not None and dados.get('longitude') is not None:
+        return nome or f"{float(dados['latitude']):.5f},{float(dados['longitude']):.5f}", \
+            float(dados['latitude']), float(dados['longitude'])
+    if not dados.get('cidade') or not nome:
+        raise ValueError("informe latitude/longitude ou cidade + subestacao")
+    df = buscar_subestacoes_osm(dados['cidade'])
+    achadas = df[df['Nome'].str.contains(nome, case=False, regex=False)] if not df.empty else df
+    if achadas.empty:
+        raise KeyError(f"subestação não encontrada em {dados['cidade']}: {nome}")
+    alvo = achadas.iloc[0]
+    return alvo['Nome'], float(alvo['latitude']), float(alvo['longitude'])
+
+
+@_rota
+async def criar_scan(request):
+    try:
+        dados = await request.json()
+    except json.JSONDecodeError:
+        return _erro(400, "corpo JSON inválido")
+    modo = dados.get('modo', 'edificacoes')
+    if modo not in MODOS:
+        return _erro(400, f"modo inválido: {modo} (use {', '.join(MODOS)})")
+    nome, lat, lon = await run_in_threadpool(_resolver_subestacao, dados)
+    job_id = obter_executor_jobs().submeter_scan(nome, lat, lon, MODOS[modo], detector=dados.get('detector'),
+                                                 raio_km=float(dados.get('raio_km', 0.3)), origem='api')
+    return JSONResponse({
+        'job_id': job_id,
+        'status': f"/scans/{job_id}",
+        'resultados': f"/scans/{job_id}/resultados",
+        'resumo': f"/scans/{job_id}/resumo",
+    }, status_code=202)
+
+
+@_rota
+async def listar_scans(request):
+    jobs = await run_in_threadpool(obter_job_store().listar_jobs, _flag(request, 'incompletos'))
+    return JSONResponse([await run_in_threadpool(_job_publico, j) for j in jobs[:200]])
+
+
+@_rota
+async def status_scan(request):
+    job = await run_in_threadpool(obter_job_store().obter_job, request.path_params['job_id'])
+    if job is None:
+        return _erro(404, "job não encontrado")
+    return JSONResponse(await run_in_threadpool(_job_publico, job))
+
+
+@_rota
+async def cancelar_scan(request):
+    job_id = request.path_params['job_id']
+    if obter_job_store().obter_job(job_id) is None:
+        return _erro(404, "job não encontrado")
+    obter_executor_jobs().cancelar(job_id)
+    return JSONResponse({'job_id': job_id, 'cancelamento': 'solicitado'}, status_code=202)
+
+
+def _em_andamento(job_id):
+    estado = obter_executor_jobs().estado(job_id)
+    if estado is not None:
+        return estado['fase'] in FASES_ATIVAS
+    job = obter_job_store().obter_job(job_id)
+    # Rodando em outro processo (dashboard, CLI): segue enquanto o status não for final
+    return bool(job) and job['status'] in (STATUS_PENDENTE, STATUS_EXECUTANDO)
+
+
+async def _linhas_resultado(job_id, apenas_gd, por_edificacao, seguir):
+    """Gera lotes de linhas conforme são gravados; com seguir, até o job terminar."""
+    store = obter_job_store()
+    cursor = (0.0, -1)
+    while True:
+        # Checa antes de ler: o que for gravado até o job terminar ainda sai no último lote
+        ativo = seguir and await run_in_threadpool(_em_andamento, job_id)
+        linhas, cursor = await run_in_threadpool(store.resultados_desde, job_id, cursor, LINHAS_POR_LOTE,
+                                                 apenas_gd)
+        lote_cheio = len(linhas) == LINHAS_POR_LOTE
+        if por_edificacao:
+            linhas = [e for linha in linhas for e in linhas_por_edificacao(linha)
+                      if not apenas_gd or e.get('tem_gd')]
+        if linhas:
+            yield linhas
+        if lote_cheio:
+            continue
+        if not ativo:
+            return
+        await asyncio.sleep(INTERVALO_SEGUIR_S)
+
+
+@_rota
+async def resultados_scan(request):
+    job_id = request.path_params['job_id']
+    if await run_in_threadpool(obter_job_store().obter_job, job_id) is None:
+        return _erro(404, "job não encontrado")
+    lotes = _linhas_resultado(job_id, _flag(request, 'apenas_gd'), _flag(request, 'por_edificacao'),
+                              _flag(request, 'seguir'))
+
+    if request.query_params.get('formato') == 'sse':
+        async def _sse():
+            async for linhas in lotes:
+                for linha in linhas:
+                    yield f"event: resultado\ndata: {json.dumps(linha, ensure_ascii=False, default=str)}\n\n"
+            yield "event: fim\ndata: {}\n\n"
+        return StreamingResponse(_sse(), media_type="text/event-stream",
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    async def _ndjson():
+        async for linhas in lotes:
+            yield ''.join(json.dumps(linha, ensure_ascii=False, default=str) + '\n' for linha in linhas)
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+def _resumo(job_id, espelho=None):
+    store = obter_job_store()
+    resumo = {'job_id': job_id, 'total': store.resumo(job_id), 'subestacoes': store.resumo_por_subestacao(job_id)}
+    if espelho is not None:
+        relatorio = relatorio_por_subestacao(cruzar_deteccoes(deteccoes_do_job(job_id), espelho.df))
+        resumo['aneel'] = json.loads(relatorio.to_json(orient='records', force_ascii=False))
+    return resumo
+
+
+@_rota
+async def resumo_scan(request):
+    job_id = request.path_params['job_id']
+    if await run_in_threadpool(obter_job_store().obter_job, job_id) is None:
+        return _erro(404, "job não encontrado")
+    espelho = None
+    if _flag(request, 'aneel'):
+        uf = request.query_params.get('uf')
+        espelho = await run_in_threadpool(obter_espelho_aneel, uf)
+        if espelho is None:
+            # Sem o espelho completo o cruzamento marcaria quase tudo como "sem registro"
+            return _erro(409, f"espelho local da ANEEL ausente: rode `python -m src.cli sync-aneel"
+                              f"{' --uf ' + uf if uf else ''}`")
+    return JSONResponse(await run_in_threadpool(_resumo, job_id, espelho))
+
+
+@_rota
+async def cache(request):
+    return JSONResponse({'servicos': await run_in_threadpool(estatisticas_cache, _flag(request, 'disco')),
+                         'tiles': await run_in_threadpool(obter_tile_cache().estatisticas)})
+
+
+app = Starlette(routes=[
+    Route("/saude", saude),
+    Route("/subestacoes", subestacoes),
+    Route("/scans", criar_scan, methods=["POST"]),
+    Route("/scans", listar_scans, methods=["GET"]),
+    Route("/scans/{job_id}", status_scan, methods=["GET"]),
+    Route("/scans/{job_id}", cancelar_scan, methods=["DELETE"]),
+    Route("/scans/{job_id}/resultados", resultados_scan),
+    Route("/scans/{job_id}/resumo", resumo_scan),
+    Route("/cache", cache),
+])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.api", description="API HTTP da Plataforma de Varredura")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--porta", type=int, default=API_PORTA)
+    args = parser.parse_args(argv)
+    if uvicorn is None:
+        print("❌ uvicorn não instalado: pip install uvicorn")
+        return 1
+    # Um único processo: executor, motor e caches em memória são compartilhados por todos os clientes
+    uvicorn.run(app, host=args.host, port=args.porta, workers=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
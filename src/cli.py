@@ -0,0 +1,371 @@
+"""
+Linha de comando da plataforma (sem Streamlit).
+
+Exemplos:
+    python -m src.cli scan --cidade Aracaju --saida resultados/aracaju
+    python -m src.cli scan --cidade Aracaju --subestacao "Jardins" --formato parquet
+    python -m src.cli scan --arquivo-subestacoes subs.csv --modo hex --raio-km 0.5
+    python -m src.cli jobs --incompletos
+    python -m src.cli scan --retomar 3f2a9c1d7b40
+    python -m src.cli ingerir-osm sergipe-latest.osm.pbf
+    python -m src.cli sync-aneel --uf SE
+    python -m src.cli cruzar 3f2a9c1d7b40 --uf SE
+    python -m src.cli servir-tiles --porta 8787
+    python -m src.cli cache --limpar edificacoes
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from tqdm import tqdm  # noqa: E402
+
+from src.services.aneel_mirror import SincronizadorAneel, obter_espelho_aneel  # noqa: E402
+from src.services.analysis_engine import obter_motor  # noqa: E402
+from src.services.building_service import buscar_edificacoes_raio  # noqa: E402
+from src.services.cross_reference import (NAO_REGISTRADO, RAIO_CRUZAMENTO_M, cruzar_deteccoes,  # noqa: E402
+                                          deteccoes_do_job, relatorio_por_subestacao)
+from src.services.evidence_store import ArmazemEvidencias  # noqa: E402
+from src.services.job_runner import MODOS  # noqa: E402
+from src.services.job_store import STATUS_CONCLUIDO, STATUS_ERRO, obter_job_store  # noqa: E402
+from src.services.osm_service import buscar_subestacoes_osm  # noqa: E402
+from src.services.osm_store import OSM_DIR, ingerir_extrato  # noqa: E402
+from src.services.result_writer import EscritorResultados, linha_resultado, linhas_por_edificacao  # noqa: E402
+from src.services.scan_service import criar_job_scan, iterar_job  # noqa: E402
+from src.services.service_cache import estatisticas_cache, limpar_cache  # noqa: E402
+from src.services.tile_cache import obter_tile_cache  # noqa: E402
+from src.services.tile_server import TILES_HOST, TILES_PORTA, criar_servidor  # noqa: E402
+from src.utils.processing import prepare_scan_data  # noqa: E402
+from src.utils.spatial_index import IndiceEspacial  # noqa: E402
+
+# Parâmetros guardados no manifesto do job e reaplicados na retomada
+PARAMETROS_JOB = ('cidade', 'modo', 'raio_km', 'detector', 'saida', 'formato', 'evidencias', 'limite',
+                  'filtrar_ruas')
+
+
+def carregar_subestacoes(args):
+    """Subestações da cidade (OSM) ou de um CSV com Nome, latitude, longitude."""
+    if args.arquivo_subestacoes:
+        df = pd.read_csv(args.arquivo_subestacoes)
+    else:
+        df = buscar_subestacoes_osm(args.cidade)
+
+    if args.subestacao:
+        filtro = '|'.join(re.escape(n) for n in args.subestacao)
+        df = df[df['Nome'].str.contains(filtro, case=False, na=False)]
+    return df.reset_index(drop=True)
+
+
+def gerar_pontos(sub, modo, raio_km, agrupar_tiles=True, indice_subestacoes=None, posicao=None,
+                 filtrar_ruas=False):
+    """
+    Mesmo fluxo do botão INICIAR SCAN: edificações OSM (agrupadas por imagem) ou grid.
+    Com indice_subestacoes, só ficam as edificações cuja subestação mais próxima
+    (área de atendimento) é esta: raios sobrepostos não varrem a mesma casa duas vezes.
+    """
+    lat, lon = float(sub['latitude']), float(sub['longitude'])
+    casas_df = None
+    if modo == 'edificacoes':
+        casas_df = buscar_edificacoes_raio(lat, lon, radius_km=raio_km)
+        if indice_subestacoes is not None and len(indice_subestacoes) > 1 and not casas_df.empty:
+            dono, _ = indice_subestacoes.mais_proximo(casas_df['centro_lat'], casas_df['centro_lon'])
+            casas_df = casas_df[dono == posicao]
+    return prepare_scan_data(lat, lon, buildings=casas_df, radius_km=raio_km,
+                             use_buildings=(modo == 'edificacoes'), hexagonal=(modo == 'hex'),
+                             agrupar_tiles=agrupar_tiles, filtrar_ruas=filtrar_ruas)
+
+
+def _criar_job(args):
+    subestacoes = carregar_subestacoes(args)
+    if subestacoes.empty:
+        print("❌ Nenhuma subestação encontrada.")
+        return None
+
+    indice = IndiceEspacial(subestacoes['latitude'], subestacoes['longitude'])
+
+    def _pontos():
+        for posicao, sub in subestacoes.iterrows():
+            pontos = gerar_pontos(sub, args.modo, args.raio_km, not args.tile_por_edificacao, indice, posicao,
+                                  args.filtrar_ruas)
+            if args.limite:
+                pontos = pontos[:args.limite]
+            if not pontos:
+                print(f"⚠️ {sub['Nome']}: nenhum ponto gerado.")
+            yield sub['Nome'], pontos
+
+    parametros = {k: getattr(args, k) for k in PARAMETROS_JOB}
+    job_id = criar_job_scan(_pontos(), parametros)
+    print(f"⚡ Job {job_id}: {len(subestacoes)} subestação(ões)")
+    return job_id
+
+
+def arquivo_resultados(saida, job_id, formato):
+    """Um arquivo por job: jobs com a mesma --saida não se misturam nem se sobrescrevem."""
+    extensao = 'parquet' if formato == 'parquet' else 'jsonl'
+    return os.path.join(saida, f"resultados_{job_id}.{extensao}")
+
+
+def reconstruir_resultados(store, job_id, escritor):
+    """
+    Na retomada o arquivo é regravado a partir do SQLite, que é quem decide o que está concluído:
+    se o processo caiu com linhas ainda no buffer do escritor (ou já gravadas mas antes do checkpoint),
+    o arquivo antigo teria linhas a menos (ou repetidas).
+    """
+    cursor = (0.0, -1)
+    while True:
+        linhas, cursor = store.resultados_desde(job_id, cursor)
+        if not linhas:
+            return
+        for linha in linhas:
+            for linha_edificacao in linhas_por_edificacao(linha):
+                escritor.escrever(linha_edificacao)
+
+
+def comando_scan(args):
+    store = obter_job_store()
+    if args.retomar:
+        job = store.obter_job(args.retomar)
+        if job is None:
+            print(f"❌ Job {args.retomar} não encontrado.")
+            return 1
+        # Retomada usa os mesmos parâmetros de saída do job original
+        for chave, valor in job['parametros'].items():
+            setattr(args, chave, valor)
+        job_id = job['id']
+    else:
+        job_id = _criar_job(args)
+        if job_id is None:
+            return 1
+
+    progresso = store.progresso(job_id)
+    pendentes = progresso['total'] - progresso[STATUS_CONCLUIDO]
+    if not pendentes:
+        print(f"✅ Job {job_id} já está concluído.")
+        return 0
+
+    caminho_resultados = arquivo_resultados(args.saida, job_id, args.formato)
+    armazem = ArmazemEvidencias(os.path.join(args.saida, "evidencias"))
+    motor = obter_motor()
+
+    print(f"   {pendentes}/{progresso['total']} pontos pendentes -> {caminho_resultados}")
+    positivos, processados = Counter(), Counter()
+    # O arquivo é só deste job: na retomada ele é regravado inteiro a partir do SQLite
+    with EscritorResultados(caminho_resultados, args.formato, sobrescrever=True) as escritor:
+        if args.retomar:
+            reconstruir_resultados(store, job_id, escritor)
+        barra = tqdm(total=pendentes, unit="img")
+        for ponto, resultado in iterar_job(job_id, detector=args.detector, evidencias=args.evidencias,
+                                           armazem=armazem):
+            if barra.n + 1 >= barra.total:
+                # Células refinadas do grid hexagonal entram no job durante a varredura
+                barra.total = store.obter_job(job_id)['total'] - progresso[STATUS_CONCLUIDO]
+            barra.update(1)
+            if resultado.get('refinado'):
+                continue  # célula grossa subdividida: as filhas entram no arquivo no lugar dela
+            subestacao = ponto['subestacao']
+            linha = linha_resultado(resultado, ponto, subestacao, resultado.get('evidencia'),
+                                    resultado.get('miniatura'))
+            # Uma linha por edificação, mesmo quando várias saíram da mesma imagem
+            for linha_edificacao in linhas_por_edificacao(linha):
+                escritor.escrever(linha_edificacao)
+            positivos[subestacao] += linha['edificacoes_gd']
+            processados[subestacao] += linha['n_edificacoes']
+        barra.close()
+
+    for subestacao, n in processados.items():
+        print(f"   ✅ {subestacao}: {positivos[subestacao]}/{n} com GD")
+
+    progresso = store.progresso(job_id)
+    print(f"\n✅ {escritor.total} pontos gravados em {caminho_resultados} ({motor.ultimo_throughput:.1f} imagens/s)")
+    for servico, estatisticas in estatisticas_cache().items():
+        if estatisticas['hits_memoria'] + estatisticas['hits_disco'] + estatisticas['misses']:
+            print(f"   cache {servico}: {estatisticas['hits_memoria']} hit(s) em memória, "
+                  f"{estatisticas['hits_disco']} em disco, {estatisticas['misses']} miss(es)")
+    if progresso[STATUS_ERRO]:
+        print(f"⚠️ {progresso[STATUS_ERRO]} ponto(s) com erro: rode "
+              f"`python -m src.cli scan --retomar {job_id}` para tentar de novo.")
+    return 0
+
+
+def _arquivo_do_job(job):
+    parametros = job['parametros']
+    if not parametros.get('saida'):
+        return ''
+    return arquivo_resultados(parametros['saida'], job['id'], parametros.get('formato'))
+
+
+def comando_jobs(args):
+    store = obter_job_store()
+    jobs = store.listar_jobs(apenas_incompletos=args.incompletos)
+    if not jobs:
+        print("Nenhum job registrado.")
+        return 0
+    for job in jobs:
+        progresso = store.progresso(job['id'])
+        criado = time.strftime('%Y-%m-%d %H:%M', time.localtime(job['criado_em']))
+        print(f"{job['id']}  {criado}  {job['status']:<12} {progresso[STATUS_CONCLUIDO]}/{job['total']} concluídos"
+              f"  {progresso[STATUS_ERRO]} erro(s)  -> {_arquivo_do_job(job)}")
+    return 0
+
+
+def comando_ingerir_osm(args):
+    print(f"📥 Ingerindo {args.arquivo} -> {args.destino} ...")
+    try:
+        manifesto = ingerir_extrato(args.arquivo, args.destino)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"❌ Falha na ingestão: {e}")
+        return 1
+    print(f"✅ {manifesto['edificacoes']} edificações, {manifesto['subestacoes']} subestações, "
+          f"{manifesto['ruas']} ruas, {manifesto['municipios']} municípios em {manifesto['segundos']} s")
+    if os.path.abspath(args.destino) != os.path.abspath(OSM_DIR):
+        print(f"   Use PVG_OSM_DIR={args.destino} para que os serviços consultem esta base.")
+    return 0
+
+
+def comando_sync_aneel(args):
+    sincronizador = SincronizadorAneel()
+    print(f"🔄 Sincronizando usinas solares da ANEEL ({args.uf or 'Brasil'}) -> {sincronizador.diretorio} ...")
+    barra = tqdm(unit="linhas")
+    try:
+        meta = sincronizador.sincronizar(args.uf, completo=args.completo, ao_progredir=barra.update)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ Falha na sincronização: {e}")
+        return 1
+    finally:
+        barra.close()
+    print(f"✅ {meta['total']} usinas no espelho ({meta['baixadas']} baixadas nesta sincronização)")
+    return 0
+
+
+def comando_cruzar(args):
+    if obter_job_store().obter_job(args.job_id) is None:
+        print(f"❌ Job {args.job_id} não encontrado (veja `python -m src.cli jobs`).")
+        return 1
+    # Só o espelho local tem todas as usinas da região: a API online limita a consulta e daria falsos "sem registro"
+    espelho = obter_espelho_aneel(args.uf)
+    if espelho is None:
+        print(f"❌ Espelho local da ANEEL ausente: rode `python -m src.cli sync-aneel"
+              f"{' --uf ' + args.uf if args.uf else ''}` antes de cruzar.")
+        return 1
+    usinas = espelho.consultar(uf=args.uf)
+    if usinas.empty:
+        print(f"❌ O espelho da ANEEL não tem usinas{' em ' + args.uf if args.uf else ''}.")
+        return 1
+    deteccoes = deteccoes_do_job(args.job_id)
+    inicio = time.perf_counter()
+    cruzado = cruzar_deteccoes(deteccoes, usinas, args.raio_m)
+    relatorio = relatorio_por_subestacao(cruzado)
+    print(f"🔎 {len(deteccoes)} detecções x {len(usinas)} usinas em {time.perf_counter() - inicio:.2f} s "
+          f"(raio {args.raio_m:g} m)")
+
+    os.makedirs(args.saida, exist_ok=True)
+    cruzado.to_csv(os.path.join(args.saida, f"cruzamento_{args.job_id}.csv"), index=False)
+    relatorio.to_csv(os.path.join(args.saida, f"cruzamento_{args.job_id}_subestacoes.csv"), index=False)
+    for _, linha in relatorio.iterrows():
+        print(f"   {linha['subestacao']}: {linha[NAO_REGISTRADO]}/{linha['deteccoes']} sem registro "
+              f"({linha['taxa_nao_registrado']:.0%}), ~{linha['potencia_oculta_kw']:.0f} kW ocultos")
+    print(f"✅ Cruzamento gravado em {args.saida}")
+    return 0
+
+
+def comando_servir_tiles(args):
+    try:
+        servidor = criar_servidor(args.host, args.porta)
+    except OSError as e:
+        print(f"❌ Não foi possível abrir {args.host}:{args.porta}: {e}")
+        return 1
+    print(f"🗺️ Tiles em http://{args.host}:{args.porta}/tiles/<job_id>/<kw|contagem>/<z>/<x>/<y>.png "
+          f"(Ctrl+C encerra)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+def comando_cache(args):
+    if args.limpar:
+        limpar_cache(None if args.limpar == 'todos' else args.limpar)
+        print(f"🧹 Cache dos serviços esvaziado ({args.limpar}).")
+        return 0
+    print("Serviço          TTL (s)  Entradas  Tamanho (MB)")
+    for servico, estatisticas in estatisticas_cache(disco=True).items():
+        print(f"{servico:<16} {estatisticas['ttl_s']:>7.0f}  {estatisticas['entradas_disco']:>8}  "
+              f"{estatisticas['tamanho_mb']:>12.2f}")
+    tiles = obter_tile_cache().estatisticas()
+    print(f"{'tiles satélite':<16} {'':>7}  {tiles['entradas']:>8}  {tiles['tamanho_mb']:>12.2f}")
+    return 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Plataforma de Varredura Geoespacial")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    scan = sub.add_parser("scan", help="Varre subestações e grava os resultados em disco")
+    scan.add_argument("--cidade", default="Aracaju")
+    scan.add_argument("--subestacao", action="append", help="Filtra pelo nome (pode repetir)")
+    scan.add_argument("--arquivo-subestacoes", help="CSV com Nome, latitude, longitude")
+    scan.add_argument("--modo", choices=list(MODOS), default="edificacoes")
+    scan.add_argument("--raio-km", type=float, default=0.3)
+    scan.add_argument("--tile-por-edificacao", action="store_true",
+                      help="Uma imagem por edificação (sem agrupar edificações que cabem no mesmo tile)")
+    scan.add_argument("--filtrar-ruas", action="store_true",
+                      help="Modo grid: descarta pontos sobre ruas (buffer PVG_BUFFER_RUAS_M)")
+    scan.add_argument("--detector", default=None, help="heuristico, yolo, onnx (padrão: PVG_DETECTOR)")
+    scan.add_argument("--saida", default="resultados")
+    scan.add_argument("--formato", choices=["jsonl", "parquet"], default="jsonl")
+    scan.add_argument("--evidencias", choices=["todas", "positivas", "nenhuma"], default="todas")
+    scan.add_argument("--limite", type=int, default=0, help="Máximo de pontos por subestação (0 = todos)")
+    scan.add_argument("--retomar", metavar="JOB_ID", help="Continua um job interrompido (só os pontos pendentes)")
+    scan.set_defaults(func=comando_scan)
+
+    jobs = sub.add_parser("jobs", help="Lista os jobs de scan registrados")
+    jobs.add_argument("--incompletos", action="store_true", help="Só jobs interrompidos ou em andamento")
+    jobs.set_defaults(func=comando_jobs)
+
+    ingerir = sub.add_parser("ingerir-osm", help="Ingere um extrato OSM (.osm.pbf ou GeoJSON) na base local")
+    ingerir.add_argument("arquivo")
+    ingerir.add_argument("--destino", default=OSM_DIR, help="Pasta da base (padrão: PVG_OSM_DIR)")
+    ingerir.set_defaults(func=comando_ingerir_osm)
+
+    aneel = sub.add_parser("sync-aneel", help="Sincroniza o espelho local das usinas solares da ANEEL (Parquet)")
+    aneel.add_argument("--uf", help="Só uma UF (ex.: SE); sem ela, o Brasil inteiro")
+    aneel.add_argument("--completo", action="store_true", help="Ignora o espelho atual e baixa tudo de novo")
+    aneel.set_defaults(func=comando_sync_aneel)
+
+    cruzar = sub.add_parser("cruzar", help="Cruza as GDs detectadas num job com as usinas registradas na ANEEL")
+    cruzar.add_argument("job_id")
+    cruzar.add_argument("--uf", help="Espelho/consulta de uma UF (ex.: SE)")
+    cruzar.add_argument("--raio-m", type=float, default=RAIO_CRUZAMENTO_M,
+                        help="Tolerância entre detecção e usina (padrão: PVG_RAIO_CRUZAMENTO_M)")
+    cruzar.add_argument("--saida", default="resultados")
+    cruzar.set_defaults(func=comando_cruzar)
+
+    tiles = sub.add_parser("servir-tiles", help="Servidor de tiles (calor/pontos) dos resultados dos jobs")
+    tiles.add_argument("--host", default=TILES_HOST)
+    tiles.add_argument("--porta", type=int, default=TILES_PORTA)
+    tiles.set_defaults(func=comando_servir_tiles)
+
+    cache = sub.add_parser("cache", help="Ocupação do cache em disco dos serviços (OSM, ANEEL) e dos tiles")
+    cache.add_argument("--limpar", metavar="SERVICO", help="Esvazia o cache de um serviço (ou 'todos')")
+    cache.set_defaults(func=comando_cache)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
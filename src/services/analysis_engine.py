@@ -0,0 +1,302 @@
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.services.detectors import obter_detector
+from src.services.satellite_service import ZOOM_PADRAO, desenhar_deteccoes, obter_imagem_bgr
+from src.utils.tile_planner import mascara_telhado, telhado_do_ponto
+
+# Processos para a etapa de CV (padrão: todos os núcleos) e threads de download
+ANALISE_PROCESSOS = int(os.getenv("PVG_ANALISE_PROCESSOS", "0")) or (os.cpu_count() or 1)
+DOWNLOAD_THREADS = int(os.getenv("PVG_SCAN_WORKERS", "8"))
+# 'spawn' evita herdar as threads do Streamlit num fork
+MP_START_METHOD = os.getenv("PVG_MP_START", "spawn")
+# Pontos com polígono de edificação só analisam os pixels do telhado
+USAR_MASCARA_TELHADO = os.getenv("PVG_MASCARA_TELHADO", "1") == "1"
+
+
+def _para_bgr(imagem):
+    """Aceita array BGR, PIL.Image, bytes codificados ou caminho e devolve array BGR contíguo."""
+    if isinstance(imagem, np.ndarray):
+        return np.ascontiguousarray(imagem)
+    if isinstance(imagem, (bytes, bytearray, memoryview)):
+        arr = cv2.imdecode(np.frombuffer(imagem, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if arr is None:
+            raise ValueError("Bytes de imagem inválidos")
+        return arr
+    if isinstance(imagem, Image.Image):
+        return cv2.cvtColor(np.array(imagem.convert('RGB')), cv2.COLOR_RGB2BGR)
+    if isinstance(imagem, str):
+        with open(imagem, 'rb') as f:
+            return _para_bgr(f.read())
+    raise TypeError(f"Tipo de imagem não suportado: {type(imagem).__name__}")
+
+
+def _mascaras(imagens, telhados):
+    """Máscara de telhado na resolução de cada imagem (None onde o ponto não tem polígono)."""
+    if not telhados or all(t is None for t in telhados):
+        return None
+    return [None if t is None else mascara_telhado(t, img.shape[1], img.shape[0])
+            for img, t in zip(imagens, telhados)]
+
+
+def _detectar(detector, imagens, hsv_config, telhados=None):
+    return detector.detectar_lote(imagens, hsv_config, _mascaras(imagens, telhados))
+
+
+def _worker_detectar(blocos, hsv_config, nome_detector, telhados=None):
+    """
+    Roda no processo filho: lê o lote de imagens direto da memória compartilhada.
+    O detector (e o modelo, se houver) é carregado uma vez por processo.
+    Os telhados vêm como arrays planos (poucos KB); a máscara é desenhada aqui.
+    """
+    shms = [shared_memory.SharedMemory(name=nome) for nome, _, _ in blocos]
+    try:
+        imagens = [np.ndarray(shape, dtype=dtype, buffer=shm.buf) for shm, (_, shape, dtype) in zip(shms, blocos)]
+        try:
+            return _detectar(obter_detector(nome_detector), imagens, hsv_config, telhados)
+        except Exception as e:
+            return [_resultado_erro(e) for _ in blocos]
+        finally:
+            del imagens
+    finally:
+        for shm in shms:
+            shm.close()
+
+
+class MotorAnalise:
+    """
+    Motor de análise em lote: a etapa de CV roda num pool de processos e as imagens
+    chegam aos workers por memória compartilhada (sem pickle de PIL/arrays).
+    O detector (heurístico, YOLO, ...) é escolhido por chamada.
+    Usado pelo dashboard e por scripts/CLI.
+    """
+
+    def __init__(self, processos=None, threads_download=None):
+        self.processos = processos or ANALISE_PROCESSOS
+        self.threads_download = threads_download or DOWNLOAD_THREADS
+        self.ultimo_throughput = 0.0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _obter_pool(self):
+        with self._lock:
+            if self._pool is None and self.processos > 1:
+                # Garante que os filhos herdem o mesmo resource tracker do pai
+                resource_tracker.ensure_running()
+                self._pool = ProcessPoolExecutor(max_workers=self.processos,
+                                                 mp_context=mp.get_context(MP_START_METHOD))
+            return self._pool
+
+    def _submeter(self, imagens, hsv_config, detector, telhados=None):
+        """Copia o lote para blocos de memória compartilhada e agenda a detecção."""
+        pool = self._obter_pool() if detector.usar_pool else None
+        if pool is None:
+            return _futuro_resolvido(_detectar, detector, imagens, hsv_config, telhados), []
+
+        shms, blocos = [], []
+        try:
+            for img in imagens:
+                shm = shared_memory.SharedMemory(create=True, size=img.nbytes)
+                shms.append(shm)
+                np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[:] = img
+                blocos.append((shm.name, img.shape, img.dtype.str))
+            return pool.submit(_worker_detectar, blocos, hsv_config, detector.nome, telhados), shms
+        except Exception:
+            _liberar(shms)
+            raise
+
+    def _iterar(self, tarefas, hsv_config, detector, telhado_de=None):
+        """
+        tarefas: iterável de (indice, imagem_bgr ou exceção).
+        telhado_de(indice): polígonos do telhado do ponto (telhado_do_ponto) ou None.
+        Gera (indice, resultado_cv, imagem_bgr) conforme cada lote termina.
+        Limita a quantidade de blocos de memória compartilhada vivos ao mesmo tempo.
+        """
+        detector = obter_detector(detector)
+        limite = max(2, self.processos * 2)
+        em_voo = {}
+        tarefas = iter(tarefas)
+        lote = []
+
+        def _enviar_lote():
+            indices = [idx for idx, _ in lote]
+            imagens = [img for _, img in lote]
+            telhados = [telhado_de(idx) for idx in indices] if telhado_de else None
+            try:
+                fut, shms = self._submeter(imagens, hsv_config, detector, telhados)
+            except Exception as e:
+                fut, shms = _futuro_resolvido(lambda: [_resultado_erro(e) for _ in imagens]), []
+            em_voo[fut] = (indices, imagens, shms)
+            lote.clear()
+
+        def _encher():
+            for idx, img in tarefas:
+                if isinstance(img, Exception):
+                    em_voo[_futuro_resolvido(lambda e=img: [_resultado_erro(e)])] = ([idx], [None], [])
+                else:
+                    lote.append((idx, img))
+                    if len(lote) >= detector.tamanho_lote:
+                        _enviar_lote()
+                if len(em_voo) >= limite:
+                    return
+            if lote:
+                _enviar_lote()
+
+        try:
+            _encher()
+            while em_voo:
+                prontos, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+                for fut in prontos:
+                    indices, imagens, shms = em_voo.pop(fut)
+                    _liberar(shms)
+                    try:
+                        resultados = fut.result()
+                    except Exception as e:
+                        resultados = [_resultado_erro(e) for _ in indices]
+                    for idx, resultado, img in zip(indices, resultados, imagens):
+                        yield idx, resultado, img
+                _encher()
+        finally:
+            # Cancelamento (close do gerador) ou erro: nenhum bloco de memória compartilhada fica para trás.
+            # Um worker que já leu o bloco só perde o nome; o mapeamento dele continua válido até o close.
+            for fut, (_, _, shms) in em_voo.items():
+                fut.cancel()
+                _liberar(shms)
+            em_voo.clear()
+
+    def analisar_imagens(self, imagens, hsv_config=None, detector=None):
+        """
+        Analisa uma lista de imagens (array BGR, PIL, bytes ou caminho).
+        Retorna, na ordem de entrada, dicts com deteccoes, ratio, tem_gd, classe e erro.
+        """
+        def _tarefas():
+            for idx, imagem in enumerate(imagens):
+                try:
+                    yield idx, _para_bgr(imagem)
+                except Exception as e:
+                    yield idx, e
+
+        inicio = time.perf_counter()
+        resultados = [None] * len(imagens)
+        for idx, resultado, _ in self._iterar(_tarefas(), hsv_config, detector):
+            resultados[idx] = resultado
+        self._registrar_throughput(len(imagens), inicio)
+        return resultados
+
+    def iterar_pontos(self, pontos, hsv_config=None, detector=None, desenhar=True):
+        """
+        Baixa os tiles em threads e analisa em processos.
+        Gera (indice, resultado) fora de ordem; resultado inclui a imagem anotada ('img')
+        quando desenhar=True. Pontos com polígono (edificação ou tile) só são analisados
+        nos pixels do telhado (PVG_MASCARA_TELHADO=0 desliga).
+        """
+        inicio = time.perf_counter()
+        concluidos = 0
+        telhado_de = (lambda idx: telhado_do_ponto(pontos[idx])) if USAR_MASCARA_TELHADO else None
+        with ThreadPoolExecutor(max_workers=self.threads_download) as downloads:
+            futuros = _janela_downloads(downloads, pontos, self.threads_download * 2)
+            for idx, cv_res, img in self._iterar(futuros, hsv_config, detector, telhado_de):
+                pt = pontos[idx]
+                resultado = {
+                    'lat': pt['latitude'],
+                    'lon': pt['longitude'],
+                    'ratio': cv_res['ratio'],
+                    'tem_gd': cv_res['tem_gd'],
+                    'deteccoes': cv_res['deteccoes'],
+                    'paineis_estimados': cv_res.get('paineis_estimados', 0),
+                    'classe': cv_res.get('classe'),
+                    'erro': cv_res['erro']
+                }
+                if img is not None:
+                    # Largura real da imagem: projeção pixel -> lat/lon das detecções
+                    resultado['largura_px'] = img.shape[1]
+                    if desenhar:
+                        resultado['img'] = desenhar_deteccoes(img, cv_res['deteccoes'])
+                concluidos += 1
+                yield idx, resultado
+        self._registrar_throughput(concluidos, inicio)
+
+    def analisar_pontos(self, pontos, hsv_config=None, on_progress=None, detector=None):
+        """Versão em lote de iterar_pontos: devolve a lista na ordem dos pontos."""
+        resultados = [None] * len(pontos)
+        for concluidos, (idx, res) in enumerate(self.iterar_pontos(pontos, hsv_config, detector), start=1):
+            resultados[idx] = res
+            if on_progress:
+                on_progress(concluidos, len(pontos))
+        return resultados
+
+    def _registrar_throughput(self, quantidade, inicio):
+        decorrido = time.perf_counter() - inicio
+        self.ultimo_throughput = quantidade / decorrido if decorrido > 0 else 0.0
+
+    def fechar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+def _janela_downloads(executor, pontos, janela):
+    """Mantém no máximo `janela` downloads em andamento e gera (indice, bgr) conforme terminam."""
+    fila = iter(enumerate(pontos))
+    pendentes = {}
+
+    def _encher():
+        for idx, pt in fila:
+            pendentes[executor.submit(obter_imagem_bgr, pt['latitude'], pt['longitude'], True,
+                                      pt.get('zoom', ZOOM_PADRAO))] = idx
+            if len(pendentes) >= janela:
+                return
+
+    _encher()
+    while pendentes:
+        prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+        for fut in prontos:
+            idx = pendentes.pop(fut)
+            try:
+                img = fut.result()
+            except Exception as e:
+                img = e
+            yield idx, img
+        _encher()
+
+
+def _liberar(shms):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
+
+def _resultado_erro(e):
+    return {'deteccoes': [], 'ratio': 0, 'tem_gd': False, 'paineis_estimados': 0, 'classe': None, 'erro': str(e)}
+
+
+def _futuro_resolvido(fn, *args):
+    """Future já resolvido, para o caminho sem pool e para erros de entrada."""
+    fut = Future()
+    try:
+        fut.set_result(fn(*args))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+
+def obter_motor():
+    """Motor compartilhado pelo processo (o pool sobrevive aos reruns do Streamlit)."""
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            _motor = MotorAnalise()
+        return _motor
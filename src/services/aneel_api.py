@@ -1,71 +1,48 @@
 import pandas as pd
 import requests
-import streamlit as st
 
-import os
+from src.services.aneel_mirror import (API_URL, COLUNA_FONTE, COLUNA_MUNICIPIO, RESOURCE_ID, coluna_sql,
+                                       literal_sql, normalizar_registros, obter_espelho_aneel, recurso_sql)
+from src.services.service_cache import memoizar
 
-RESOURCE_ID = os.getenv("ANEEL_RESOURCE_ID")
-BASE_URL = "https://dadosabertos.aneel.gov.br/api/3/action/datastore_search_sql"
+BASE_URL = f"{API_URL}/datastore_search_sql"
 
 
-@st.cache_data(ttl=3600)
-def buscar_usinas_solares(cidade=None, limite=100):
+def buscar_usinas_solares(cidade=None, limite=100, uf=None, potencia_min=None):
     """
-    Busca usinas solares na API da ANEEL usando SQL.
+    Usinas solares da ANEEL. Com o espelho local sincronizado (python -m src.cli sync-aneel)
+    a consulta é local e devolve todas as usinas (limite=None) em milissegundos;
+    sem ele, consulta a API com o limite dado.
     """
-    # 1. Base da query: Filtrar por Solar
-    # Nota: Usamos LIKE %%Solar%% porque o % é caractere especial no Python
-    query_sql = f"""
-        SELECT * from "{RESOURCE_ID}"
-        WHERE "DscOrigemCombustivel" LIKE '%%Solar%%'
-    """
-
-    # 2. Filtro de Cidade (Corrigido para DscMuninicpios e usando LIKE)
-    if cidade:
-        # O % extra é para o SQL entender que é uma busca parcial ("BELO HORIZONTE" acha "BELO HORIZONTE - MG")
-        cidade_upper = cidade.upper()
-        query_sql += f" AND UPPER(\"DscMuninicpios\") LIKE '%%{cidade_upper}%%'"
-
-    query_sql += f" LIMIT {limite}"
+    espelho = obter_espelho_aneel(uf)
+    if espelho is not None:
+        return espelho.consultar(cidade=cidade, uf=uf, potencia_min=potencia_min, limite=limite)
+    return _buscar_usinas_api(cidade, limite or 100)
 
-    params = {'sql': query_sql}
 
+# Falhas voltam como DataFrame vazio: só respostas com usinas ficam no cache
+@memoizar('usinas_aneel', ttl_s=3600, max_entradas=16, guardar_se=lambda df: not df.empty)
+def _buscar_usinas_api(cidade=None, limite=100):
+    """
+    Busca usinas solares na API da ANEEL usando SQL (literais escapados: o endpoint não aceita parâmetros).
+    """
     try:
-        response = requests.get(BASE_URL, params=params)
+        query_sql = f"SELECT * FROM {recurso_sql(RESOURCE_ID)} WHERE {coluna_sql(COLUNA_FONTE)} LIKE '%%Solar%%'"
+        if cidade:
+            # Busca parcial: "BELO HORIZONTE" acha "BELO HORIZONTE - MG"
+            query_sql += f" AND UPPER({coluna_sql(COLUNA_MUNICIPIO)}) LIKE {literal_sql('%' + cidade.upper() + '%')}"
+        query_sql += f" LIMIT {int(limite)}"
+
+        response = requests.get(BASE_URL, params={'sql': query_sql}, timeout=30)
         data = response.json()
 
         if data.get('success'):
-            df = pd.DataFrame(data['result']['records'])
-
-            # Tratamento de erro caso a busca venha vazia
-            if df.empty:
-                return df
-
-            # 3. Correção Crítica de Coordenadas (Vírgula para Ponto)
-            cols_coords = ['NumCoordNEmpreendimento', 'NumCoordEEmpreendimento']
-            for col in cols_coords:
-                if col in df.columns:
-                    # Remove pontos de milhar se houver e troca vírgula decimal por ponto
-                    df[col] = df[col].astype(str).str.replace(',', '.')
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            # 4. Renomear para o mapa do Streamlit entender
-            df = df.rename(columns={
-                'NumCoordNEmpreendimento': 'latitude',
-                'NumCoordEEmpreendimento': 'longitude'
-            })
-
-            # Converter Potência para número também
-            if 'MdaPotenciaOutorgadaKw' in df.columns:
-                df['MdaPotenciaOutorgadaKw'] = df['MdaPotenciaOutorgadaKw'].astype(str).str.replace(',', '.').astype(
-                    float)
-
-            return df
+            # Coordenadas e potência com vírgula decimal viram número; latitude/longitude para o mapa
+            return normalizar_registros(data['result']['records'])
         else:
-            # Mostra o erro na tela para ajudar a debugar
-            st.error(f"Erro SQL da API: {data.get('error')}")
+            print(f"Erro SQL da API: {data.get('error')}")
             return pd.DataFrame()
 
     except Exception as e:
-        st.error(f"Erro de conexão: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        print(f"Erro de conexão ANEEL: {e}")
+        return pd.DataFrame()
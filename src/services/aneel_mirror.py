@@ -0,0 +1,281 @@
+"""
+Espelho local da base de usinas da ANEEL (CKAN datastore) em Parquet.
+
+A sincronização pagina o recurso inteiro por _id (keyset, sem OFFSET), normaliza
+coordenadas, potência e município uma única vez e grava um Parquet por recurso.
+Sincronizações seguintes olham o last_modified e o total do recurso: sem mudança
+não baixam nada; se a mudança são só linhas novas, baixam apenas os _id acima da
+marca d'água; qualquer outra mudança (recurso recarregado, linhas removidas ou
+editadas) refaz a cópia inteira.
+
+    python -m src.cli sync-aneel --uf SE
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from src.utils.http import criar_sessao
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+RESOURCE_ID = os.getenv("ANEEL_RESOURCE_ID")
+API_URL = "https://dadosabertos.aneel.gov.br/api/3/action"
+ANEEL_DIR = os.getenv("PVG_ANEEL_DIR", os.path.join("data", "aneel"))
+# O CKAN limita as linhas por consulta (ckan.datastore.search.rows_max, 32000 por padrão)
+LINHAS_POR_PAGINA = int(os.getenv("PVG_ANEEL_PAGINA", "10000"))
+ANEEL_TIMEOUT = (5, 60)
+ANEEL_TENTATIVAS = 4
+
+COLUNA_UF = "SigUFPrincipal"
+COLUNA_MUNICIPIO = "DscMuninicpios"
+COLUNA_FONTE = "DscOrigemCombustivel"
+COLUNA_POTENCIA = "MdaPotenciaOutorgadaKw"
+COLUNAS_COORDENADAS = {'NumCoordNEmpreendimento': 'latitude', 'NumCoordEEmpreendimento': 'longitude'}
+
+_RE_UUID = re.compile(r'^[0-9a-fA-F-]{36}$')
+_RE_IDENTIFICADOR = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+# --- SQL seguro (o datastore_search_sql não aceita parâmetros) ---
+
+def recurso_sql(resource_id):
+    if not resource_id or not _RE_UUID.match(resource_id):
+        raise ValueError(f"ANEEL_RESOURCE_ID inválido: {resource_id!r}")
+    return f'"{resource_id}"'
+
+
+def coluna_sql(nome):
+    if not _RE_IDENTIFICADOR.match(nome):
+        raise ValueError(f"Coluna inválida: {nome!r}")
+    return f'"{nome}"'
+
+
+def literal_sql(valor):
+    """Literal de texto com aspas escapadas; % vira %% (o CKAN repassa a string ao psycopg2)."""
+    return "'" + str(valor).replace("'", "''").replace('%', '%%') + "'"
+
+
+def sql_pagina(resource_id, depois_de_id, limite, uf=None):
+    condicoes = [f"{coluna_sql('_id')} > {int(depois_de_id)}",
+                 f"{coluna_sql(COLUNA_FONTE)} LIKE '%%Solar%%'"]
+    if uf:
+        condicoes.append(f"UPPER({coluna_sql(COLUNA_UF)}) = {literal_sql(uf.upper())}")
+    return (f"SELECT * FROM {recurso_sql(resource_id)} WHERE {' AND '.join(condicoes)} "
+            f"ORDER BY {coluna_sql('_id')} LIMIT {int(limite)}")
+
+
+def sql_contagem(resource_id, uf=None):
+    sql = f"SELECT COUNT(*) AS total FROM {recurso_sql(resource_id)} WHERE {coluna_sql(COLUNA_FONTE)} LIKE '%%Solar%%'"
+    if uf:
+        sql += f" AND UPPER({coluna_sql(COLUNA_UF)}) = {literal_sql(uf.upper())}"
+    return sql
+
+
+# --- Normalização (uma vez, na sincronização) ---
+
+def normalizar_texto(texto):
+    """Maiúsculas sem acento: 'São Cristóvão' -> 'SAO CRISTOVAO'."""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).upper().strip()
+
+
+def _numero_br(serie):
+    """'1.234,5' / '1234,5' / 1234.5 -> float (vetorizado)."""
+    texto = serie.astype(str).str.strip()
+    virgula = texto.str.contains(',', regex=False)
+    texto = texto.where(~virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(texto, errors='coerce')
+
+
+def normalizar_registros(registros):
+    """Registros crus do CKAN -> DataFrame com latitude/longitude/potência numéricas e município normalizado."""
+    df = pd.DataFrame(registros)
+    if df.empty:
+        return df
+    df['_id'] = pd.to_numeric(df['_id'], errors='coerce').astype('int64')
+    for origem, destino in COLUNAS_COORDENADAS.items():
+        if origem in df.columns:
+            df[destino] = _numero_br(df.pop(origem))
+    if COLUNA_POTENCIA in df.columns:
+        df[COLUNA_POTENCIA] = _numero_br(df[COLUNA_POTENCIA])
+    if COLUNA_MUNICIPIO in df.columns:
+        df['municipio_norm'] = df[COLUNA_MUNICIPIO].fillna('').map(normalizar_texto)
+    if COLUNA_UF in df.columns:
+        df['uf'] = df[COLUNA_UF].fillna('').str.upper().str.strip()
+    # Demais colunas como texto: o schema do Parquet fica estável entre sincronizações
+    for coluna in df.columns:
+        if df[coluna].dtype == object:
+            df[coluna] = df[coluna].where(df[coluna].isna(), df[coluna].astype(str))
+    return df
+
+
+# --- Sincronização ---
+
+class SincronizadorAneel:
+    def __init__(self, resource_id=RESOURCE_ID, diretorio=ANEEL_DIR, sessao=None, api_url=API_URL):
+        self.resource_id = resource_id
+        self.diretorio = diretorio
+        self.api_url = api_url
+        self.sessao = sessao or criar_sessao(4)
+
+    def caminhos(self, uf=None):
+        nome = f"usinas_solares_{(uf or 'BR').upper()}"
+        return (os.path.join(self.diretorio, f"{nome}.parquet"),
+                os.path.join(self.diretorio, f"{nome}.json"))
+
+    def _chamar(self, acao, **params):
+        ultimo_erro = None
+        for tentativa in range(ANEEL_TENTATIVAS):
+            if tentativa:
+                time.sleep(2 ** tentativa)
+            try:
+                resposta = self.sessao.get(f"{self.api_url}/{acao}", params=params, timeout=ANEEL_TIMEOUT)
+                dados = resposta.json()
+                if dados.get('success'):
+                    return dados['result']
+                ultimo_erro = dados.get('error')
+                if resposta.status_code == 400:
+                    break  # erro de SQL: repetir não resolve
+            except Exception as e:
+                ultimo_erro = e
+        raise RuntimeError(f"ANEEL {acao}: {ultimo_erro}")
+
+    def _sql(self, sql):
+        return self._chamar("datastore_search_sql", sql=sql)['records']
+
+    def _ultima_modificacao(self):
+        try:
+            recurso = self._chamar("resource_show", id=self.resource_id)
+            return recurso.get('last_modified') or recurso.get('metadata_modified')
+        except RuntimeError:
+            return None
+
+    def _baixar(self, depois_de_id, uf, ao_progredir=None):
+        """Gera páginas (DataFrames normalizados) com _id > depois_de_id."""
+        while True:
+            registros = self._sql(sql_pagina(self.resource_id, depois_de_id, LINHAS_POR_PAGINA, uf))
+            if not registros:
+                return
+            pagina = normalizar_registros(registros)
+            depois_de_id = int(pagina['_id'].max())
+            if ao_progredir:
+                ao_progredir(len(pagina))
+            yield pagina
+            if len(registros) < LINHAS_POR_PAGINA:
+                return
+
+    def _baixar_tudo(self, depois_de_id, uf, ao_progredir):
+        paginas = list(self._baixar(depois_de_id, uf, ao_progredir))
+        return pd.concat(paginas, ignore_index=True) if paginas else pd.DataFrame()
+
+    def sincronizar(self, uf=None, completo=False, ao_progredir=None):
+        """Atualiza o espelho e devolve os metadados (inclui quantas linhas foram baixadas)."""
+        if pa is None:
+            raise RuntimeError("pyarrow não instalado: pip install pyarrow")
+        caminho, caminho_meta = self.caminhos(uf)
+        meta = {}
+        if not completo and os.path.exists(caminho) and os.path.exists(caminho_meta):
+            with open(caminho_meta, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('resource_id') != self.resource_id:
+                meta = {}
+
+        modificado = self._ultima_modificacao()
+        total_remoto = int(self._sql(sql_contagem(self.resource_id, uf))[0]['total'])
+        if meta and modificado and meta.get('last_modified') == modificado and meta.get('total') == total_remoto:
+            return dict(meta, baixadas=0)
+
+        existente = pd.read_parquet(caminho) if meta else None
+        novas = self._baixar_tudo(meta.get('ultimo_id', 0), uf, ao_progredir) if meta else None
+        if existente is None or not len(novas) or len(existente) + len(novas) != total_remoto:
+            # Sem espelho, ou a mudança não se explica só por linhas novas (recurso recarregado,
+            # linhas removidas ou editadas): cópia inteira
+            existente = None
+            novas = self._baixar_tudo(0, uf, ao_progredir)
+
+        df = pd.concat([existente, novas], ignore_index=True) if existente is not None else novas
+        if not df.empty:
+            df = df.drop_duplicates('_id', keep='last').sort_values('_id', ignore_index=True)
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        temporario = f"{caminho}.tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporario, compression='zstd')
+        os.replace(temporario, caminho)
+        meta = {
+            'resource_id': self.resource_id,
+            'uf': uf,
+            'last_modified': modificado,
+            'total': int(len(df)),
+            'ultimo_id': int(df['_id'].max()) if not df.empty else 0,
+            'sincronizado_em': time.time(),
+        }
+        with open(caminho_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        return dict(meta, baixadas=int(len(novas)))
+
+
+# --- Consultas locais ---
+
+class EspelhoAneel:
+    """Cópia local carregada uma vez; filtros vetorizados sobre colunas já normalizadas."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.df = pd.read_parquet(caminho)
+        municipios = self.df.get('municipio_norm', pd.Series('', index=self.df.index))
+        # Poucos municípios distintos: o filtro por texto roda nas categorias, não nas linhas
+        self._municipios = municipios.astype('category')
+
+    def consultar(self, cidade=None, uf=None, potencia_min=None, potencia_max=None, limite=None):
+        mascara = np.ones(len(self.df), dtype=bool)
+        if cidade:
+            categorias = self._municipios.cat.categories
+            alvo = normalizar_texto(cidade)
+            codigos = np.flatnonzero(categorias.str.contains(alvo, regex=False))
+            mascara &= np.isin(self._municipios.cat.codes.to_numpy(), codigos)
+        if uf and 'uf' in self.df.columns:
+            mascara &= (self.df['uf'] == uf.upper()).to_numpy()
+        if COLUNA_POTENCIA in self.df.columns:
+            potencia = self.df[COLUNA_POTENCIA].to_numpy()
+            if potencia_min is not None:
+                mascara &= potencia >= potencia_min
+            if potencia_max is not None:
+                mascara &= potencia <= potencia_max
+        resultado = self.df[mascara]
+        return resultado.head(limite) if limite else resultado
+
+
+_espelhos = {}
+_espelhos_lock = threading.Lock()
+
+
+def obter_espelho_aneel(uf=None, diretorio=ANEEL_DIR):
+    """
+    Espelho local sincronizado (o da UF, ou o nacional) ou None se ainda não houve sync.
+    Recarrega quando o arquivo muda.
+    """
+    candidatos = [f"usinas_solares_{uf.upper()}.parquet"] if uf else []
+    candidatos.append("usinas_solares_BR.parquet")
+    for nome in candidatos:
+        caminho = os.path.join(diretorio, nome)
+        try:
+            versao = os.path.getmtime(caminho)
+        except OSError:
+            continue
+        with _espelhos_lock:
+            espelho, versao_atual = _espelhos.get(caminho, (None, None))
+            if espelho is None or versao_atual != versao:
+                espelho = EspelhoAneel(caminho)
+                _espelhos[caminho] = (espelho, versao)
+            return espelho
+    return None
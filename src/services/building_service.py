@@ -1,7 +1,11 @@
-import requests
 import random
 import pandas as pd
 
+from src.services.osm_store import edificacoes_df, obter_base_osm
+from src.services.overpass_client import obter_cliente_overpass
+from src.services.service_cache import memoizar
+from src.utils.geometria import area_poligonos_m2, centroides, empacotar
+
 
 def _mock_buildings(lat, lon, count=20):
     """Gera casas falsas para demo."""
@@ -13,37 +17,51 @@ def _mock_buildings(lat, lon, count=20):
             'id': f'mock_{i}',
             'centro_lat': lat + d_lat,
             'centro_lon': lon + d_lon,
-            'geometria': [],
-            'area_m2': random.randint(100, 300)
+            'area_m2': random.randint(100, 300),
+            'inicio': 0,
+            'fim': 0,
         })
     return pd.DataFrame(mocks)
 
 
+def edificacoes_de_elementos(elementos):
+    """
+    Ways do Overpass (`out geom`) -> DataFrame com o polígono real de cada edificação.
+    Os vértices viram arrays planos com offsets; área geodésica e centroide saem numa passada só.
+        """
+    elementos = [el for el in elementos if len(el.get('geometry') or []) >= 3]
+    coords, offsets = empacotar([[[pt['lat'], pt['lon']] for pt in el['geometry']] for el in elementos])
+    centro_lat, centro_lon = centroides(coords, offsets)
+    return edificacoes_df([el['id'] for el in elementos], centro_lat, centro_lon,
+                          area_poligonos_m2(coords, offsets), coords, offsets)
+
+
 def buscar_edificacoes_raio(lat, lon, radius_km=0.5):
-    """Busca edificações no OSM com fallback para Mock."""
-    query = f"""
-    [out:json][timeout:5];
-    way["building"](around:{radius_km * 1000},{lat},{lon});
-    out center;
     """
+    Edificações no raio. Com a base OSM local ingerida (PVG_OSM_DIR) a consulta é
+    local e sem mock: raio sem edificações devolve vazio. Sem ela, Overpass com fallback para Mock.
+    """
+    base = obter_base_osm()
+    if base is not None:
+        return base.edificacoes_raio(lat, lon, radius_km)
+
     try:
-        resp = requests.get("https://overpass-api.de/api/interpreter", params={'data': query}, timeout=8)
-        if resp.status_code == 200:
-            data = resp.json()
-            buildings = []
-            for el in data.get('elements', []):
-                if 'center' in el:
-                    buildings.append({
-                        'id': el['id'],
-                        'centro_lat': el['center']['lat'],
-                        'centro_lon': el['center']['lon'],
-                        'geometria': [],
-                        'area_m2': 150
-                    })
-            if buildings:
-                return pd.DataFrame(buildings)
+        buildings = _edificacoes_overpass(lat, lon, radius_km)
+        if not buildings.empty:
+            return buildings
     except Exception as e:
         print(f"Erro OSM: {e}")
 
     print("⚠️ Usando Mock de Edificações")
-    return _mock_buildings(lat, lon)
\ No newline at end of file
+    return _mock_buildings(lat, lon)
+
+
+# DataFrames grandes (polígonos): poucas entradas em memória, o resto fica no disco
+@memoizar('edificacoes', ttl_s=3600, max_entradas=16, guardar_se=lambda df: not df.empty)
+def _edificacoes_overpass(lat, lon, radius_km):
+    query = f"""
+    [out:json][timeout:10];
+    way["building"](around:{radius_km * 1000},{lat},{lon});
+    out geom;
+    """
+    return edificacoes_de_elementos(obter_cliente_overpass().consultar(query).get('elements', []))
@@ -0,0 +1,135 @@
+"""
+Cruzamento das detecções com as usinas registradas na ANEEL.
+
+Cada edificação com GD detectada é comparada às usinas num raio de tolerância
+(as coordenadas da ANEEL costumam vir deslocadas do telhado) por um join espacial
+em lote, sem comparar todas com todas:
+- registrado: há uma usina próxima e ela não é disputada;
+- nao_registrado: nenhuma usina no raio (o alvo do produto);
+- ambiguo: várias usinas a distâncias parecidas, ou a usina mais próxima
+  já ficou com uma detecção mais perto dela.
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.services.job_store import obter_job_store
+from src.services.result_writer import linhas_por_edificacao
+from src.utils.spatial_index import M_POR_GRAU, IndiceEspacial
+
+RAIO_CRUZAMENTO_M = float(os.getenv("PVG_RAIO_CRUZAMENTO_M", "50"))
+# A usina mais próxima só vence sem ambiguidade se a segunda estiver pelo menos 2x mais longe
+FATOR_AMBIGUIDADE = 0.5
+# Mesma estimativa do painel de resultados (kW por GD residencial)
+POTENCIA_MEDIA_GD_KW = 4.0
+COLUNAS_POTENCIA = ('MdaPotenciaOutorgadaKw', 'MdaPotenciaInstaladaKW', 'potencia_kw')
+COLUNAS_ID_USINA = ('CodCEG', 'CodEmpreendimento', '_id')
+
+REGISTRADO = 'registrado'
+NAO_REGISTRADO = 'nao_registrado'
+AMBIGUO = 'ambiguo'
+SITUACOES = (REGISTRADO, NAO_REGISTRADO, AMBIGUO)
+
+
+def _primeira_coluna(df, nomes):
+    return next((n for n in nomes if n in df.columns), None)
+
+
+def deteccoes_do_job(job_id):
+    """Edificações com GD de um job (pontos 'tile' expandidos por edificação)."""
+    linhas = []
+    for linha in obter_job_store().resultados(job_id, apenas_gd=True):
+        for edificacao in linhas_por_edificacao(linha):
+            if edificacao.get('tem_gd'):
+                linhas.append({k: edificacao.get(k) for k in ('subestacao', 'ponto_id', 'lat', 'lon',
+                                                              'paineis_estimados', 'classe', 'evidencia')})
+    return pd.DataFrame(linhas, columns=['subestacao', 'ponto_id', 'lat', 'lon', 'paineis_estimados', 'classe',
+                                         'evidencia'])
+
+
+def usinas_na_regiao(usinas, lats, lons, raio_m):
+    """Só as usinas na caixa das detecções (mais o raio): o índice não carrega o país inteiro."""
+    if not len(lats):
+        return usinas.iloc[:0].reset_index(drop=True)
+    margem_lat = raio_m / M_POR_GRAU
+    margem_lon = raio_m / (M_POR_GRAU * max(math.cos(math.radians(np.max(np.abs(lats)))), 1e-6))
+    lat_u, lon_u = usinas['latitude'].to_numpy(dtype=float), usinas['longitude'].to_numpy(dtype=float)
+    dentro = ((lat_u >= lats.min() - margem_lat) & (lat_u <= lats.max() + margem_lat)
+              & (lon_u >= lons.min() - margem_lon) & (lon_u <= lons.max() + margem_lon))
+    return usinas[dentro].reset_index(drop=True)
+
+
+def cruzar_deteccoes(deteccoes, usinas, raio_m=RAIO_CRUZAMENTO_M):
+    """
+    deteccoes: DataFrame com lat, lon (e subestacao, paineis_estimados...).
+    usinas: DataFrame com latitude, longitude (o espelho local da ANEEL, obter_espelho_aneel().df).
+    Devolve as detecções com situacao, usina, distancia_usina_m, usinas_no_raio e potencia_usina_kw.
+    """
+    saida = deteccoes.reset_index(drop=True).copy()
+    n = len(saida)
+    lats, lons = saida['lat'].to_numpy(dtype=float), saida['lon'].to_numpy(dtype=float)
+    usinas = usinas_na_regiao(usinas.dropna(subset=['latitude', 'longitude']), lats, lons, raio_m)
+
+    # Projeção em torno das detecções (não da média do espelho, que no Brasil inteiro fica perto de -15°)
+    indice = IndiceEspacial(usinas['latitude'].to_numpy(), usinas['longitude'].to_numpy(),
+                            lat_referencia=float(np.mean(lats)) if n else None)
+    q, u, d = indice.pares_no_raio(lats, lons, raio_m)
+
+    # Pares ordenados por detecção e distância: o 1º de cada grupo é a usina mais próxima
+    ordem = np.lexsort((d, q))
+    q, u, d = q[ordem], u[ordem], d[ordem]
+    contagem = np.bincount(q, minlength=n)
+    inicio = np.cumsum(contagem) - contagem
+    tem = contagem > 0
+    mais_proxima = np.full(n, -1, dtype=np.int64)
+    distancia = np.full(n, np.nan)
+    mais_proxima[tem], distancia[tem] = u[inicio[tem]], d[inicio[tem]]
+    segunda = np.full(n, np.inf)
+    duas = contagem > 1
+    segunda[duas] = d[inicio[duas] + 1]
+
+    situacao = np.full(n, NAO_REGISTRADO, dtype=object)
+    situacao[tem] = REGISTRADO
+    situacao[duas & (distancia > FATOR_AMBIGUIDADE * segunda)] = AMBIGUO
+
+    # Uma usina registra uma unidade: entre as detecções que a disputam, fica a mais próxima
+    candidatas = np.flatnonzero(situacao == REGISTRADO)
+    candidatas = candidatas[np.argsort(distancia[candidatas], kind='stable')]
+    _, primeiras = np.unique(mais_proxima[candidatas], return_index=True)
+    disputadas = np.setdiff1d(candidatas, candidatas[primeiras])
+    situacao[disputadas] = AMBIGUO
+
+    coluna_id = _primeira_coluna(usinas, COLUNAS_ID_USINA)
+    coluna_potencia = _primeira_coluna(usinas, COLUNAS_POTENCIA)
+    ids = usinas[coluna_id].to_numpy() if coluna_id else usinas.index.to_numpy()
+    saida['situacao'] = situacao
+    saida['usina'] = pd.Series(ids[np.maximum(mais_proxima, 0)], dtype=object).where(tem, None)
+    saida['distancia_usina_m'] = distancia
+    saida['usinas_no_raio'] = contagem
+    if coluna_potencia:
+        potencia = pd.to_numeric(usinas[coluna_potencia], errors='coerce').to_numpy()
+        saida['potencia_usina_kw'] = np.where(tem, potencia[np.maximum(mais_proxima, 0)], np.nan)
+    return saida
+
+
+def relatorio_por_subestacao(cruzado):
+    """Uma linha por subestação: contagens por situação, taxa de não registradas e potência oculta estimada."""
+    if cruzado.empty:
+        return pd.DataFrame(columns=['subestacao', 'deteccoes', *SITUACOES, 'taxa_nao_registrado',
+                                     'potencia_registrada_kw', 'potencia_oculta_kw'])
+    contagens = pd.crosstab(cruzado['subestacao'].fillna('—'), cruzado['situacao'])
+    relatorio = contagens.reindex(columns=list(SITUACOES), fill_value=0)
+    relatorio.insert(0, 'deteccoes', relatorio.sum(axis=1))
+    relatorio['taxa_nao_registrado'] = relatorio[NAO_REGISTRADO] / relatorio['deteccoes']
+    if 'potencia_usina_kw' in cruzado.columns:
+        registradas = cruzado[cruzado['situacao'] == REGISTRADO]
+        potencia = registradas.groupby(registradas['subestacao'].fillna('—'))['potencia_usina_kw'].sum()
+        relatorio['potencia_registrada_kw'] = potencia.reindex(relatorio.index, fill_value=0.0)
+    else:
+        relatorio['potencia_registrada_kw'] = 0.0
+    relatorio['potencia_oculta_kw'] = relatorio[NAO_REGISTRADO] * POTENCIA_MEDIA_GD_KW
+    relatorio.columns.name = None
+    return relatorio.rename_axis('subestacao').reset_index().sort_values(NAO_REGISTRADO, ascending=False,
+                                                                          ignore_index=True)
@@ -0,0 +1,331 @@
+import importlib.util
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+from src.services.satellite_service import detectar_paineis
+
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DETECTOR_PADRAO = os.getenv("PVG_DETECTOR", "heuristico")
+MODELO_YOLO = os.getenv("PVG_MODELO_YOLO", os.path.join(RAIZ_PROJETO, "models", "solar_v1.pt"))
+YOLO_CONF = float(os.getenv("PVG_YOLO_CONF", "0.25"))
+YOLO_LOTE = int(os.getenv("PVG_YOLO_LOTE", "16"))
+YOLO_DEVICE = os.getenv("PVG_YOLO_DEVICE") or None
+YOLO_IOU = float(os.getenv("PVG_YOLO_IOU", "0.7"))
+YOLO_IMGSZ = int(os.getenv("PVG_YOLO_IMGSZ", "640"))
+MAX_DETECCOES = 300
+
+# Modelo exportado por scripts/export_onnx.py (FP32 ou INT8) e threads do ONNX Runtime
+MODELO_ONNX = os.getenv("PVG_MODELO_ONNX", os.path.join(RAIZ_PROJETO, "models", "solar_v1.onnx"))
+ONNX_THREADS = int(os.getenv("PVG_ONNX_THREADS", "0"))
+
+# Área média (px) de um painel no tile 600x600@2x, zoom 19 (~1,7 m² a ~0,15 m/px)
+AREA_MEDIA_PAINEL_PX = float(os.getenv("PVG_AREA_MEDIA_PAINEL_PX", "80"))
+LIMIAR_INDUSTRIA_PAINEIS = 40
+
+
+def estimar_paineis(deteccoes):
+    """Estimativa por densidade de área: corrige o agrupamento de painéis numa só caixa."""
+    area_total_pixels = sum(d['w'] * d['h'] for d in deteccoes)
+    return area_total_pixels / AREA_MEDIA_PAINEL_PX
+
+
+def classificar_imovel(deteccoes):
+    paineis_estimados = estimar_paineis(deteccoes)
+
+    if paineis_estimados > LIMIAR_INDUSTRIA_PAINEIS:
+        return "🏭 INDÚSTRIA/COMÉRCIO (Alta Geração)"
+    elif paineis_estimados > 0:
+        return "🏠 RESIDENCIAL (Microgeração)"
+    else:
+        return "❌ Sem Geração Distribuída"
+
+
+def _montar_resultado(deteccoes, ratio, tem_gd):
+    return {
+        'deteccoes': deteccoes,
+        'ratio': ratio,
+        'tem_gd': tem_gd,
+        'paineis_estimados': estimar_paineis(deteccoes),
+        'classe': classificar_imovel(deteccoes),
+        'erro': None
+    }
+
+
+class Detector:
+    """
+    Interface comum dos motores de detecção.
+    detectar_lote recebe arrays BGR e devolve um dict por imagem com
+    deteccoes, ratio, tem_gd, paineis_estimados, classe e erro.
+    """
+    nome = ""
+    # Quantas imagens o motor prefere receber por chamada
+    tamanho_lote = 1
+    # Se o motor ganha com o pool de processos (False: já paraleliza internamente)
+    usar_pool = True
+    # Com máscara de telhado, roda só no recorte do telhado. Modelos de entrada fixa
+    # (letterbox) não ganham nada com o recorte e perderiam a escala do treino: só filtram.
+    recortar_telhado = False
+
+    def __init__(self):
+        self.imagens_processadas = 0
+        self.segundos = 0.0
+
+    def _detectar_lote(self, imagens_bgr, hsv_config):
+        raise NotImplementedError
+
+    def detectar_lote(self, imagens_bgr, hsv_config=None, mascaras=None):
+        """
+        mascaras: uma máscara uint8 do telhado por imagem (ou None). Detecções cujo
+        centro cai fora do telhado são descartadas (painéis do lote vizinho).
+        """
+        inicio = time.perf_counter()
+        if mascaras is None or all(m is None for m in mascaras):
+            resultados = self._detectar_lote(imagens_bgr, hsv_config)
+        else:
+            resultados = self._detectar_mascarado(imagens_bgr, hsv_config, mascaras)
+        self.segundos += time.perf_counter() - inicio
+        self.imagens_processadas += len(imagens_bgr)
+        return resultados
+
+    def _detectar_mascarado(self, imagens_bgr, hsv_config, mascaras):
+        entradas, origens, posicoes = [], [], []
+        resultados = [None] * len(imagens_bgr)
+        for i, (img, mascara) in enumerate(zip(imagens_bgr, mascaras)):
+            x0 = y0 = 0
+            if mascara is not None and self.recortar_telhado:
+                if not mascara.any():
+                    resultados[i] = _montar_resultado([], 0, False)
+                    continue
+                x0, y0, w, h = cv2.boundingRect(mascara)
+                img = np.ascontiguousarray(img[y0:y0 + h, x0:x0 + w])
+            entradas.append(img)
+            origens.append((x0, y0))
+            posicoes.append(i)
+
+        brutos = self._detectar_lote(entradas, hsv_config) if entradas else []
+        for i, (x0, y0), resultado in zip(posicoes, origens, brutos):
+            mascara = mascaras[i]
+            if mascara is None:
+                resultados[i] = resultado
+                continue
+            deteccoes = []
+            for d in resultado['deteccoes']:
+                d = dict(d, x=d['x'] + x0, y=d['y'] + y0)
+                cx = min(max(int(d['x'] + d['w'] / 2), 0), mascara.shape[1] - 1)
+                cy = min(max(int(d['y'] + d['h'] / 2), 0), mascara.shape[0] - 1)
+                if mascara[cy, cx]:
+                    deteccoes.append(d)
+            # ratio sempre relativo à imagem inteira, com ou sem recorte
+            h, w = imagens_bgr[i].shape[:2]
+            area_total = sum(d.get('area', d['w'] * d['h']) for d in deteccoes)
+            resultados[i] = _montar_resultado(deteccoes, min(area_total / (w * h) * 10, 0.99), bool(deteccoes))
+        return resultados
+
+    def detectar(self, img_bgr, hsv_config=None):
+        return self.detectar_lote([img_bgr], hsv_config)[0]
+
+    def imagens_por_segundo(self):
+        return self.imagens_processadas / self.segundos if self.segundos else 0.0
+
+
+class DetectorHeuristico(Detector):
+    """Heurística OpenCV (formato + linhas internas + cor azul)."""
+    nome = "heuristico"
+    recortar_telhado = True
+
+    def _detectar_lote(self, imagens_bgr, hsv_config):
+        return [_montar_resultado(*detectar_paineis(img, hsv_config)) for img in imagens_bgr]
+
+
+class DetectorYolo(Detector):
+    """YOLOv8 treinado no dataset solar, com predict em lote."""
+    nome = "yolo"
+    tamanho_lote = YOLO_LOTE
+    usar_pool = False
+
+    def __init__(self, caminho_modelo=MODELO_YOLO, conf=YOLO_CONF, device=YOLO_DEVICE):
+        super().__init__()
+        self.caminho_modelo = caminho_modelo
+        self.conf = conf
+        self.device = device
+
+    def _detectar_lote(self, imagens_bgr, hsv_config):
+        modelo = _carregar_modelo_yolo(self.caminho_modelo)
+        saidas = modelo.predict(source=list(imagens_bgr), conf=self.conf, device=self.device,
+                                batch=len(imagens_bgr), verbose=False)
+
+        resultados = []
+        for img, saida in zip(imagens_bgr, saidas):
+            h, w = img.shape[:2]
+            deteccoes = []
+            for (x1, y1, x2, y2), conf in zip(saida.boxes.xyxy.tolist(), saida.boxes.conf.tolist()):
+                x, y = int(x1), int(y1)
+                w_box, h_box = int(round(x2 - x1)), int(round(y2 - y1))
+                deteccoes.append({'x': x, 'y': y, 'w': w_box, 'h': h_box, 'motivo': f"YOLO {conf:.2f}",
+                                  'area': float(w_box * h_box), 'conf': conf})
+            area_total = sum(d['area'] for d in deteccoes)
+            resultados.append(_montar_resultado(deteccoes, min(area_total / (w * h) * 10, 0.99), bool(deteccoes)))
+        return resultados
+
+
+def letterbox(img_bgr, tamanho=YOLO_IMGSZ):
+    """
+    Redimensiona mantendo a proporção e completa com cinza (114), como no YOLOv8.
+    Retorna (tensor CHW float32 RGB 0-1, escala, (pad_x, pad_y)).
+    """
+    h, w = img_bgr.shape[:2]
+    escala = min(tamanho / h, tamanho / w)
+    novo_w, novo_h = int(round(w * escala)), int(round(h * escala))
+    pad_x, pad_y = (tamanho - novo_w) / 2, (tamanho - novo_h) / 2
+
+    if (novo_w, novo_h) != (w, h):
+        img_bgr = cv2.resize(img_bgr, (novo_w, novo_h), interpolation=cv2.INTER_LINEAR)
+    topo, esquerda = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    img_bgr = cv2.copyMakeBorder(img_bgr, topo, tamanho - novo_h - topo, esquerda, tamanho - novo_w - esquerda,
+                                 cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+    tensor = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor, escala, (esquerda, topo)
+
+
+class DetectorOnnx(Detector):
+    """YOLOv8 exportado para ONNX (FP32 ou INT8) rodando no ONNX Runtime em CPU."""
+    nome = "onnx"
+    tamanho_lote = YOLO_LOTE
+    usar_pool = False
+
+    def __init__(self, caminho_modelo=MODELO_ONNX, conf=YOLO_CONF, iou=YOLO_IOU, threads=ONNX_THREADS):
+        super().__init__()
+        self.caminho_modelo = caminho_modelo
+        self.conf = conf
+        self.iou = iou
+        self.threads = threads
+
+    def _detectar_lote(self, imagens_bgr, hsv_config):
+        sessao, lote_dinamico = _carregar_sessao_onnx(self.caminho_modelo, self.threads)
+        entradas = [letterbox(img) for img in imagens_bgr]
+        nome_entrada = sessao.get_inputs()[0].name
+
+        if lote_dinamico:
+            saidas = sessao.run(None, {nome_entrada: np.stack([t for t, _, _ in entradas])})[0]
+        else:
+            saidas = np.concatenate([sessao.run(None, {nome_entrada: t[None]})[0] for t, _, _ in entradas])
+
+        resultados = []
+        for img, (_, escala, (pad_x, pad_y)), saida in zip(imagens_bgr, entradas, saidas):
+            h, w = img.shape[:2]
+            deteccoes = []
+            for (cx, cy, bw, bh), conf in self._pos_processar(saida):
+                x1 = min(max((cx - bw / 2 - pad_x) / escala, 0), w)
+                y1 = min(max((cy - bh / 2 - pad_y) / escala, 0), h)
+                x2 = min(max((cx + bw / 2 - pad_x) / escala, 0), w)
+                y2 = min(max((cy + bh / 2 - pad_y) / escala, 0), h)
+                x, y = int(x1), int(y1)
+                w_box, h_box = int(round(x2 - x1)), int(round(y2 - y1))
+                deteccoes.append({'x': x, 'y': y, 'w': w_box, 'h': h_box, 'motivo': f"YOLO {conf:.2f}",
+                                  'area': float(w_box * h_box), 'conf': conf})
+            area_total = sum(d['area'] for d in deteccoes)
+            resultados.append(_montar_resultado(deteccoes, min(area_total / (w * h) * 10, 0.99), bool(deteccoes)))
+        return resultados
+
+    def _pos_processar(self, saida):
+        """Saída YOLOv8 (4 + nc, anchors) -> caixas (cx, cy, w, h) e confiança após NMS por classe."""
+        pred = saida.T
+        classes = pred[:, 4:].argmax(axis=1)
+        scores = pred[np.arange(len(pred)), 4 + classes]
+        manter = scores > self.conf
+        caixas, scores, classes = pred[manter, :4], scores[manter], classes[manter]
+        if not len(scores):
+            return []
+
+        # Deslocamento por classe para o NMS não suprimir caixas de classes diferentes (como no Ultralytics)
+        deslocamento = classes[:, None] * 7680.0
+        xywh = np.column_stack([caixas[:, 0] - caixas[:, 2] / 2, caixas[:, 1] - caixas[:, 3] / 2,
+                                caixas[:, 2], caixas[:, 3]])
+        xywh[:, :2] += deslocamento
+        indices = np.array(cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), self.conf, self.iou)).flatten()
+        return [(caixas[i].tolist(), float(scores[i])) for i in indices[:MAX_DETECCOES]]
+
+
+# Modelos carregados uma única vez por processo
+_modelos = {}
+_modelos_lock = threading.Lock()
+
+
+def ultralytics_instalado():
+    """Checa o pacote sem importá-lo (o ultralytics puxa o torch, que leva segundos para carregar)."""
+    return importlib.util.find_spec("ultralytics") is not None
+
+
+def _carregar_modelo_yolo(caminho):
+    with _modelos_lock:
+        if caminho not in _modelos:
+            from ultralytics import YOLO
+
+            print(f"🧠 Carregando modelo YOLO: {caminho}")
+            _modelos[caminho] = YOLO(caminho)
+        return _modelos[caminho]
+
+
+def _carregar_sessao_onnx(caminho, threads):
+    """Sessão ONNX Runtime (uma por processo) e se o modelo aceita lote dinâmico."""
+    chave = (caminho, threads)
+    with _modelos_lock:
+        if chave not in _modelos:
+            print(f"🧠 Carregando modelo ONNX: {caminho}")
+            opcoes = ort.SessionOptions()
+            opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if threads:
+                opcoes.intra_op_num_threads = threads
+            sessao = ort.InferenceSession(caminho, sess_options=opcoes, providers=["CPUExecutionProvider"])
+            lote_dinamico = not isinstance(sessao.get_inputs()[0].shape[0], int)
+            _modelos[chave] = (sessao, lote_dinamico)
+        return _modelos[chave]
+
+
+DETECTORES = {
+    DetectorHeuristico.nome: DetectorHeuristico,
+    DetectorYolo.nome: DetectorYolo,
+    DetectorOnnx.nome: DetectorOnnx,
+}
+
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+
+def detectores_disponiveis():
+    """Nomes dos motores que podem rodar neste ambiente."""
+    nomes = [DetectorHeuristico.nome]
+    if ultralytics_instalado() and os.path.exists(MODELO_YOLO):
+        nomes.append(DetectorYolo.nome)
+    if ort is not None and os.path.exists(MODELO_ONNX):
+        nomes.append(DetectorOnnx.nome)
+    return nomes
+
+
+def obter_detector(nome=None):
+    """
+    Devolve a instância (uma por processo) do motor pedido.
+    Se o motor não estiver disponível, cai para a heurística.
+    """
+    if isinstance(nome, Detector):
+        return nome
+    nome = nome or DETECTOR_PADRAO
+    if nome not in detectores_disponiveis():
+        if nome != DetectorHeuristico.nome:
+            print(f"⚠️ Detector '{nome}' indisponível. Usando heurística.")
+        nome = DetectorHeuristico.nome
+    with _instancias_lock:
+        if nome not in _instancias:
+            _instancias[nome] = DETECTORES[nome]()
+        return _instancias[nome]
@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.satellite_service import ZOOM_PADRAO, gerar_evidencia
+
+EVIDENCIAS_DIR = os.getenv("PVG_EVIDENCIAS_DIR", os.path.join("resultados", "evidencias"))
+# JPEG codifica ~10x mais rápido que WebP; use webp se o disco pesar mais que a CPU
+FORMATO_EVIDENCIA = os.getenv("PVG_EVIDENCIA_FORMATO", "jpeg").lower()
+QUALIDADE_EVIDENCIA = int(os.getenv("PVG_EVIDENCIA_QUALIDADE", "85"))
+LADO_MINIATURA = int(os.getenv("PVG_MINIATURA_PX", "320"))
+# Gravações em segundo plano (a codificação do Pillow libera o GIL)
+THREADS_GRAVACAO = int(os.getenv("PVG_EVIDENCIA_THREADS", "2"))
+
+_EXTENSOES = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def slug(texto):
+    return re.sub(r'[^a-zA-Z0-9_-]+', '_', str(texto)).strip('_') or 'sem_nome'
+
+
+class ArmazemEvidencias:
+    """
+    Imagens de evidência em disco, chaveadas por job, subestação e id do ponto
+    (o mesmo ponto em jobs com detectores diferentes tem evidências diferentes).
+    Cada ponto tem a imagem anotada comprimida e uma miniatura WebP; os resultados
+    guardam só os caminhos. A galeria carrega miniaturas e o laboratório a imagem cheia.
+    """
+
+    def __init__(self, raiz=EVIDENCIAS_DIR, formato=FORMATO_EVIDENCIA, qualidade=QUALIDADE_EVIDENCIA,
+                 lado_miniatura=LADO_MINIATURA):
+        self.raiz = raiz
+        self.formato = formato if formato in _EXTENSOES else 'jpeg'
+        self.qualidade = qualidade
+        self.lado_miniatura = lado_miniatura
+        self._executor = ThreadPoolExecutor(max_workers=THREADS_GRAVACAO)
+        self._pendentes = deque()
+        # Evidências geradas sob demanda (tile + desenho), fora da renderização da página
+        self._geracao = ThreadPoolExecutor(max_workers=THREADS_GRAVACAO)
+        self._gerando = {}
+        self._lock = threading.Lock()
+
+    def caminhos(self, ponto_id, subpasta=None, job_id=None):
+        """(imagem, miniatura) do ponto em <raiz>/<job>/<subestação>; determinístico, existindo ou não."""
+        pasta = os.path.join(self.raiz, *[slug(p) for p in (job_id, subpasta) if p])
+        nome = slug(ponto_id)
+        return (os.path.join(pasta, f"{nome}.{_EXTENSOES[self.formato]}"),
+                os.path.join(pasta, "miniaturas", f"{nome}.webp"))
+
+    def existe(self, ponto_id, subpasta=None, job_id=None):
+        return all(os.path.exists(c) for c in self.caminhos(ponto_id, subpasta, job_id))
+
+    def guardar(self, ponto_id, img, subpasta=None, job_id=None, esperar=False):
+        """
+        Agenda a gravação da imagem (PIL) e da miniatura e devolve os dois caminhos.
+        A fila é limitada: com muitas gravações em voo, espera a mais antiga.
+        """
+        caminho, miniatura = self.caminhos(ponto_id, subpasta, job_id)
+        futuro = self._executor.submit(self._gravar, img, caminho, miniatura)
+        with self._lock:
+            self._pendentes.append(futuro)
+            antigos = []
+            while len(self._pendentes) > THREADS_GRAVACAO * 4:
+                antigos.append(self._pendentes.popleft())
+        for f in antigos:
+            f.result()
+        if esperar:
+            futuro.result()
+        return caminho, miniatura
+
+    def agendar(self, ponto_id, gerar_img, subpasta=None, job_id=None):
+        """
+        Gera (gerar_img() -> PIL, pode baixar o tile) e grava a evidência em segundo plano,
+        uma vez por ponto mesmo com vários reruns pedindo. Devolve o futuro.
+        """
+        caminho, miniatura = self.caminhos(ponto_id, subpasta, job_id)
+        with self._lock:
+            futuro = self._gerando.get(caminho)
+            if futuro is None:
+                futuro = self._gerando[caminho] = self._geracao.submit(self._gerar, gerar_img, caminho, miniatura)
+        return futuro
+
+    def _gerar(self, gerar_img, caminho, miniatura):
+        try:
+            self._gravar(gerar_img(), caminho, miniatura)
+        except Exception as e:
+            print(f"Evidência não gerada ({caminho}): {e}")
+        finally:
+            with self._lock:
+                self._gerando.pop(caminho, None)
+
+    def _gravar(self, img, caminho, miniatura):
+        img = img.convert('RGB')
+        _salvar_atomico(img, caminho, self.formato.upper(), quality=self.qualidade)
+        mini = img.reduce(max(1, max(img.size) // self.lado_miniatura))
+        mini.thumbnail((self.lado_miniatura, self.lado_miniatura))
+        _salvar_atomico(mini, miniatura, 'WEBP', quality=75)
+
+    def descarregar(self):
+        """Espera todas as gravações pendentes."""
+        with self._lock:
+            pendentes, self._pendentes = list(self._pendentes), deque()
+        for f in pendentes:
+            f.result()
+
+
+def _salvar_atomico(img, caminho, formato, **opcoes):
+    # Grava num temporário e renomeia: quem lê nunca vê arquivo pela metade
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    img.save(temporario, formato, **opcoes)
+    os.replace(temporario, caminho)
+
+
+def garantir_evidencia(armazem, linha, job_id=None, esperar=True):
+    """
+    Caminhos (imagem, miniatura) de uma linha de resultado do job.
+    Pontos gravados sem evidência (ex.: negativos) têm a imagem gerada uma única vez,
+    a partir do tile em cache e das caixas salvas. Com esperar=False (galeria), a geração,
+    que pode baixar o tile, fica em segundo plano e a função devolve (None, None) até terminar.
+    """
+    subpasta = linha.get('subestacao')
+    if linha.get('evidencia') and linha.get('miniatura') and os.path.exists(linha['miniatura']):
+        return linha['evidencia'], linha['miniatura']
+    if armazem.existe(linha['ponto_id'], subpasta, job_id):
+        return armazem.caminhos(linha['ponto_id'], subpasta, job_id)
+
+    def _gerar():
+        deteccoes = linha.get('deteccoes') or '[]'
+        if isinstance(deteccoes, str):
+            deteccoes = json.loads(deteccoes)
+        return gerar_evidencia(linha['lat'], linha['lon'], deteccoes, zoom=linha.get('zoom') or ZOOM_PADRAO)
+
+    if not esperar:
+        armazem.agendar(linha['ponto_id'], _gerar, subpasta, job_id)
+        return None, None
+    return armazem.guardar(linha['ponto_id'], _gerar(), subpasta, job_id, esperar=True)
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem_evidencias():
+    """Armazém padrão (PVG_EVIDENCIAS_DIR) compartilhado pelo processo."""
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            _armazem = ArmazemEvidencias()
+        return _armazem
@@ -0,0 +1,180 @@
+"""
+Execução de scans em segundo plano.
+
+O dashboard só submete e consulta: cada scan (busca de edificações, geração
+dos pontos e análise) roda numa thread do executor, até PVG_JOBS_SIMULTANEOS
+ao mesmo tempo, com o progresso gravado no SQLite dos jobs. Reruns e cliques
+no Streamlit não interrompem a varredura; cancelar deixa o job interrompido
+(retomável do último checkpoint).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.building_service import buscar_edificacoes_raio
+from src.services.job_store import STATUS_ERRO, obter_job_store
+from src.services.scan_service import criar_job_scan, iterar_job
+from src.utils.processing import prepare_scan_data
+
+JOBS_SIMULTANEOS = int(os.getenv("PVG_JOBS_SIMULTANEOS", "2"))
+# Execuções terminadas mantidas para o painel do dashboard (só fase, erro e vazão; os pontos ficam no SQLite)
+EXECUCOES_GUARDADAS = int(os.getenv("PVG_EXECUCOES_GUARDADAS", "20"))
+# Chaves da CLI/API -> modos do dashboard
+MODOS = {'edificacoes': "Edificações (OSM)", 'hex': "Grid Inteligente (H3)", 'grid': "Grid Regular (30 m)"}
+
+FASE_FILA = 'na_fila'
+FASE_PREPARANDO = 'preparando'
+FASE_ANALISANDO = 'analisando'
+FASE_CONCLUIDA = 'concluida'
+FASE_CANCELADA = 'cancelada'
+FASE_ERRO = 'erro'
+FASES_ATIVAS = (FASE_FILA, FASE_PREPARANDO, FASE_ANALISANDO)
+
+
+def preparar_pontos(lat, lon, modo, raio_km=0.3):
+    """Pontos de uma subestação no modo do dashboard (mesmo fluxo que rodava no botão INICIAR SCAN)."""
+    casas_df = None
+    if modo == "Edificações (OSM)":
+        casas_df = buscar_edificacoes_raio(lat, lon, radius_km=raio_km)
+    return prepare_scan_data(
+        lat, lon,
+        buildings=casas_df,
+        radius_km=raio_km,
+        use_buildings=(modo == "Edificações (OSM)"),
+        hexagonal=(modo == "Grid Inteligente (H3)"),
+        agrupar_tiles=True,
+        filtrar_ruas=(modo == "Grid Regular (30 m)")
+    )
+
+
+class ExecutorJobs:
+    """
+    Fila de scans do processo; o estado de cada execução (fase, erro, vazão) fica em memória e o
+    progresso e os pontos no SQLite. Só as EXECUCOES_GUARDADAS terminadas mais recentes são lembradas.
+    """
+
+    def __init__(self, simultaneos=JOBS_SIMULTANEOS):
+        self._executor = ThreadPoolExecutor(max_workers=simultaneos, thread_name_prefix="scan")
+        self._execucoes = {}
+        self._lock = threading.Lock()
+        self._submissao_lock = threading.Lock()
+
+    def _enfileirar(self, job_id, subestacao, preparar, hsv_config, detector, chave=None):
+        with self._lock:
+            atual = self._execucoes.get(job_id)
+            if atual and atual['fase'] in FASES_ATIVAS:
+                return job_id  # já está na fila ou rodando
+            execucao = {'fase': FASE_FILA, 'erro': None, 'subestacao': subestacao,
+                        'cancelar': threading.Event(), 'chave': chave}
+            # Reenfileirado (retomada) vai para o fim: recentes() segue a ordem de inserção
+            self._execucoes.pop(job_id, None)
+            self._execucoes[job_id] = execucao
+            self._esquecer_terminadas()
+        self._executor.submit(self._rodar, job_id, execucao, preparar, hsv_config, detector)
+        return job_id
+
+    def submeter_scan(self, subestacao, lat, lon, modo, hsv_config=None, detector=None, raio_km=0.3,
+                      origem='dashboard'):
+        """
+        Registra o job já (para quem submeteu acompanhar) e enfileira preparação + análise.
+        O mesmo scan já na fila ou rodando devolve o job existente em vez de baixar tudo de novo.
+        """
+        chave = (subestacao, round(float(lat), 6), round(float(lon), 6), modo, float(raio_km), detector,
+                 repr(hsv_config))
+        with self._submissao_lock:
+            with self._lock:
+                for job_id, execucao in self._execucoes.items():
+                    if execucao['fase'] in FASES_ATIVAS and execucao['chave'] == chave:
+                        return job_id
+            job_id = criar_job_scan([], {
+                'origem': origem, 'subestacao': subestacao, 'modo': modo, 'detector': detector,
+                'hsv_config': hsv_config, 'latitude': lat, 'longitude': lon, 'raio_km': raio_km,
+            })
+            return self._enfileirar(job_id, subestacao, lambda: preparar_pontos(lat, lon, modo, raio_km),
+                                    hsv_config, detector, chave)
+
+    def retomar(self, job_id, hsv_config=None, detector=None):
+        """Enfileira os pontos pendentes de um job interrompido."""
+        job = obter_job_store().obter_job(job_id)
+        return self._enfileirar(job_id, job['parametros'].get('subestacao') if job else None, None,
+                                hsv_config, detector)
+
+    def _rodar(self, job_id, execucao, preparar, hsv_config, detector):
+        store = obter_job_store()
+        try:
+            if preparar is not None:
+                execucao['fase'] = FASE_PREPARANDO
+                pontos = preparar()
+                if not pontos:
+                    raise ValueError("Nenhum ponto gerado para varredura.")
+                store.adicionar_pontos(job_id, execucao['subestacao'], pontos)
+                del pontos  # durante a análise a malha fica só no SQLite
+            if execucao['cancelar'].is_set():
+                execucao['fase'] = FASE_CANCELADA
+                return
+            execucao['fase'] = FASE_ANALISANDO
+            resultados = iterar_job(job_id, hsv_config=hsv_config, detector=detector, evidencias='positivas')
+            inicio, analisados = time.perf_counter(), 0
+            try:
+                for _ in resultados:
+                    analisados += 1
+                    if execucao['cancelar'].is_set():
+                        break
+            finally:
+                # Fecha o gerador: grava o checkpoint e marca o job (concluído ou interrompido)
+                resultados.close()
+                # Vazão desta execução (download + análise); o motor é dividido entre jobs simultâneos
+                decorrido = time.perf_counter() - inicio
+                execucao['imagens_s'] = analisados / decorrido if decorrido > 0 else 0.0
+            execucao['fase'] = FASE_CANCELADA if execucao['cancelar'].is_set() else FASE_CONCLUIDA
+        except Exception as e:
+            print(f"Erro no job {job_id}: {e}")
+            execucao['fase'], execucao['erro'] = FASE_ERRO, str(e)
+            store.marcar_status(job_id, STATUS_ERRO)
+
+    def cancelar(self, job_id):
+        with self._lock:
+            execucao = self._execucoes.get(job_id)
+        if execucao:
+            execucao['cancelar'].set()
+
+    def estado(self, job_id):
+        """
+        Fase, erro, progresso (do SQLite) e vazão em imagens/s (ao terminar a análise) da execução;
+        None se o job não passou por este processo.
+        """
+        with self._lock:
+            execucao = self._execucoes.get(job_id)
+        if execucao is None:
+            return None
+        return {'fase': execucao['fase'], 'erro': execucao['erro'], 'subestacao': execucao['subestacao'],
+                'imagens_s': execucao.get('imagens_s'), 'progresso': obter_job_store().progresso(job_id)}
+
+    def _esquecer_terminadas(self):
+        """Descarta as execuções terminadas mais antigas (chamado com o lock)."""
+        terminadas = [job_id for job_id, e in self._execucoes.items() if e['fase'] not in FASES_ATIVAS]
+        for job_id in terminadas[:max(0, len(terminadas) - EXECUCOES_GUARDADAS)]:
+            del self._execucoes[job_id]
+
+    def ativos(self):
+        with self._lock:
+            return [job_id for job_id, e in self._execucoes.items() if e['fase'] in FASES_ATIVAS]
+
+    def recentes(self):
+        """Execuções deste processo, das mais novas para as mais antigas."""
+        with self._lock:
+            return list(reversed(self._execucoes))
+
+
+_executor_jobs = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor_jobs():
+    """Executor compartilhado por todas as sessões do Streamlit (vive enquanto o processo viver)."""
+    global _executor_jobs
+    with _executor_lock:
+        if _executor_jobs is None:
+            _executor_jobs = ExecutorJobs()
+        return _executor_jobs
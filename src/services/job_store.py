@@ -0,0 +1,326 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOBS_DB = os.getenv("PVG_JOBS_DB", os.path.join("resultados", "jobs.sqlite"))
+# Checkpoint a cada N pontos ou a cada T segundos, o que vier primeiro
+CHECKPOINT_PONTOS = int(os.getenv("PVG_CHECKPOINT_PONTOS", "50"))
+CHECKPOINT_SEGUNDOS = float(os.getenv("PVG_CHECKPOINT_SEGUNDOS", "5"))
+
+STATUS_PENDENTE = 'pendente'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+STATUS_EXECUTANDO = 'executando'
+STATUS_INTERROMPIDO = 'interrompido'
+
+# Células grossas do grid hexagonal que foram subdivididas: as filhas carregam as detecções,
+# então a mãe fica fora de KPIs, exportações e cruzamentos (senão a mesma GD conta duas vezes)
+SQL_NAO_REFINADO = "NOT COALESCE(json_extract(resultado, '$.refinado'), 0)"
+
+
+class JobStore:
+    """
+    Manifesto persistente de jobs de scan (SQLite).
+    Cada job guarda a lista de pontos de prepare_scan_data com o status de cada um;
+    um job reiniciado processa só os pontos que ainda não foram concluídos.
+    """
+
+    def __init__(self, caminho=JOBS_DB):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(caminho, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL,
+                status TEXT NOT NULL,
+                parametros TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS pontos (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                subestacao TEXT,
+                ponto_id TEXT,
+                ponto TEXT NOT NULL,
+                status TEXT NOT NULL,
+                resultado TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                atualizado_em REAL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_pontos_status ON pontos(job_id, status);
+        """)
+        colunas = {c[1] for c in self._db.execute("PRAGMA table_info(pontos)")}
+        if 'ponto_id' not in colunas:
+            self._db.execute("ALTER TABLE pontos ADD COLUMN ponto_id TEXT")
+        # Mesmo ponto/célula vindo de subestações sobrepostas entra uma vez só no job
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_pontos_id ON pontos(job_id, ponto_id)")
+        self._db.commit()
+
+    def criar_job(self, parametros, pontos_por_subestacao):
+        """
+        Cria o manifesto do job.
+        pontos_por_subestacao: iterável de (nome_subestacao, lista de pontos de prepare_scan_data).
+        Pontos com id repetido (subestações sobrepostas) ficam só com a primeira subestação.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        agora = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, criado_em, atualizado_em, status, parametros) VALUES (?, ?, ?, ?, ?)",
+                (job_id, agora, agora, STATUS_PENDENTE, json.dumps(parametros, ensure_ascii=False, default=str))
+            )
+            self._db.commit()
+        for subestacao, pontos in pontos_por_subestacao:
+            self.adicionar_pontos(job_id, subestacao, pontos)
+        return job_id
+
+    def adicionar_pontos(self, job_id, subestacao, pontos):
+        """Acrescenta pontos ao fim do job (ignorando ids já presentes); devolve quantos entraram."""
+        with self._lock:
+            inicio = self._db.execute("SELECT COALESCE(MAX(idx), -1) + 1 FROM pontos WHERE job_id = ?",
+                                      (job_id,)).fetchone()[0]
+            linhas = [(job_id, inicio + i, subestacao, p.get('id'),
+                       json.dumps(_ponto_serializavel(p), ensure_ascii=False, default=str), STATUS_PENDENTE)
+                      for i, p in enumerate(pontos)]
+            antes = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pontos (job_id, idx, subestacao, ponto_id, ponto, status) "
+                "VALUES (?, ?, ?, ?, ?, ?)", linhas)
+            inseridos = self._db.total_changes - antes
+            self._db.execute("UPDATE jobs SET total = (SELECT COUNT(*) FROM pontos WHERE job_id = ?) WHERE id = ?",
+                             (job_id, job_id))
+            self._db.commit()
+        return inseridos
+
+    def obter_job(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, criado_em, atualizado_em, status, parametros, total FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def listar_jobs(self, apenas_incompletos=False):
+        sql = "SELECT id, criado_em, atualizado_em, status, parametros, total FROM jobs"
+        args = ()
+        if apenas_incompletos:
+            sql += " WHERE status != ?"
+            args = (STATUS_CONCLUIDO,)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY criado_em DESC", args).fetchall()
+        return [_job_dict(r) for r in rows]
+
+    def marcar_status(self, job_id, status):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, atualizado_em = ? WHERE id = ?",
+                             (status, time.time(), job_id))
+            self._db.commit()
+
+    def pontos_pendentes(self, job_id, limite=2000, depois_de=-1):
+        """
+        Próximo bloco de pontos não concluídos (pendentes ou com erro), em ordem de idx.
+        Cada ponto traz 'idx' e 'subestacao' além dos campos originais.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, subestacao, ponto FROM pontos WHERE job_id = ? AND status != ? AND idx > ? "
+                "ORDER BY idx LIMIT ?", (job_id, STATUS_CONCLUIDO, depois_de, limite)).fetchall()
+        pontos = []
+        for idx, subestacao, ponto in rows:
+            p = json.loads(ponto)
+            p['idx'], p['subestacao'] = idx, subestacao
+            pontos.append(p)
+        return pontos
+
+    def registrar(self, job_id, registros):
+        """Grava um lote de (idx, status, linha_resultado) numa única transação (checkpoint)."""
+        agora = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE pontos SET status = ?, resultado = ?, tentativas = tentativas + 1, atualizado_em = ? "
+                "WHERE job_id = ? AND idx = ?",
+                [(status, json.dumps(linha, ensure_ascii=False, default=str), agora, job_id, idx)
+                 for idx, status, linha in registros])
+            self._db.execute("UPDATE jobs SET atualizado_em = ? WHERE id = ?", (agora, job_id))
+            self._db.commit()
+
+    def resultados(self, job_id, status=STATUS_CONCLUIDO, limite=-1, deslocamento=0, apenas_gd=False):
+        """
+        Linhas de resultado já gravadas (sem imagem), em ordem de idx; limite/deslocamento paginam.
+        Células refinadas ficam de fora (valem as filhas).
+        """
+        sql = f"SELECT resultado FROM pontos WHERE job_id = ? AND status = ? AND {SQL_NAO_REFINADO}"
+        if apenas_gd:
+            sql += " AND json_extract(resultado, '$.tem_gd')"
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY idx LIMIT ? OFFSET ?",
+                                    (job_id, status, limite, deslocamento)).fetchall()
+        return [json.loads(r[0]) for r in rows if r[0]]
+
+    def resultados_desde(self, job_id, cursor=(0.0, -1), limite=500, apenas_gd=False):
+        """
+        Resultados gravados depois do cursor (atualizado_em, idx), na ordem de gravação.
+        Para acompanhar um job em andamento: os pontos terminam fora de ordem de idx,
+        mas cada checkpoint grava com um horário maior que o anterior.
+        Devolve (linhas, novo cursor).
+        """
+        sql = ("SELECT atualizado_em, idx, resultado FROM pontos WHERE job_id = ? AND status = ? "
+               f"AND {SQL_NAO_REFINADO} AND (atualizado_em > ? OR (atualizado_em = ? AND idx > ?))")
+        if apenas_gd:
+            sql += " AND json_extract(resultado, '$.tem_gd')"
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY atualizado_em, idx LIMIT ?",
+                                    (job_id, STATUS_CONCLUIDO, cursor[0], cursor[0], cursor[1], limite)).fetchall()
+        if not rows:
+            return [], cursor
+        return [json.loads(r[2]) for r in rows if r[2]], (rows[-1][0], rows[-1][1])
+
+    def resumo_por_subestacao(self, job_id):
+        """KPIs de resumo() agrupados por subestação, mais a contagem de pontos por status."""
+        conta = f"status = ? AND {SQL_NAO_REFINADO}"
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT subestacao, COUNT(*), SUM(status = ?), SUM(status = ?), "
+                f"COALESCE(SUM(CASE WHEN {conta} THEN "
+                "COALESCE(json_extract(resultado, '$.n_edificacoes'), 1) END), 0), "
+                f"COALESCE(SUM(CASE WHEN {conta} THEN COALESCE(json_extract(resultado, '$.edificacoes_gd'), "
+                "json_extract(resultado, '$.tem_gd')) END), 0), "
+                f"COALESCE(SUM(CASE WHEN {conta} THEN json_extract(resultado, '$.paineis_estimados') END), 0) "
+                "FROM pontos WHERE job_id = ? GROUP BY subestacao ORDER BY subestacao",
+                (STATUS_CONCLUIDO, STATUS_ERRO, STATUS_CONCLUIDO, STATUS_CONCLUIDO, STATUS_CONCLUIDO,
+                 job_id)).fetchall()
+        return [{
+            'subestacao': subestacao,
+            'pontos': total,
+            'concluidos': int(concluidos or 0),
+            'erros': int(erros or 0),
+            'analisados': int(analisados),
+            'com_gd': int(com_gd),
+            'paineis_estimados': float(paineis),
+        } for subestacao, total, concluidos, erros, analisados, com_gd, paineis in rows]
+
+    def situacao_pontos(self, job_id):
+        """{ponto_id: (status, tem_gd)} de todos os pontos do job, numa consulta (cores do mapa)."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT ponto_id, status, json_extract(resultado, '$.tem_gd') AND {SQL_NAO_REFINADO} "
+                "FROM pontos WHERE job_id = ?", (job_id,)).fetchall()
+        return {ponto_id: (status, bool(tem_gd)) for ponto_id, status, tem_gd in rows}
+
+    def pontos_do_job(self, job_id):
+        """Pontos do job para o mapa (id, latitude, longitude, coords, offsets), em ordem de idx."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ponto_id, json_extract(ponto, '$.latitude'), json_extract(ponto, '$.longitude'), "
+                "json_extract(ponto, '$.coords'), json_extract(ponto, '$.offsets') "
+                "FROM pontos WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return [{'id': ponto_id, 'latitude': lat, 'longitude': lon,
+                 'coords': json.loads(coords or '[]'), 'offsets': json.loads(offsets or '[0]')}
+                for ponto_id, lat, lon, coords, offsets in rows]
+
+    def pontos_mapa(self, job_id):
+        """(lat, lon, status, edificações com GD) de todos os pontos do job, extraídos no próprio SQLite."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT json_extract(ponto, '$.latitude'), json_extract(ponto, '$.longitude'), status, "
+                f"CASE WHEN {SQL_NAO_REFINADO} THEN COALESCE(json_extract(resultado, '$.edificacoes_gd'), "
+                "json_extract(resultado, '$.tem_gd'), 0) ELSE 0 END "
+                "FROM pontos WHERE job_id = ?", (job_id,)).fetchall()
+
+    def resumo(self, job_id):
+        """KPIs sobre todos os pontos concluídos do job (sem as células refinadas), calculados no próprio SQLite."""
+        with self._lock:
+            # Pontos 'tile' contam cada edificação coberta
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(COALESCE(json_extract(resultado, '$.n_edificacoes'), 1)), 0), "
+                "COALESCE(SUM(COALESCE(json_extract(resultado, '$.edificacoes_gd'), "
+                "json_extract(resultado, '$.tem_gd'))), 0), "
+                "COALESCE(SUM(json_extract(resultado, '$.paineis_estimados')), 0) "
+                f"FROM pontos WHERE job_id = ? AND status = ? AND {SQL_NAO_REFINADO}",
+                (job_id, STATUS_CONCLUIDO)).fetchone()
+            classes = self._db.execute(
+                "SELECT json_extract(resultado, '$.classe'), COUNT(*) FROM pontos "
+                f"WHERE job_id = ? AND status = ? AND {SQL_NAO_REFINADO} GROUP BY 1",
+                (job_id, STATUS_CONCLUIDO)).fetchall()
+        return {
+            'analisados': row[0],
+            'com_gd': int(row[1]),
+            'paineis_estimados': float(row[2]),
+            'por_classe': {c: n for c, n in classes if c},
+        }
+
+    def progresso(self, job_id):
+        """Contagem de pontos por status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM pontos WHERE job_id = ? GROUP BY status",
+                                    (job_id,)).fetchall()
+        contagem = {STATUS_PENDENTE: 0, STATUS_CONCLUIDO: 0, STATUS_ERRO: 0}
+        contagem.update(dict(rows))
+        contagem['total'] = sum(contagem[s] for s in (STATUS_PENDENTE, STATUS_CONCLUIDO, STATUS_ERRO))
+        return contagem
+
+    def checkpoint(self, job_id):
+        return Checkpoint(self, job_id)
+
+
+class Checkpoint:
+    """Acumula resultados e grava no SQLite a cada CHECKPOINT_PONTOS ou CHECKPOINT_SEGUNDOS."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self._pendentes = []
+        self._ultimo = time.monotonic()
+
+    def registrar(self, idx, status, linha):
+        self._pendentes.append((idx, status, linha))
+        if len(self._pendentes) >= CHECKPOINT_PONTOS or time.monotonic() - self._ultimo >= CHECKPOINT_SEGUNDOS:
+            self.gravar()
+
+    def gravar(self):
+        if self._pendentes:
+            self.store.registrar(self.job_id, self._pendentes)
+            self._pendentes = []
+        self._ultimo = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.gravar()
+
+
+def _ponto_serializavel(ponto):
+    return {k: v for k, v in ponto.items() if k not in ('idx', 'subestacao')}
+
+
+def _job_dict(row):
+    return {
+        'id': row[0],
+        'criado_em': row[1],
+        'atualizado_em': row[2],
+        'status': row[3],
+        'parametros': json.loads(row[4]),
+        'total': row[5],
+    }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def obter_job_store():
+    """Store compartilhado pelo processo."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
@@ -1,12 +1,9 @@
-import requests
 import pandas as pd
-import streamlit as st
 
-try:
-    import geopandas as gpd
-    from shapely.geometry import LineString
-except ImportError:
-    gpd = None
+from src.services.osm_store import obter_base_osm
+from src.services.overpass_client import obter_cliente_overpass
+from src.services.road_index import mascara_na_rua
+from src.services.service_cache import memoizar
 
 # --- DADOS DE EMERGÊNCIA (MOCK) ---
 MOCK_SUBESTACOES = [
@@ -15,17 +12,35 @@ MOCK_SUBESTACOES = [
 ]
 
 
-@st.cache_data(ttl=3600)
 def buscar_subestacoes_osm(cidade="Aracaju"):
     """
     Busca subestações. Se der erro de conexão ou JSON vazio, retorna dados de demonstração.
+    Com a base OSM local, devolve as subestações do município no extrato ingerido;
+    cidade fora do extrato segue para o Overpass.
     """
-    servers = [
-        "https://overpass-api.de/api/interpreter",
-        "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
-        "https://overpass.kumi.systems/api/interpreter"
-    ]
+    base = obter_base_osm()
+    if base is not None:
+        if not base.tem_municipios:
+            print("⚠️ Base OSM sem municípios (ingerida por uma versão antiga): reingira o extrato para "
+                  "filtrar por cidade. Usando todas as subestações do extrato.")
+            return base.subestacoes()
+        subestacoes = base.subestacoes(cidade)
+        if not subestacoes.empty:
+            return subestacoes
 
+    try:
+        subestacoes = _subestacoes_overpass(cidade)
+        if not subestacoes.empty:
+            return subestacoes
+    except Exception as e:
+        print(f"Erro OSM: {e}")
+
+    print("⚠️ API OSM falhou. Usando dados de demonstração.")
+    return pd.DataFrame(MOCK_SUBESTACOES)
+
+
+@memoizar('subestacoes', ttl_s=3600, guardar_se=lambda df: not df.empty)
+def _subestacoes_overpass(cidade):
     query = f"""
     [out:json][timeout:15];
     area["name"="{cidade}"]->.searchArea;
@@ -36,52 +51,35 @@ def buscar_subestacoes_osm(cidade="Aracaju"):
     );
     out center;
     """
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Referer': 'https://www.google.com/'
-    }
-
-    for server in servers:
-        try:
-            response = requests.get(server, params={'data': query}, headers=headers, timeout=10)
-
-            if response.status_code == 200 and len(response.content) > 0:
-                try:
-                    data = response.json()
-                    subestacoes = []
-
-                    if 'elements' in data:
-                        for el in data['elements']:
-                            lat = el.get('lat') or el.get('center', {}).get('lat')
-                            lon = el.get('lon') or el.get('center', {}).get('lon')
-                            if lat and lon:
-                                subestacoes.append({
-                                    'Nome': el.get('tags', {}).get('name', 'Subestação Sem Nome'),
-                                    'latitude': lat,
-                                    'longitude': lon,
-                                    'Tipo': 'Real'
-                                })
-
-                        if subestacoes:
-                            return pd.DataFrame(subestacoes)
-                except ValueError:
-                    continue
-        except Exception:
-            continue
-
-    print("⚠️ API OSM falhou. Usando dados de demonstração.")
-    return pd.DataFrame(MOCK_SUBESTACOES)
-
-
-@st.cache_data(ttl=3600)
-def buscar_ruas_box(lat_min, lon_min, lat_max, lon_max):
+    subestacoes = []
+    # Sem o cache de 24 h do cliente: quem controla a validade é o TTL do serviço
+    for el in obter_cliente_overpass().consultar(query).get('elements', []):
+        lat = el.get('lat') or el.get('center', {}).get('lat')
+        lon = el.get('lon') or el.get('center', {}).get('lon')
+        if lat and lon:
+            subestacoes.append({
+                'Nome': el.get('tags', {}).get('name', 'Subestação Sem Nome'),
+                'latitude': lat,
+                'longitude': lon,
+                'Tipo': 'Real'
+            })
+    return pd.DataFrame(subestacoes)
+
+
+def baixar_ruas(lat_min, lon_min, lat_max, lon_max):
     """
-    Tenta baixar ruas. Se falhar, retorna vazio e segue a vida.
+    Polilinhas de pares (lon, lat) das ruas na caixa.
+    Levanta erro se o Overpass falhar (a falha não fica no cache).
     """
-    if gpd is None: return None  # Se não tiver geopandas, aborta
+    base = obter_base_osm()
+    if base is not None:
+        return base.ruas_caixa(lat_min, lon_min, lat_max, lon_max)
+    return _ruas_overpass(lat_min, lon_min, lat_max, lon_max)
+
 
-    overpass_url = "https://overpass-api.de/api/interpreter"
+# Caixas de tile fixas (road_index): muitas entradas pequenas, em tuplas (imutáveis, o hit não copia)
+@memoizar('ruas', ttl_s=3600, max_entradas=512, copiar=False)
+def _ruas_overpass(lat_min, lon_min, lat_max, lon_max):
     query = f"""
     [out:json][timeout:15];
     (
@@ -89,53 +87,29 @@ def buscar_ruas_box(lat_min, lon_min, lat_max, lon_max):
     );
     out geom;
     """
-    try:
-        response = requests.get(overpass_url, params={'data': query}, timeout=20)
-        if response.status_code == 200 and len(response.content) > 0:
-            data = response.json()
-            ruas = []
-            for element in data.get('elements', []):
-                if 'geometry' in element:
-                    coords = [(pt['lon'], pt['lat']) for pt in element['geometry']]
-                    if len(coords) > 1:
-                        ruas.append(LineString(coords))
-            if ruas:
-                return gpd.GeoDataFrame(geometry=ruas, crs="EPSG:4326")
-    except:
-        pass
-    return gpd.GeoDataFrame()
+    ruas = []
+    for element in obter_cliente_overpass().consultar(query).get('elements', []):
+        if 'geometry' in element:
+            coords = tuple((pt['lon'], pt['lat']) for pt in element['geometry'])
+            if len(coords) > 1:
+                ruas.append(coords)
+    return tuple(ruas)
 
 
 def filtrar_pontos_em_ruas(lista_pontos):
     """
-    Se geopandas funcionar, filtra ruas. Se não, devolve a lista original.
+    Remove os pontos que caem sobre ruas (faixa de PVG_BUFFER_RUAS_M metros).
+    As ruas vêm por tile fixo e o índice de cada tile é montado uma vez por processo,
+    então o custo por chamada é só o teste vetorizado dos pontos.
     """
-    if not lista_pontos or gpd is None:
+    if not lista_pontos:
         return lista_pontos
 
     try:
-        df_pontos = pd.DataFrame(lista_pontos)
-        gdf_pontos = gpd.GeoDataFrame(
-            df_pontos,
-            geometry=gpd.points_from_xy(df_pontos.longitude, df_pontos.latitude),
-            crs="EPSG:4326"
-        )
-
-        bounds = gdf_pontos.total_bounds
-        gdf_ruas = buscar_ruas_box(bounds[1] - 0.002, bounds[0] - 0.002, bounds[3] + 0.002, bounds[2] + 0.002)
-
-        if gdf_ruas is None or gdf_ruas.empty:
-            return lista_pontos
-
-        # Filtro Espacial
-        gdf_zonas_rua = gdf_ruas.to_crs(epsg=3857).buffer(8).to_crs(epsg=4326)
-        gdf_zonas_rua = gpd.GeoDataFrame(geometry=gdf_zonas_rua, crs="EPSG:4326")
-
-        pontos_nas_ruas = gpd.sjoin(gdf_pontos, gdf_zonas_rua, how="inner", predicate="intersects")
-        gdf_limpo = gdf_pontos[~gdf_pontos.index.isin(pontos_nas_ruas.index)]
-
-        return gdf_limpo.drop(columns='geometry').to_dict('records')
+        na_rua = mascara_na_rua([p['latitude'] for p in lista_pontos],
+                                [p['longitude'] for p in lista_pontos], baixar_ruas)
+        return [p for p, fora in zip(lista_pontos, (~na_rua).tolist()) if fora]
 
     except Exception as e:
         print(f"Erro filtro ruas: {e}")
-        return lista_pontos
\ No newline at end of file
+        return lista_pontos
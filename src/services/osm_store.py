@@ -0,0 +1,294 @@
+"""
+Base OSM local: um extrato regional (.osm.pbf ou GeoJSON) ingerido uma vez num
+armazenamento colunar em disco, consultado no lugar do Overpass.
+
+Cada camada é um conjunto de arrays .npy (abertos com mmap): colunas por feição
+(id, centroide, área...) e as geometrias em arrays planos com offsets
+(ver src.utils.geometria). Edificações guardam o polígono real e a área em m²;
+subestações guardam o município (limite administrativo do extrato que as contém).
+
+    python -m src.cli ingerir-osm sergipe-latest.osm.pbf
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from src.utils.geometria import anel_de_cada_ponto, area_poligonos_m2, caixas, centroides, empacotar, recortar
+from src.utils.spatial_index import IndiceEspacial
+
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+OSM_DIR = os.getenv("PVG_OSM_DIR", os.path.join("data", "osm"))
+# Mesmas classes de via que o filtro de ruas pedia ao Overpass
+CLASSES_RUAS = {'primary', 'secondary', 'tertiary', 'residential'}
+# admin_level dos municípios no OSM (8 no Brasil)
+NIVEL_MUNICIPIO = os.getenv("PVG_OSM_NIVEL_MUNICIPIO", "8")
+
+
+def normalizar_nome(texto):
+    """Nome comparável: sem acentos, minúsculo e sem espaços nas pontas ("São Cristóvão" == "sao cristovao")."""
+    sem_acento = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode('ascii')
+    return sem_acento.strip().lower()
+
+
+# --- Leitura dos extratos ---
+
+class _Coletor:
+    """Acumula as feições de interesse já no formato das camadas."""
+
+    def __init__(self):
+        self.edificacoes = {'id': [], 'geometria': []}
+        self.subestacoes = {'id': [], 'nome': [], 'cidade': [], 'geometria': []}
+        self.ruas = {'id': [], 'geometria': []}
+        self.municipios = {'nome': [], 'geometria': []}
+
+    def adicionar(self, osm_id, tags, geometria, fechada):
+        if not geometria:
+            return
+        if tags.get('building', 'no') != 'no' and fechada and len(geometria) >= 3:
+            self.edificacoes['id'].append(osm_id)
+            self.edificacoes['geometria'].append(geometria)
+        if tags.get('power') == 'substation':
+            self.subestacoes['id'].append(osm_id)
+            self.subestacoes['nome'].append(tags.get('name') or 'Subestação Sem Nome')
+            self.subestacoes['cidade'].append(tags.get('addr:city') or '')
+            self.subestacoes['geometria'].append(geometria)
+        if tags.get('highway') in CLASSES_RUAS and not fechada and len(geometria) >= 2:
+            self.ruas['id'].append(osm_id)
+            self.ruas['geometria'].append(geometria)
+        if (tags.get('boundary') == 'administrative' and str(tags.get('admin_level')) == NIVEL_MUNICIPIO
+                and tags.get('name') and fechada and len(geometria) >= 3):
+            self.municipios['nome'].append(tags['name'])
+            self.municipios['geometria'].append(geometria)
+
+
+def _id_numerico(valor, padrao):
+    # osmtogeojson usa "way/123"; outros exportadores, o número puro
+    try:
+        return int(str(valor).rsplit('/', 1)[-1])
+    except ValueError:
+        return padrao
+
+
+def _ler_geojson(caminho, coletor):
+    with open(caminho, encoding='utf-8') as f:
+        dados = json.load(f)
+    for i, feicao in enumerate(dados.get('features', [])):
+        tags = feicao.get('properties') or {}
+        geo = feicao.get('geometry') or {}
+        osm_id = _id_numerico(tags.get('@id') or tags.get('osm_id') or feicao.get('id'), i)
+        tipo, coords = geo.get('type'), geo.get('coordinates') or []
+        # GeoJSON é [lon, lat]; as camadas guardam [lat, lon] como o resto do projeto
+        if tipo == 'Point':
+            coletor.adicionar(osm_id, tags, [[coords[1], coords[0]]], False)
+        elif tipo == 'LineString':
+            coletor.adicionar(osm_id, tags, [[c[1], c[0]] for c in coords], False)
+        elif tipo == 'MultiLineString':
+            for linha in coords:
+                coletor.adicionar(osm_id, tags, [[c[1], c[0]] for c in linha], False)
+        elif tipo == 'Polygon' and coords:
+            coletor.adicionar(osm_id, tags, [[c[1], c[0]] for c in coords[0]], True)
+        elif tipo == 'MultiPolygon':
+            for poligono in coords:
+                if poligono:
+                    coletor.adicionar(osm_id, tags, [[c[1], c[0]] for c in poligono[0]], True)
+
+
+def _ler_pbf(caminho, coletor):
+    if osmium is None:
+        raise RuntimeError("pyosmium não instalado: pip install osmium (ou converta o extrato para GeoJSON)")
+
+    class _Leitor(osmium.SimpleHandler):
+        def node(self, n):
+            if n.tags.get('power') == 'substation':
+                coletor.adicionar(n.id, dict(n.tags), [[n.location.lat, n.location.lon]], False)
+
+        def way(self, w):
+            tags = w.tags
+            if 'building' not in tags and 'highway' not in tags and 'power' not in tags:
+                return
+            try:
+                geometria = [[n.lat, n.lon] for n in w.nodes]
+            except osmium.InvalidLocationError:
+                return
+            coletor.adicionar(w.id, dict(tags), geometria, w.is_closed())
+
+        def area(self, a):
+            # Limites municipais são relações: o osmium monta os anéis externos
+            if a.from_way() or a.tags.get('boundary') != 'administrative':
+                return
+            for anel in a.outer_rings():
+                coletor.adicionar(a.orig_id(), dict(a.tags), [[n.lat, n.lon] for n in anel], True)
+
+    _Leitor().apply_file(caminho, locations=True)
+
+
+# --- Escrita ---
+
+def _salvar_camada(pasta, nome, colunas):
+    for coluna, valores in colunas.items():
+        np.save(os.path.join(pasta, f"{nome}_{coluna}.npy"), valores, allow_pickle=False)
+
+
+def ingerir_extrato(caminho, destino=OSM_DIR):
+    """Lê o extrato e (re)escreve a base local. Devolve o manifesto."""
+    inicio = time.time()
+    coletor = _Coletor()
+    if caminho.endswith('.pbf'):
+        _ler_pbf(caminho, coletor)
+    else:
+        _ler_geojson(caminho, coletor)
+
+    temporario = f"{destino}.tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    coords, offsets = empacotar(coletor.edificacoes['geometria'])
+    lat, lon = centroides(coords, offsets)
+    _salvar_camada(temporario, 'edificacoes', {
+        'id': np.asarray(coletor.edificacoes['id'], dtype=np.int64),
+        'lat': lat, 'lon': lon,
+        'area_m2': area_poligonos_m2(coords, offsets).astype(np.float32),
+        'coords': coords, 'offsets': offsets,
+    })
+
+    coords, offsets = empacotar(coletor.subestacoes['geometria'])
+    lat, lon = centroides(coords, offsets)
+    # Município: o limite administrativo que contém a subestação; sem limite no extrato, a tag addr:city
+    dentro = anel_de_cada_ponto(lat, lon, *empacotar(coletor.municipios['geometria']))
+    nomes_municipios = np.asarray(coletor.municipios['nome'] + [''], dtype=object)
+    cidades = np.asarray(coletor.subestacoes['cidade'], dtype=object)
+    municipio = np.where(dentro >= 0, nomes_municipios[dentro], cidades)
+    _salvar_camada(temporario, 'subestacoes', {
+        'id': np.asarray(coletor.subestacoes['id'], dtype=np.int64),
+        'nome': np.asarray(coletor.subestacoes['nome'], dtype=str),
+        'municipio': np.asarray([normalizar_nome(m) for m in municipio], dtype=str),
+        'lat': lat, 'lon': lon,
+    })
+
+    coords, offsets = empacotar(coletor.ruas['geometria'])
+    _salvar_camada(temporario, 'ruas', {
+        'id': np.asarray(coletor.ruas['id'], dtype=np.int64),
+        'caixa': caixas(coords, offsets).T.copy(),
+        'coords': coords, 'offsets': offsets,
+    })
+
+    manifesto = {
+        'fonte': os.path.abspath(caminho),
+        'criado_em': time.time(),
+        'edificacoes': len(coletor.edificacoes['id']),
+        'subestacoes': len(coletor.subestacoes['id']),
+        'ruas': len(coletor.ruas['id']),
+        'municipios': len(set(coletor.municipios['nome'])),
+        'segundos': round(time.time() - inicio, 1),
+    }
+    with open(os.path.join(temporario, "manifesto.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+
+    # Troca a pasta inteira: quem está lendo nunca vê uma base pela metade
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporario, destino)
+    return manifesto
+
+
+# --- Consulta ---
+
+def edificacoes_df(ids, centro_lat, centro_lon, area_m2, coords, offsets):
+    """
+    DataFrame id, centro_lat, centro_lon, area_m2, inicio, fim. Os polígonos ficam planos em
+    df.attrs['coords'] (N x 2, [lat, lon]): o da linha é coords[inicio:fim], sem listas por linha.
+    """
+    df = pd.DataFrame({
+        'id': ids,
+        'centro_lat': centro_lat,
+        'centro_lon': centro_lon,
+        'area_m2': area_m2,
+        'inicio': offsets[:-1],
+        'fim': offsets[1:],
+    }, columns=['id', 'centro_lat', 'centro_lon', 'area_m2', 'inicio', 'fim'])
+    df.attrs['coords'] = coords
+    return df
+
+
+class BaseOSM:
+    """Consultas locais às camadas ingeridas (mesmos formatos dos serviços Overpass)."""
+
+    def __init__(self, pasta=OSM_DIR):
+        self.pasta = pasta
+        with open(os.path.join(pasta, "manifesto.json"), encoding="utf-8") as f:
+            self.manifesto = json.load(f)
+        self._indice_edificacoes = None
+        self._lock = threading.Lock()
+
+    def _coluna(self, camada, coluna):
+        return np.load(os.path.join(self.pasta, f"{camada}_{coluna}.npy"), mmap_mode='r', allow_pickle=False)
+
+    def _indice(self):
+        with self._lock:
+            if self._indice_edificacoes is None:
+                self._indice_edificacoes = IndiceEspacial(self._coluna('edificacoes', 'lat'),
+                                                          self._coluna('edificacoes', 'lon'))
+            return self._indice_edificacoes
+
+    def edificacoes_raio(self, lat, lon, radius_km=0.5):
+        """Edificações no raio (formato de edificacoes_df): só os polígonos delas saem do mmap."""
+        posicoes = self._indice().no_raio(lat, lon, radius_km * 1000)
+        coords, offsets = recortar(self._coluna('edificacoes', 'coords'), self._coluna('edificacoes', 'offsets'),
+                                   posicoes)
+        return edificacoes_df(self._coluna('edificacoes', 'id')[posicoes],
+                              self._coluna('edificacoes', 'lat')[posicoes],
+                              self._coluna('edificacoes', 'lon')[posicoes],
+                              self._coluna('edificacoes', 'area_m2')[posicoes].astype(float), coords, offsets)
+
+    @property
+    def tem_municipios(self):
+        """Bases ingeridas antes do filtro por cidade não têm a coluna de município."""
+        return 'municipios' in self.manifesto
+
+    def subestacoes(self, cidade=None):
+        """Subestações do extrato (Nome, latitude, longitude, Tipo); com cidade, só as do município."""
+        df = pd.DataFrame({
+            'Nome': self._coluna('subestacoes', 'nome'),
+            'latitude': self._coluna('subestacoes', 'lat'),
+            'longitude': self._coluna('subestacoes', 'lon'),
+            'Tipo': 'OSM local',
+        })
+        if cidade is None or not self.tem_municipios:
+            return df
+        do_municipio = self._coluna('subestacoes', 'municipio') == normalizar_nome(cidade)
+        return df[do_municipio].reset_index(drop=True)
+
+    def ruas_caixa(self, lat_min, lon_min, lat_max, lon_max):
+        """Polilinhas [[lon, lat], ...] das ruas que tocam a caixa (formato de baixar_ruas)."""
+        caixa = self._coluna('ruas', 'caixa')
+        tocam = np.nonzero((caixa[:, 0] <= lat_max) & (caixa[:, 2] >= lat_min) &
+                           (caixa[:, 1] <= lon_max) & (caixa[:, 3] >= lon_min))[0]
+        coords, offsets = self._coluna('ruas', 'coords'), self._coluna('ruas', 'offsets')
+        return [np.asarray(coords[offsets[i]:offsets[i + 1]])[:, ::-1].tolist() for i in tocam.tolist()]
+
+
+_base = None
+_base_versao = None
+_base_lock = threading.Lock()
+
+
+def obter_base_osm():
+    """Base local (PVG_OSM_DIR) ou None se nenhum extrato foi ingerido; recarrega após nova ingestão."""
+    global _base, _base_versao
+    try:
+        versao = os.path.getmtime(os.path.join(OSM_DIR, "manifesto.json"))
+    except OSError:
+        return None
+    with _base_lock:
+        if _base is None or versao != _base_versao:
+            _base, _base_versao = BaseOSM(OSM_DIR), versao
+        return _base
@@ -0,0 +1,146 @@
+"""
+Cliente Overpass compartilhado pelos serviços OSM.
+
+- Sessão HTTP com pool de conexões (keep-alive) para todos os espelhos.
+- Corrida entre espelhos: a consulta vai para todos ao mesmo tempo e vale a
+  primeira resposta boa; as outras são abandonadas no meio do download.
+- Espelho que falhou fica de castigo por um tempo e sai das próximas corridas.
+- Novas rodadas com backoff exponencial (respeitando Retry-After).
+
+O cliente não guarda respostas: o cache (memória + disco, TTL por serviço) é o de
+service_cache, nas funções dos serviços que montam as consultas.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.utils.http import criar_sessao
+
+SERVIDORES_PADRAO = (
+    "https://overpass-api.de/api/interpreter",
+    "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+)
+OVERPASS_URLS = [u.strip() for u in os.getenv("PVG_OVERPASS_URLS", ",".join(SERVIDORES_PADRAO)).split(",")
+                 if u.strip()]
+OVERPASS_TENTATIVAS = int(os.getenv("PVG_OVERPASS_TENTATIVAS", "3"))
+# (conexão, leitura): espelho fora do ar falha em segundos, não no timeout de leitura
+OVERPASS_TIMEOUT = (3.05, float(os.getenv("PVG_OVERPASS_TIMEOUT", "25")))
+OVERPASS_CASTIGO_S = float(os.getenv("PVG_OVERPASS_CASTIGO_S", "60"))
+BACKOFF_BASE_S = 1.0
+USER_AGENT = os.getenv("PVG_USER_AGENT", "PlataformaVarreduraGeoespacial/1.0")
+
+
+class ErroOverpass(RuntimeError):
+    """Nenhum espelho devolveu resposta válida depois de todas as tentativas."""
+
+
+class _Falha(Exception):
+    def __init__(self, mensagem, espera=None):
+        super().__init__(mensagem)
+        self.espera = espera
+
+
+class ClienteOverpass:
+    def __init__(self, servidores=None, tentativas=OVERPASS_TENTATIVAS, timeout=OVERPASS_TIMEOUT):
+        self.servidores = list(servidores or OVERPASS_URLS)
+        self.tentativas = tentativas
+        self.timeout = timeout
+        self.sessao = criar_sessao(max(4, len(self.servidores) * 2))
+        self.sessao.headers['User-Agent'] = USER_AGENT
+        self._executor = ThreadPoolExecutor(max_workers=max(2, len(self.servidores) * 2))
+        self._castigo = {}
+        self._lock = threading.Lock()
+
+    # --- Corrida entre espelhos ---
+
+    def _candidatos(self):
+        """Espelhos fora do castigo; se todos estiverem, tenta todos mesmo assim."""
+        agora = time.monotonic()
+        with self._lock:
+            livres = [s for s in self.servidores if self._castigo.get(s, 0) <= agora]
+        return livres or list(self.servidores)
+
+    def _castigar(self, servidor):
+        with self._lock:
+            self._castigo[servidor] = time.monotonic() + OVERPASS_CASTIGO_S
+
+    def _baixar(self, servidor, query, desistir):
+        """Bytes da resposta ou _Falha. Aborta o download se outro espelho já venceu."""
+        try:
+            with self.sessao.post(servidor, data={'data': query}, timeout=self.timeout, stream=True) as resposta:
+                if resposta.status_code in (429, 503, 504):
+                    espera = resposta.headers.get('Retry-After')
+                    raise _Falha(f"HTTP {resposta.status_code}", float(espera) if espera and espera.isdigit() else None)
+                if resposta.status_code != 200:
+                    raise _Falha(f"HTTP {resposta.status_code}")
+                partes = []
+                for parte in resposta.iter_content(64 * 1024):
+                    if desistir.is_set():
+                        return None
+                    partes.append(parte)
+        except _Falha:
+            raise
+        except Exception as e:
+            raise _Falha(f"{type(e).__name__}: {e}")
+        conteudo = b''.join(partes)
+        try:
+            dados = json.loads(conteudo)
+        except ValueError:
+            raise _Falha("resposta não é JSON (servidor sobrecarregado?)")
+        # Timeout/memória estourada no servidor vem com 200 e um 'remark'
+        if 'runtime error' in str(dados.get('remark', '')).lower():
+            raise _Falha(dados['remark'])
+        return conteudo
+
+    def _correr(self, query):
+        """Uma rodada: todos os espelhos ao mesmo tempo, vale a primeira resposta boa."""
+        desistir = threading.Event()
+        futuros = {self._executor.submit(self._baixar, s, query, desistir): s for s in self._candidatos()}
+        erros, espera = [], None
+        try:
+            while futuros:
+                prontos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for fut in prontos:
+                    servidor = futuros.pop(fut)
+                    try:
+                        return fut.result()
+                    except _Falha as e:
+                        self._castigar(servidor)
+                        erros.append(f"{servidor}: {e}")
+                        espera = max(espera or 0, e.espera or 0) or None
+        finally:
+            desistir.set()
+        raise _Falha("; ".join(erros), espera)
+
+    def consultar(self, query):
+        """Resposta JSON da consulta (dict). Levanta ErroOverpass se todos os espelhos falharem."""
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            if tentativa:
+                espera = BACKOFF_BASE_S * 2 ** (tentativa - 1)
+                time.sleep(max(espera, getattr(ultimo_erro, 'espera', None) or 0) * random.uniform(1.0, 1.5))
+            try:
+                conteudo = self._correr(query)
+            except _Falha as e:
+                ultimo_erro = e
+                print(f"Overpass tentativa {tentativa + 1}/{self.tentativas}: {e}")
+                continue
+            return json.loads(conteudo)
+        raise ErroOverpass(f"Overpass indisponível: {ultimo_erro}")
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente_overpass():
+    """Cliente compartilhado pelo processo (sessões e castigos valem para todos os serviços)."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteOverpass()
+        return _cliente
@@ -0,0 +1,147 @@
+import json
+import os
+
+from src.services.satellite_service import ZOOM_PADRAO
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Colunas gravadas por ponto (a imagem vai para disco à parte)
+COLUNAS_RESULTADO = [
+    ('subestacao', 'string'),
+    ('ponto_id', 'string'),
+    ('tipo', 'string'),
+    ('lat', 'float64'),
+    ('lon', 'float64'),
+    ('zoom', 'int64'),
+    ('tem_gd', 'bool_'),
+    ('ratio', 'float64'),
+    ('paineis_estimados', 'float64'),
+    ('classe', 'string'),
+    ('n_deteccoes', 'int64'),
+    ('deteccoes', 'string'),
+    ('erro', 'string'),
+    ('evidencia', 'string'),
+    ('miniatura', 'string'),
+    ('n_edificacoes', 'int64'),
+    ('edificacoes_gd', 'int64'),
+    ('edificacoes', 'string'),
+]
+
+
+def linha_resultado(resultado, ponto, subestacao=None, evidencia=None, miniatura=None):
+    """Achata o resultado do motor numa linha serializável (a imagem fica só referenciada)."""
+    deteccoes = resultado.get('deteccoes') or []
+    # Pontos 'tile' cobrem várias edificações; os demais valem por uma
+    edificacoes = resultado.get('edificacoes')
+    if edificacoes is None:
+        n_edificacoes, edificacoes_gd = 1, int(bool(resultado.get('tem_gd', False)))
+    else:
+        n_edificacoes, edificacoes_gd = len(edificacoes), sum(1 for e in edificacoes if e['tem_gd'])
+    return {
+        'subestacao': subestacao,
+        'ponto_id': ponto.get('id'),
+        'tipo': ponto.get('type'),
+        'lat': float(resultado.get('lat', ponto['latitude'])),
+        'lon': float(resultado.get('lon', ponto['longitude'])),
+        'zoom': int(ponto.get('zoom') or ZOOM_PADRAO),
+        'tem_gd': bool(resultado.get('tem_gd', False)),
+        'ratio': float(resultado.get('ratio') or 0),
+        'paineis_estimados': float(resultado.get('paineis_estimados') or 0),
+        'classe': resultado.get('classe'),
+        'n_deteccoes': len(deteccoes),
+        'deteccoes': json.dumps(deteccoes, ensure_ascii=False),
+        'erro': resultado.get('erro'),
+        'evidencia': evidencia,
+        'miniatura': miniatura,
+        'n_edificacoes': n_edificacoes,
+        'edificacoes_gd': edificacoes_gd,
+        'edificacoes': json.dumps(edificacoes, ensure_ascii=False) if edificacoes is not None else None,
+    }
+
+
+def linhas_por_edificacao(linha):
+    """
+    Expande a linha de um ponto 'tile' numa linha por edificação coberta
+    (mesma evidência, detecções atribuídas por projeção pixel -> lat/lon).
+    Linhas de outros tipos passam inalteradas.
+    """
+    if not linha.get('edificacoes'):
+        yield linha
+        return
+    for e in json.loads(linha['edificacoes']):
+        yield {
+            **linha,
+            'ponto_id': e['id'],
+            'tipo': 'building',
+            'lat': float(e['lat']),
+            'lon': float(e['lon']),
+            'tem_gd': e['tem_gd'],
+            'paineis_estimados': float(e['paineis_estimados']),
+            'classe': e['classe'],
+            'n_deteccoes': len(e['deteccoes']),
+            'deteccoes': json.dumps(e['deteccoes'], ensure_ascii=False),
+            'n_edificacoes': 1,
+            'edificacoes_gd': int(e['tem_gd']),
+            'edificacoes': None,
+        }
+
+
+class EscritorResultados:
+    """
+    Grava resultados de scan em streaming (JSONL ou Parquet).
+    Só um lote pequeno fica em memória: o uso de memória não depende do tamanho do scan.
+    JSONL acrescenta ao arquivo existente, a menos que sobrescrever=True (Parquet sempre recria).
+    """
+
+    def __init__(self, caminho, formato=None, linhas_por_lote=500, sobrescrever=False):
+        self.caminho = caminho
+        self.formato = formato or ('parquet' if caminho.endswith('.parquet') else 'jsonl')
+        self.linhas_por_lote = linhas_por_lote
+        self.total = 0
+        self._buffer = []
+        self._arquivo = None
+        self._parquet = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        if self.formato == 'parquet':
+            if pa is None:
+                raise RuntimeError("pyarrow não instalado: use formato jsonl")
+            self._schema = pa.schema([(nome, getattr(pa, tipo)()) for nome, tipo in COLUNAS_RESULTADO])
+            self._parquet = pq.ParquetWriter(caminho, self._schema, compression='zstd')
+        else:
+            self._arquivo = open(caminho, 'w' if sobrescrever else 'a', encoding='utf-8')
+
+    def escrever(self, linha):
+        self._buffer.append(linha)
+        self.total += 1
+        if len(self._buffer) >= self.linhas_por_lote:
+            self.descarregar()
+
+    def descarregar(self):
+        if not self._buffer:
+            return
+        if self._parquet is not None:
+            self._parquet.write_table(pa.Table.from_pylist(self._buffer, schema=self._schema))
+        else:
+            self._arquivo.write(''.join(json.dumps(l, ensure_ascii=False) + '\n' for l in self._buffer))
+            self._arquivo.flush()
+        self._buffer.clear()
+
+    def fechar(self):
+        self.descarregar()
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
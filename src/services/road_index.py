@@ -0,0 +1,138 @@
+"""
+Índice de faixas de rua (ruas com buffer) para descartar pontos de scan sobre o asfalto.
+
+As ruas são baixadas por tile fixo (a caixa é "encaixada" numa grade de
+PVG_TILE_RUAS_GRAUS), unidas e guardadas já no CRS métrico como geometria
+preparada; o filtro de pontos é vetorizado (shapely.contains_xy).
+Sem shapely/pyproj, o buffer é rasterizado numa máscara métrica de 1 m com OpenCV.
+"""
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import shapely
+    from pyproj import Transformer
+except ImportError:
+    shapely = None
+
+TILE_RUAS_GRAUS = float(os.getenv("PVG_TILE_RUAS_GRAUS", "0.02"))
+BUFFER_RUAS_M = float(os.getenv("PVG_BUFFER_RUAS_M", "8"))
+# Folga ao baixar um tile: ruas logo fora da borda também cobrem pontos de dentro
+FOLGA_RUAS_GRAUS = 0.0005
+RESOLUCAO_MASCARA_M = 1.0
+M_POR_GRAU = 111320.0
+
+
+def chave_tile_ruas(lat, lon):
+    """Tile fixo da grade de ruas que contém o ponto (arrays ou escalares)."""
+    return np.floor(np.asarray(lat) / TILE_RUAS_GRAUS).astype(np.int64), \
+        np.floor(np.asarray(lon) / TILE_RUAS_GRAUS).astype(np.int64)
+
+
+def caixa_tile_ruas(i, j):
+    """(lat_min, lon_min, lat_max, lon_max) do tile, com a folga de download."""
+    return (round(i * TILE_RUAS_GRAUS - FOLGA_RUAS_GRAUS, 6), round(j * TILE_RUAS_GRAUS - FOLGA_RUAS_GRAUS, 6),
+            round((i + 1) * TILE_RUAS_GRAUS + FOLGA_RUAS_GRAUS, 6), round((j + 1) * TILE_RUAS_GRAUS + FOLGA_RUAS_GRAUS, 6))
+
+
+def _epsg_utm(lat, lon):
+    zona = int((lon + 180) // 6) + 1
+    return (32700 if lat < 0 else 32600) + zona
+
+
+class IndiceRuas:
+    """Faixas de rua de um tile: união das ruas com buffer, pronta para testar pontos em lote."""
+
+    def __init__(self, ruas, caixa, buffer_m=BUFFER_RUAS_M):
+        self.caixa = caixa
+        self.buffer_m = buffer_m
+        self.vazio = not ruas
+        lat_c, lon_c = (caixa[0] + caixa[2]) / 2, (caixa[1] + caixa[3]) / 2
+        if self.vazio:
+            return
+        if shapely is not None:
+            self._transformer = Transformer.from_crs(4326, _epsg_utm(lat_c, lon_c), always_xy=True)
+            linhas = []
+            for coords in ruas:
+                x, y = self._transformer.transform(*np.asarray(coords, dtype=float).T)
+                linhas.append(shapely.linestrings(np.column_stack([x, y])))
+            self._faixas = shapely.union_all(shapely.buffer(np.array(linhas), buffer_m))
+            shapely.prepare(self._faixas)
+        else:
+            self._montar_mascara(ruas, lat_c)
+
+    def _montar_mascara(self, ruas, lat_c):
+        self._kx = M_POR_GRAU * math.cos(math.radians(lat_c))
+        self._x0, self._y0 = self.caixa[1] * self._kx, self.caixa[2] * M_POR_GRAU
+        largura = int(math.ceil((self.caixa[3] - self.caixa[1]) * self._kx / RESOLUCAO_MASCARA_M)) + 1
+        altura = int(math.ceil((self.caixa[2] - self.caixa[0]) * M_POR_GRAU / RESOLUCAO_MASCARA_M)) + 1
+        self._mascara = np.zeros((altura, largura), dtype=np.uint8)
+        polilinhas = [np.round(np.column_stack(self._pixel(c[:, 1], c[:, 0]))).astype(np.int32)
+                      for c in (np.asarray(r, dtype=float) for r in ruas)]
+        espessura = max(1, int(round(2 * self.buffer_m / RESOLUCAO_MASCARA_M)))
+        cv2.polylines(self._mascara, polilinhas, False, 1, thickness=espessura, lineType=cv2.LINE_8)
+
+    def _pixel(self, lats, lons):
+        return ((np.asarray(lons) * self._kx - self._x0) / RESOLUCAO_MASCARA_M,
+                (self._y0 - np.asarray(lats) * M_POR_GRAU) / RESOLUCAO_MASCARA_M)
+
+    def na_rua(self, lats, lons):
+        """Máscara booleana: True para pontos dentro de alguma faixa de rua."""
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        if self.vazio:
+            return np.zeros(len(lats), dtype=bool)
+        if shapely is not None:
+            x, y = self._transformer.transform(lons, lats)
+            return shapely.contains_xy(self._faixas, x, y)
+        px, py = self._pixel(lats, lons)
+        px, py = np.round(px).astype(np.int64), np.round(py).astype(np.int64)
+        altura, largura = self._mascara.shape
+        dentro = (px >= 0) & (px < largura) & (py >= 0) & (py < altura)
+        resultado = np.zeros(len(lats), dtype=bool)
+        resultado[dentro] = self._mascara[py[dentro], px[dentro]].astype(bool)
+        return resultado
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def obter_indice_ruas(i, j, baixar_ruas):
+    """
+    Índice do tile (i, j), construído uma vez por processo.
+    baixar_ruas(lat_min, lon_min, lat_max, lon_max) -> lista de polilinhas [[lon, lat], ...];
+    se levantar erro, o tile fica sem filtro nesta chamada e é tentado de novo na próxima.
+    """
+    chave = (i, j, BUFFER_RUAS_M)
+    with _indices_lock:
+        indice = _indices.get(chave)
+    if indice is None:
+        caixa = caixa_tile_ruas(i, j)
+        try:
+            ruas = baixar_ruas(*caixa)
+        except Exception as e:
+            print(f"Erro ruas {caixa}: {e}")
+            return IndiceRuas([], caixa)
+        indice = IndiceRuas(ruas, caixa)
+        with _indices_lock:
+            _indices[chave] = indice
+    return indice
+
+
+def mascara_na_rua(lats, lons, baixar_ruas):
+    """True para cada ponto sobre uma rua; os pontos são agrupados pelo tile de ruas."""
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    resultado = np.zeros(len(lats), dtype=bool)
+    if not len(lats):
+        return resultado
+    ti, tj = chave_tile_ruas(lats, lons)
+    chaves = ti * 1_000_003 + tj
+    for chave in np.unique(chaves):
+        grupo = np.nonzero(chaves == chave)[0]
+        indice = obter_indice_ruas(int(ti[grupo[0]]), int(tj[grupo[0]]), baixar_ruas)
+        resultado[grupo] = indice.na_rua(lats[grupo], lons[grupo])
+    return resultado
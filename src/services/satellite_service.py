@@ -1,12 +1,28 @@
-import requests
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw
 from io import BytesIO
 import os
+import threading
+
+from src.services.tile_cache import obter_tile_cache, quantizar_coordenada
+from src.utils.http import criar_sessao, LimitadorPorHost
+from src.utils.tile_planner import ESCALA_TILE, LADO_TILE_PX
 
 API_KEY = os.getenv("GOOGLE_MAPS_KEY")
 BASE_URL = "https://maps.googleapis.com/maps/api/staticmap"
+# Zoom dos tiles de telhado; células grossas do grid hexagonal usam zoom menor
+ZOOM_PADRAO = 19
+
+# Sessão HTTP compartilhada entre as threads do scan (reaproveita conexões TLS)
+HTTP_POOL_SIZE = int(os.getenv("PVG_HTTP_POOL", "16"))
+MAPS_REQ_POR_SEGUNDO = float(os.getenv("GOOGLE_MAPS_RPS", "20"))
+
+_sessao = criar_sessao(HTTP_POOL_SIZE)
+_limitador = LimitadorPorHost(MAPS_REQ_POR_SEGUNDO)
+# Downloads em andamento por chave do cache: jobs simultâneos (dashboard, API) baixam cada tile uma vez
+_em_voo = {}
+_em_voo_lock = threading.Lock()
 
 
 def _gerar_imagem_mock():
@@ -15,111 +31,197 @@ def _gerar_imagem_mock():
     return Image.fromarray(arr, 'RGB')
 
 
+def baixar_imagem_satelite_bytes(lat, long, zoom=ZOOM_PADRAO, size=f"{LADO_TILE_PX}x{LADO_TILE_PX}",
+                                 scale=ESCALA_TILE):
+    """
+    Baixa a imagem já codificada (PNG/JPEG), passando pelo cache em disco.
+    O centro é quantizado para que pontos quase idênticos reaproveitem o mesmo tile.
+    Retorna None se não houver chave ou se o download falhar.
+    """
+    if not API_KEY:
+        return None
+
+    lat, long = quantizar_coordenada(lat), quantizar_coordenada(long)
+    cache = obter_tile_cache()
+    chave = cache.chave(lat, long, zoom, size, scale)
+
+    conteudo = cache.obter(chave)
+    if conteudo is not None:
+        return conteudo
+
+    with _em_voo_lock:
+        baixando = _em_voo.get(chave)
+        if baixando is None:
+            _em_voo[chave] = threading.Event()
+    if baixando is not None:
+        # Outro job já está baixando este tile: espera e lê do cache
+        baixando.wait(timeout=10)
+        return cache.obter(chave)
+
+    params = {
+        'center': f"{lat},{long}", 'zoom': zoom, 'size': size,
+        'scale': scale, 'maptype': 'satellite', 'key': API_KEY
+    }
+    try:
+        _limitador.aguardar(BASE_URL)
+        response = _sessao.get(BASE_URL, params=params, timeout=5)
+        if response.status_code == 200 and response.content:
+            cache.guardar(chave, response.content)
+            return response.content
+    except Exception:
+        pass
+    finally:
+        with _em_voo_lock:
+            _em_voo.pop(chave).set()
+    return None
+
+
+def decodificar_bgr(conteudo):
+    """Decodifica os bytes direto para array BGR (sem passar pelo PIL)."""
+    return cv2.imdecode(np.frombuffer(conteudo, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
 def baixar_imagem_satelite(lat, long, zoom=19, size="600x600", scale=2):
     """
     Baixa a imagem. Zoom 19 evita o 'zoom digital' borrado do Google em áreas rurais.
     """
-    if API_KEY:
-        params = {
-            'center': f"{lat},{long}", 'zoom': zoom, 'size': size,
-            'scale': scale, 'maptype': 'satellite', 'key': API_KEY
-        }
+    conteudo = baixar_imagem_satelite_bytes(lat, long, zoom, size, scale)
+    if conteudo:
         try:
-            response = requests.get(BASE_URL, params=params, timeout=5)
-            if response.status_code == 200:
-                return Image.open(BytesIO(response.content))
+            return Image.open(BytesIO(conteudo))
         except Exception:
             pass
     return _gerar_imagem_mock()
 
 
-def analisar_imagem_telhado(lat, long, hsv_config=None):
-    pil_img_raw = baixar_imagem_satelite(lat, long)
-    if not pil_img_raw: return None, 0, False
+def detectar_paineis(img_bgr, hsv_config=None):
+    """
+    Etapa de visão computacional pura (sem PIL/rede), segura para rodar em processos.
+    Retorna (deteccoes, ratio, tem_gd); cada detecção é um dict x, y, w, h, motivo, area.
+    """
+    h, w = img_bgr.shape[:2]
 
-    try:
-        img_bgr = cv2.cvtColor(np.array(pil_img_raw), cv2.COLOR_RGB2BGR)
+    hsv_check = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+    saturacao_media = np.mean(hsv_check[:, :, 1])
 
+    tem_cor_util = saturacao_media > 20
 
-        img_final_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        pil_img_final = Image.fromarray(img_final_rgb)
-        draw = ImageDraw.Draw(pil_img_final)
-        w, h = pil_img_final.size
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
 
-        draw.rectangle([0, 0, w - 1, h - 1], outline="#00c0f2", width=4)
+    blurred = cv2.GaussianBlur(gray, (11, 11), 0)
 
+    clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(blurred)
 
-        hsv_check = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-        saturacao_media = np.mean(hsv_check[:, :, 1])
+    edges = cv2.Canny(enhanced, 50, 150)
 
-        tem_cor_util = saturacao_media > 20
+    kernel = np.ones((3, 3), np.uint8)
+    dilated = cv2.dilate(edges, kernel, iterations=1)
 
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        blurred = cv2.GaussianBlur(gray, (11, 11), 0)
+    deteccoes = []
+    score_final = 0.0
 
-        clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(blurred)
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
 
-        edges = cv2.Canny(enhanced, 50, 150)
+        if area > 400:
 
-        kernel = np.ones((3, 3), np.uint8)
-        dilated = cv2.dilate(edges, kernel, iterations=1)
+            peri = cv2.arcLength(cnt, True)
+            approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
 
-        contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if 4 <= len(approx) <= 6:
 
-        detectou_gd = False
-        score_final = 0.0
+                x, y, w_rect, h_rect = cv2.boundingRect(approx)
+                aspect_ratio = float(w_rect) / h_rect
 
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
+                if 0.5 < aspect_ratio < 2.5:
 
-            if area > 400:
+                    eh_painel = False
+                    motivo = ""
 
-                peri = cv2.arcLength(cnt, True)
-                approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
+                    roi_edges = edges[y:y + h_rect, x:x + w_rect]
 
-                if 4 <= len(approx) <= 6:
+                    lines = cv2.HoughLinesP(roi_edges, 1, np.pi / 180, threshold=20,
+                                            minLineLength=15, maxLineGap=10)
 
-                    x, y, w_rect, h_rect = cv2.boundingRect(approx)
-                    aspect_ratio = float(w_rect) / h_rect
+                    if lines is not None and len(lines) >= 2:
+                        eh_painel = True
+                        motivo = "ESTRUTURA"
 
-                    if 0.5 < aspect_ratio < 2.5:
+                    if tem_cor_util and not eh_painel:
+                        roi_hsv = hsv_check[y:y + h_rect, x:x + w_rect]
 
-                        eh_painel = False
-                        motivo = ""
+                        mean_h = np.mean(roi_hsv[:, :, 0])
+                        mean_s = np.mean(roi_hsv[:, :, 1])
+                        mean_v = np.mean(roi_hsv[:, :, 2])
 
-                        roi_edges = edges[y:y + h_rect, x:x + w_rect]
+                        if (90 < mean_h < 140) and (mean_s > 25) and (mean_v < 200):
+                            eh_painel = True
+                            motivo = "COR AZUL"
 
-                        lines = cv2.HoughLinesP(roi_edges, 1, np.pi / 180, threshold=20,
-                                                minLineLength=15, maxLineGap=10)
+                    if eh_painel:
+                        deteccoes.append({'x': x, 'y': y, 'w': w_rect, 'h': h_rect, 'motivo': motivo, 'area': area})
+                        score_final += area
 
-                        if lines is not None and len(lines) >= 2:
-                            eh_painel = True
-                            motivo = "ESTRUTURA"
+    ratio = min(score_final / (w * h) * 10, 0.99)
+
+    return deteccoes, ratio, bool(deteccoes)
 
-                        if tem_cor_util and not eh_painel:
-                            roi_hsv = hsv_check[y:y + h_rect, x:x + w_rect]
 
-                            mean_h = np.mean(roi_hsv[:, :, 0])
-                            mean_s = np.mean(roi_hsv[:, :, 1])
-                            mean_v = np.mean(roi_hsv[:, :, 2])
+def desenhar_deteccoes(img_bgr, deteccoes):
+    """Gera a imagem de evidência (PIL RGB) com a moldura e as caixas detectadas."""
+    pil_img_final = Image.fromarray(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(pil_img_final)
+    w, h = pil_img_final.size
 
-                            if (90 < mean_h < 140) and (mean_s > 25) and (mean_v < 200):
-                                eh_painel = True
-                                motivo = "COR AZUL"
+    draw.rectangle([0, 0, w - 1, h - 1], outline="#00c0f2", width=4)
 
-                        if eh_painel:
-                            draw.rectangle([x, y, x + w_rect, y + h_rect], outline="#00FF00", width=3)
-                            draw.text((x, y - 10), motivo, fill="#00FF00")
+    for d in deteccoes:
+        x, y = d['x'], d['y']
+        draw.rectangle([x, y, x + d['w'], y + d['h']], outline="#00FF00", width=3)
+        draw.text((x, y - 10), d['motivo'], fill="#00FF00")
 
-                            detectou_gd = True
-                            score_final += area
+    return pil_img_final
 
-        ratio = min(score_final / (w * h) * 10, 0.99)
 
-        return pil_img_final, ratio, detectou_gd
+def obter_imagem_bgr(lat, long, estrito=False, zoom=ZOOM_PADRAO):
+    """
+    Baixa (ou lê do cache) o tile como array BGR, com mock cinza em caso de falha.
+    estrito=True: se houver chave da API e o download falhar, levanta erro em vez do mock
+    (usado nos jobs, para que o ponto fique pendente e seja refeito na retomada).
+    """
+    conteudo = baixar_imagem_satelite_bytes(lat, long, zoom)
+    img_bgr = decodificar_bgr(conteudo) if conteudo else None
+    if img_bgr is None:
+        if estrito and API_KEY:
+            raise RuntimeError("Falha no download do tile")
+        img_bgr = cv2.cvtColor(np.array(_gerar_imagem_mock()), cv2.COLOR_RGB2BGR)
+    return img_bgr
+
+
+def gerar_evidencia(lat, long, deteccoes, lado_max=None, zoom=ZOOM_PADRAO):
+    """
+    Reconstrói a imagem de evidência de um ponto já analisado (tile do cache + caixas gravadas).
+    lado_max reduz para miniatura.
+    """
+    img = desenhar_deteccoes(obter_imagem_bgr(lat, long, zoom=zoom), deteccoes)
+    if lado_max:
+        img.thumbnail((lado_max, lado_max))
+    return img
+
+
+def analisar_imagem_telhado(lat, long, hsv_config=None, detector=None):
+    """Baixa o tile e roda o motor de detecção escolhido (heurístico por padrão)."""
+    from src.services.detectors import obter_detector
+
+    img_bgr = obter_imagem_bgr(lat, long)
+
+    try:
+        resultado = obter_detector(detector).detectar(img_bgr, hsv_config)
+        return desenhar_deteccoes(img_bgr, resultado['deteccoes']), resultado['ratio'], resultado['tem_gd']
 
     except Exception as e:
         print(f"Erro IA: {e}")
-        return pil_img_raw, 0, False
\ No newline at end of file
+        return Image.fromarray(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)), 0, False
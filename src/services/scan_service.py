@@ -0,0 +1,105 @@
+from src.services.analysis_engine import obter_motor
+from src.services.evidence_store import obter_armazem_evidencias
+from src.services.job_store import (STATUS_CONCLUIDO, STATUS_ERRO, STATUS_EXECUTANDO, STATUS_INTERROMPIDO,
+                                    obter_job_store)
+from src.services.result_writer import linha_resultado
+from src.services.detectors import classificar_imovel, estimar_paineis
+from src.utils.hexgrid import deve_refinar, refinar
+from src.utils.tile_planner import atribuir_deteccoes
+
+
+def iterar_scan(pontos, hsv_config=None, detector=None, desenhar=True):
+    """
+    Baixa e analisa os pontos com concorrência limitada (downloads em threads,
+    visão computacional no pool de processos do motor) e devolve (indice, resultado)
+    conforme cada imagem termina (fora de ordem).
+    A memória não cresce com o scan: só uma janela de tiles fica em voo.
+    desenhar=False dispensa a imagem anotada (a UI gera miniaturas sob demanda).
+    """
+    for idx, resultado in obter_motor().iterar_pontos(pontos, hsv_config, detector, desenhar):
+        if resultado.get('erro'):
+            print(f"Erro scan ponto {idx}: {resultado['erro']}")
+        yield idx, resultado
+
+
+def executar_scan(pontos, hsv_config=None, on_progress=None, detector=None):
+    """
+    Executa o scan completo e devolve os resultados na ordem dos pontos.
+    on_progress(concluidos, total) é chamado a cada imagem finalizada.
+    detector: nome do motor ('heuristico', 'yolo', ...) ou None para o padrão.
+    """
+    total = len(pontos)
+    resultados = {}
+    for concluidos, (idx, res) in enumerate(iterar_scan(pontos, hsv_config, detector), start=1):
+        if res.get('img'):
+            resultados[idx] = res
+        if on_progress:
+            on_progress(concluidos, total)
+    return [resultados[i] for i in sorted(resultados)]
+
+
+def _atribuir_edificacoes(ponto, resultado):
+    """Resultado por edificação de um ponto 'tile' (detecções projetadas de volta)."""
+    por_edificacao = atribuir_deteccoes(ponto, resultado.get('deteccoes'), resultado.get('largura_px'))
+    return [{
+        'id': e['id'],
+        'lat': e['latitude'],
+        'lon': e['longitude'],
+        'tem_gd': bool(deteccoes),
+        'paineis_estimados': estimar_paineis(deteccoes),
+        'classe': classificar_imovel(deteccoes),
+        'deteccoes': deteccoes,
+    } for e, deteccoes in zip(ponto['edificacoes'], por_edificacao)]
+
+
+def criar_job_scan(pontos_por_subestacao, parametros=None):
+    """Registra um job persistente com os pontos de prepare_scan_data de cada subestação."""
+    return obter_job_store().criar_job(parametros or {}, pontos_por_subestacao)
+
+
+def iterar_job(job_id, hsv_config=None, detector=None, bloco=2000, evidencias='nenhuma', armazem=None):
+    """
+    Processa só os pontos do job que ainda não foram concluídos e devolve (ponto, resultado).
+    O progresso vai para o SQLite em checkpoints; se o processo morrer, o job
+    retoma do último checkpoint e nenhum tile/inferência já concluído é refeito.
+    evidencias ('todas', 'positivas', 'nenhuma') decide quais imagens anotadas vão
+    para o armazém de evidências; o resultado traz só os caminhos, nunca a imagem.
+    Células grossas do grid hexagonal com telhado/painel ganham pontos filhos no
+    fim do job, processados no mesmo laço.
+    """
+    store = obter_job_store()
+    armazem = armazem or obter_armazem_evidencias()
+    store.marcar_status(job_id, STATUS_EXECUTANDO)
+    ultimo_idx = -1
+    try:
+        with store.checkpoint(job_id) as checkpoint:
+            while True:
+                pontos = store.pontos_pendentes(job_id, limite=bloco, depois_de=ultimo_idx)
+                if not pontos:
+                    break
+                ultimo_idx = pontos[-1]['idx']
+                for i, resultado in iterar_scan(pontos, hsv_config, detector, desenhar=evidencias != 'nenhuma'):
+                    ponto = pontos[i]
+                    img = resultado.pop('img', None)
+                    if ponto.get('type') == 'tile':
+                        resultado['edificacoes'] = _atribuir_edificacoes(ponto, resultado)
+                    if img is not None and (evidencias == 'todas' or resultado['tem_gd']):
+                        resultado['evidencia'], resultado['miniatura'] = armazem.guardar(
+                            ponto.get('id') or ponto['idx'], img, ponto['subestacao'], job_id)
+                    if deve_refinar(ponto, resultado):
+                        # Antes do checkpoint: se cair aqui, a célula é refeita e os filhos já existentes são ignorados
+                        store.adicionar_pontos(job_id, ponto['subestacao'], refinar(ponto))
+                        # As filhas trazem as detecções desta área: a mãe não entra em KPIs nem exportações
+                        resultado['refinado'] = True
+                    yield ponto, resultado
+                    status = STATUS_ERRO if resultado.get('erro') else STATUS_CONCLUIDO
+                    linha = linha_resultado(resultado, ponto, ponto['subestacao'], resultado.get('evidencia'),
+                                            resultado.get('miniatura'))
+                    if resultado.get('refinado'):
+                        linha['refinado'] = True
+                    checkpoint.registrar(ponto['idx'], status, linha)
+    finally:
+        armazem.descarregar()
+        progresso = store.progresso(job_id)
+        completo = progresso[STATUS_CONCLUIDO] == progresso['total']
+        store.marcar_status(job_id, STATUS_CONCLUIDO if completo else STATUS_INTERROMPIDO)
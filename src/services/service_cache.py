@@ -0,0 +1,245 @@
+"""
+Memoização em dois níveis para as consultas dos serviços (OSM, ANEEL), sem depender do Streamlit.
+
+- Memória: LRU por serviço no processo; cada chamada recebe uma cópia (deepcopy), então quem
+  altera o retorno não afeta os outros. Serviços que devolvem valores imutáveis usam copiar=False.
+- Disco: um pickle por chamada em CACHE_DIR/servicos/<serviço>, compartilhado entre
+  dashboard, CLI e API; vale até o TTL do serviço (PVG_CACHE_TTL_<SERVIÇO>, em segundos).
+- Chamadas iguais ao mesmo tempo executam a função uma vez só; as outras esperam o resultado.
+- Falhas (exceções) e resultados recusados por guardar_se não entram no cache.
+- É o único cache das consultas ao Overpass (o cliente não guarda respostas), então o TTL do serviço é o que vale.
+
+    @memoizar('subestacoes', ttl_s=3600)
+    def _subestacoes_overpass(cidade): ...
+"""
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from src.services.tile_cache import CACHE_DIR
+
+SERVICOS_DIR = os.path.join(CACHE_DIR, "servicos")
+MEMORIA_ENTRADAS = int(os.getenv("PVG_CACHE_MEMORIA_ENTRADAS", "64"))
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def ttl_servico(servico, padrao):
+    """TTL do serviço: PVG_CACHE_TTL_<SERVIÇO> (segundos) ou o padrão do decorator."""
+    return float(os.getenv(f"PVG_CACHE_TTL_{servico.upper()}", padrao))
+
+
+class CacheServico:
+    """LRU em memória na frente do disco, com uma execução por chave em andamento."""
+
+    def __init__(self, servico, ttl_s, max_entradas=MEMORIA_ENTRADAS, diretorio=SERVICOS_DIR, disco=True,
+                 copiar=True):
+        self.servico = servico
+        self.ttl = ttl_s
+        self.max_entradas = max_entradas
+        self.copiar = copiar
+        self.diretorio = os.path.join(diretorio, servico) if disco else None
+        self._memoria = OrderedDict()
+        self._em_voo = {}
+        self._lock = threading.Lock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.esperas = 0
+        self.erros = 0
+
+    # --- Memória ---
+
+    def _da_memoria(self, chave):
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is None:
+                return False, None
+            expira_em, valor = entrada
+            if time.monotonic() > expira_em:
+                del self._memoria[chave]
+                return False, None
+            self._memoria.move_to_end(chave)
+            return True, valor
+
+    def _para_memoria(self, chave, valor, idade=0.0):
+        with self._lock:
+            self._memoria[chave] = (time.monotonic() + self.ttl - idade, valor)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+
+    # --- Disco ---
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.pkl")
+
+    def _do_disco(self, chave):
+        """(achou, valor, idade em segundos)."""
+        if self.diretorio is None:
+            return False, None, 0.0
+        caminho = self._caminho(chave)
+        try:
+            idade = time.time() - os.path.getmtime(caminho)
+            if idade > self.ttl:
+                os.remove(caminho)
+                return False, None, 0.0
+            with open(caminho, 'rb') as f:
+                return True, pickle.load(f), idade
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return False, None, 0.0
+
+    def _para_disco(self, chave, valor):
+        if self.diretorio is None:
+            return
+        caminho = self._caminho(chave)
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            temporario = f"{caminho}.{threading.get_ident()}.tmp"
+            with open(temporario, 'wb') as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, caminho)
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            print(f"Cache {self.servico}: não gravou em disco ({e})")
+
+    # --- Consulta ---
+
+    def _copia(self, valor):
+        # O objeto guardado na memória nunca sai daqui: cada chamador recebe o seu
+        return copy.deepcopy(valor) if self.copiar else valor
+
+    def obter(self, chave, calcular, guardar_se=None):
+        """Valor da chave: memória, disco ou calcular() (uma execução por chave ao mesmo tempo)."""
+        achou, valor = self._da_memoria(chave)
+        if achou:
+            self.hits_memoria += 1
+            return self._copia(valor)
+
+        with self._lock:
+            voo = self._em_voo.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._em_voo[chave] = {'pronto': threading.Event(), 'valor': None, 'erro': None}
+        if not lider:
+            # Mesma consulta já em andamento (outra sessão, job ou cliente da API): usa o resultado dela
+            self.esperas += 1
+            voo['pronto'].wait()
+            if voo['erro'] is not None:
+                raise voo['erro']
+            return self._copia(voo['valor'])
+
+        try:
+            achou, valor, idade = self._do_disco(chave)
+            if achou:
+                self.hits_disco += 1
+                self._para_memoria(chave, valor, idade)
+            else:
+                self.misses += 1
+                valor = calcular()
+                if guardar_se is None or guardar_se(valor):
+                    self._para_memoria(chave, valor)
+                    self._para_disco(chave, valor)
+            voo['valor'] = valor
+            return self._copia(valor)
+        except Exception as e:
+            self.erros += 1
+            voo['erro'] = e
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+            voo['pronto'].set()
+
+    def limpar(self):
+        with self._lock:
+            self._memoria.clear()
+        if self.diretorio is not None:
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def ocupacao_disco(self):
+        """(arquivos, bytes) do serviço em disco."""
+        arquivos, total = 0, 0
+        if self.diretorio is None:
+            return arquivos, total
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                if nome.endswith('.pkl'):
+                    arquivos += 1
+                    total += os.path.getsize(os.path.join(raiz, nome))
+        return arquivos, total
+
+    def estatisticas(self, disco=False):
+        consultas = self.hits_memoria + self.hits_disco + self.misses
+        with self._lock:
+            entradas = len(self._memoria)
+        estatisticas = {
+            'ttl_s': self.ttl,
+            'hits_memoria': self.hits_memoria,
+            'hits_disco': self.hits_disco,
+            'misses': self.misses,
+            'esperas': self.esperas,
+            'erros': self.erros,
+            'hit_rate': (self.hits_memoria + self.hits_disco) / consultas if consultas else 0.0,
+            'entradas_memoria': entradas,
+        }
+        if disco:
+            arquivos, total = self.ocupacao_disco()
+            estatisticas['entradas_disco'] = arquivos
+            estatisticas['tamanho_mb'] = total / (1024 * 1024)
+        return estatisticas
+
+
+def chave_chamada(funcao, args, kwargs):
+    """Hash estável da função + argumentos (repr: os serviços recebem textos e números)."""
+    texto = f"{funcao.__module__}.{funcao.__qualname__}|{args!r}|{sorted(kwargs.items())!r}"
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def memoizar(servico, ttl_s=3600, max_entradas=MEMORIA_ENTRADAS, guardar_se=None, disco=True, copiar=True):
+    """
+    Decorator de memoização do serviço (ver o docstring do módulo).
+    A função decorada ganha .cache (estatísticas, limpar) e .sem_cache (chamada direta).
+    copiar=False só para funções que devolvem valores imutáveis (tuplas, strings, números).
+    """
+    def decorar(funcao):
+        cache = registrar_cache(servico, ttl_servico(servico, ttl_s), max_entradas, disco, copiar)
+
+        @functools.wraps(funcao)
+        def memoizada(*args, **kwargs):
+            return cache.obter(chave_chamada(funcao, args, kwargs), lambda: funcao(*args, **kwargs), guardar_se)
+
+        memoizada.cache = cache
+        memoizada.sem_cache = funcao
+        return memoizada
+    return decorar
+
+
+def registrar_cache(servico, ttl_s, max_entradas=MEMORIA_ENTRADAS, disco=True, copiar=True):
+    """Um cache por serviço no processo (funções do mesmo serviço dividem o LRU)."""
+    with _caches_lock:
+        if servico not in _caches:
+            _caches[servico] = CacheServico(servico, ttl_s, max_entradas, disco=disco, copiar=copiar)
+        return _caches[servico]
+
+
+def estatisticas_cache(disco=False):
+    """Estatísticas de cada serviço memoizado neste processo (disco=True soma a ocupação em disco)."""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {servico: cache.estatisticas(disco) for servico, cache in sorted(caches.items())}
+
+
+def limpar_cache(servico=None):
+    """Esvazia memória e disco de um serviço (ou de todos, inclusive de serviços não carregados)."""
+    with _caches_lock:
+        caches = [c for s, c in _caches.items() if servico is None or s == servico]
+    for cache in caches:
+        cache.limpar()
+    shutil.rmtree(SERVICOS_DIR if servico is None else os.path.join(SERVICOS_DIR, servico), ignore_errors=True)
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.getenv("PVG_CACHE_DIR", ".cache")
+TILE_CACHE_MAX_MB = float(os.getenv("PVG_TILE_CACHE_MAX_MB", "1024"))
+TILE_CACHE_TTL_DIAS = float(os.getenv("PVG_TILE_CACHE_TTL_DIAS", "30"))
+# 5 casas decimais ~ 1 m: centros quase iguais caem na mesma entrada
+TILE_CACHE_CASAS_DECIMAIS = int(os.getenv("PVG_TILE_CACHE_CASAS", "5"))
+
+
+def quantizar_coordenada(valor, casas=TILE_CACHE_CASAS_DECIMAIS):
+    """Arredonda a coordenada para a grade do cache."""
+    return round(float(valor), casas)
+
+
+class TileCache:
+    """
+    Cache em disco de imagens de satélite.
+    - Conteúdo endereçado por SHA-256 (imagens idênticas são gravadas uma vez só).
+    - Índice SQLite chave -> hash com horário de último acesso (evicção LRU).
+    - Limite de tamanho total e TTL por entrada.
+    Guarda e devolve os bytes codificados, sem decodificar a imagem.
+    """
+
+    def __init__(self, diretorio=None, tamanho_max_mb=TILE_CACHE_MAX_MB, ttl_segundos=TILE_CACHE_TTL_DIAS * 86400):
+        self.diretorio = diretorio or os.path.join(CACHE_DIR, "tiles")
+        self.tamanho_max = int(tamanho_max_mb * 1024 * 1024)
+        self.ttl = ttl_segundos
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.diretorio, "blobs"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.diretorio, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                chave TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                criado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_acesso ON entradas(acessado_em)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_hash ON entradas(hash)")
+        self._db.commit()
+
+    @staticmethod
+    def chave(lat, lon, zoom, size, scale):
+        """Chave estável para (lat, lon, zoom, size, scale) já quantizados."""
+        return f"{quantizar_coordenada(lat):.{TILE_CACHE_CASAS_DECIMAIS}f},{quantizar_coordenada(lon):.{TILE_CACHE_CASAS_DECIMAIS}f}|z{zoom}|{size}|x{scale}"
+
+    def _caminho_blob(self, digest):
+        return os.path.join(self.diretorio, "blobs", digest[:2], digest)
+
+    def obter(self, chave):
+        """Devolve os bytes da imagem ou None (miss ou expirado)."""
+        agora = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT hash, criado_em FROM entradas WHERE chave = ?", (chave,)).fetchone()
+            if row and agora - row[1] <= self.ttl:
+                try:
+                    with open(self._caminho_blob(row[0]), "rb") as f:
+                        conteudo = f.read()
+                    self._db.execute("UPDATE entradas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+                    self._db.commit()
+                    self.hits += 1
+                    return conteudo
+                except OSError:
+                    pass
+            if row:
+                # Expirado ou blob sumiu do disco
+                self._remover(chave, row[0])
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def guardar(self, chave, conteudo):
+        """Grava os bytes no cache e aplica o limite de tamanho."""
+        digest = hashlib.sha256(conteudo).hexdigest()
+        caminho = self._caminho_blob(digest)
+        agora = time.time()
+        with self._lock:
+            if not os.path.exists(caminho):
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                tmp = f"{caminho}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(conteudo)
+                os.replace(tmp, caminho)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entradas (chave, hash, tamanho, criado_em, acessado_em) VALUES (?, ?, ?, ?, ?)",
+                (chave, digest, len(conteudo), agora, agora)
+            )
+            self._evictar()
+            self._db.commit()
+
+    def _remover(self, chave, digest):
+        """Apaga a chave; devolve True se o blob ficou sem referências e saiu do disco."""
+        self._db.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+        # O blob pode ser compartilhado por outras chaves (mesmo conteúdo)
+        if self._db.execute("SELECT 1 FROM entradas WHERE hash = ? LIMIT 1", (digest,)).fetchone():
+            return False
+        try:
+            os.remove(self._caminho_blob(digest))
+        except OSError:
+            pass
+        return True
+
+    def _tamanho_total(self):
+        """Bytes em disco: cada blob conta uma vez, por mais chaves que apontem para ele."""
+        return self._db.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM (SELECT MAX(tamanho) AS tamanho FROM entradas GROUP BY hash)"
+        ).fetchone()[0]
+
+    def _evictar(self):
+        total = self._tamanho_total()
+        if total <= self.tamanho_max:
+            return
+        for chave, digest, tamanho in self._db.execute(
+                "SELECT chave, hash, tamanho FROM entradas ORDER BY acessado_em ASC").fetchall():
+            self.evictions += 1
+            if self._remover(chave, digest):
+                total -= tamanho
+                if total <= self.tamanho_max:
+                    break
+
+    def estatisticas(self):
+        """Contadores de hit/miss e ocupação atual."""
+        with self._lock:
+            entradas = self._db.execute("SELECT COUNT(*) FROM entradas").fetchone()[0]
+            total = self._tamanho_total()
+        consultas = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / consultas if consultas else 0.0,
+            'evictions': self.evictions,
+            'entradas': entradas,
+            'tamanho_mb': total / (1024 * 1024)
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_tile_cache():
+    """Instância compartilhada do cache (criada sob demanda)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TileCache()
+        return _cache
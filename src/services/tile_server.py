@@ -0,0 +1,260 @@
+"""
+Servidor local de tiles dos resultados de scan (XYZ, PNG transparente).
+
+O navegador só recebe os tiles da tela, nunca a lista de pontos:
+- zoom < ZOOM_PONTOS: mapa de calor agregado em células de CELULA_PX pixels
+  (kW estimado das GDs ou contagem de pontos analisados), com escala de cor fixa por zoom;
+- zoom >= ZOOM_PONTOS: cada ponto desenhado com a cor da sua situação no job.
+
+Os tiles ficam em disco por versão do job (muda quando o job grava resultados).
+
+    http://127.0.0.1:8787/tiles/<job_id>/<kw|contagem>/<z>/<x>/<y>.png
+"""
+import os
+import re
+import shutil
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from src.services.job_store import STATUS_CONCLUIDO, STATUS_ERRO, obter_job_store
+from src.services.tile_cache import CACHE_DIR
+from src.utils.tile_planner import latlon_para_mundo
+
+TILES_HOST = os.getenv("PVG_TILES_HOST", "127.0.0.1")
+TILES_PORTA = int(os.getenv("PVG_TILES_PORTA", "8787"))
+# Endereço visto pelo navegador (atrás de proxy, por exemplo); padrão: o próprio host/porta,
+# que só funciona com o navegador na mesma máquina (ver USAR_SERVIDOR_TILES em src/ui/map_view.py)
+TILES_URL = os.getenv("PVG_TILES_URL", f"http://{TILES_HOST}:{TILES_PORTA}")
+TILES_DIR = os.path.join(CACHE_DIR, "mapa_tiles")
+ZOOM_PONTOS = int(os.getenv("PVG_TILES_ZOOM_PONTOS", "15"))
+CELULA_PX = 16
+LADO_PX = 256
+# Mesma estimativa do painel de resultados (kW por GD residencial)
+POTENCIA_MEDIA_GD_KW = 4.0
+CAMADAS = ('kw', 'contagem')
+
+# Situação -> cor BGR (as mesmas cores da camada de pontos do mapa)
+PENDENTE, SEM_GD, GD, ERRO = range(4)
+CORES_BGR = {PENDENTE: (158, 158, 158), SEM_GD: (242, 192, 0), GD: (118, 230, 0), ERRO: (75, 75, 255)}
+
+_RE_CAMINHO = re.compile(r'^/tiles/([0-9a-f]+)/(kw|contagem)/(\d+)/(\d+)/(\d+)\.png$')
+
+
+def _png_vazio():
+    return cv2.imencode('.png', np.zeros((1, 1, 4), dtype=np.uint8))[1].tobytes()
+
+
+PNG_VAZIO = _png_vazio()
+
+
+class DadosJob:
+    """Pontos de um job em coordenadas de mundo (zoom 0), ordenados por x para recortar tiles por busca binária."""
+
+    def __init__(self, linhas):
+        lat = np.array([r[0] for r in linhas], dtype=float)
+        lon = np.array([r[1] for r in linhas], dtype=float)
+        validos = np.isfinite(lat) & np.isfinite(lon)
+        x, y = latlon_para_mundo(lat[validos], lon[validos], 0)
+        ordem = np.argsort(x, kind='stable')
+        self.x, self.y = x[ordem], y[ordem]
+        status = np.array([r[2] for r in linhas], dtype=object)[validos][ordem]
+        gds = np.array([r[3] or 0 for r in linhas], dtype=float)[validos][ordem]
+        self.situacao = np.full(len(self.x), PENDENTE, dtype=np.int8)
+        concluido = status == STATUS_CONCLUIDO
+        self.situacao[concluido] = np.where(gds[concluido] > 0, GD, SEM_GD)
+        self.situacao[status == STATUS_ERRO] = ERRO
+        self.pesos = {'kw': np.where(concluido, gds, 0.0) * POTENCIA_MEDIA_GD_KW,
+                      'contagem': concluido.astype(float)}
+        self._maximos = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.x)
+
+    def no_tile(self, z, tx, ty, margem_px=0):
+        """Posições (nos arrays) e pixels dentro do tile, com margem para não cortar marcadores na borda."""
+        escala = 2 ** z
+        ini = np.searchsorted(self.x, (tx * LADO_PX - margem_px) / escala, side='left')
+        fim = np.searchsorted(self.x, ((tx + 1) * LADO_PX + margem_px) / escala, side='right')
+        px = self.x[ini:fim] * escala - tx * LADO_PX
+        py = self.y[ini:fim] * escala - ty * LADO_PX
+        dentro = (py >= -margem_px) & (py < LADO_PX + margem_px)
+        return np.arange(ini, fim)[dentro], px[dentro], py[dentro]
+
+    def maximo_celula(self, camada, z):
+        """Maior valor de célula no zoom (escala de cor igual em todos os tiles do mesmo zoom)."""
+        with self._lock:
+            if (camada, z) not in self._maximos:
+                escala = 2 ** z / CELULA_PX
+                cx = np.floor(self.x * escala).astype(np.int64)
+                cy = np.floor(self.y * escala).astype(np.int64)
+                _, inverso = np.unique(cx * (int(LADO_PX * escala) + 1) + cy, return_inverse=True)
+                somas = np.bincount(inverso.ravel(), weights=self.pesos[camada]) if len(inverso) else [0.0]
+                self._maximos[(camada, z)] = float(np.max(somas))
+            return self._maximos[(camada, z)]
+
+
+def desenhar_calor(dados, camada, z, tx, ty):
+    posicoes, px, py = dados.no_tile(z, tx, ty)
+    pesos = dados.pesos[camada][posicoes]
+    if not pesos.any():
+        return None
+    lado = LADO_PX // CELULA_PX
+    celulas = np.zeros((lado, lado))
+    np.add.at(celulas, (np.clip(py // CELULA_PX, 0, lado - 1).astype(int),
+                        np.clip(px // CELULA_PX, 0, lado - 1).astype(int)), pesos)
+    # Raiz: poucas células muito cheias não apagam o resto da escala
+    intensidade = np.sqrt(celulas / max(dados.maximo_celula(camada, z), 1e-9))
+    cor = cv2.applyColorMap((intensidade * 255).astype(np.uint8), cv2.COLORMAP_INFERNO)
+    alfa = np.where(celulas > 0, (90 + intensidade * 140).astype(np.uint8), 0).astype(np.uint8)
+    rgba = np.dstack([cor, alfa])
+    return cv2.resize(rgba, (LADO_PX, LADO_PX), interpolation=cv2.INTER_NEAREST)
+
+
+def desenhar_pontos(dados, z, tx, ty):
+    raio = int(np.clip(z - ZOOM_PONTOS + 3, 3, 7))
+    posicoes, px, py = dados.no_tile(z, tx, ty, margem_px=raio + 1)
+    if not len(posicoes):
+        return None
+    tile = np.zeros((LADO_PX, LADO_PX, 4), dtype=np.uint8)
+    # GD por último: fica por cima quando pontos se sobrepõem
+    for k in np.argsort(dados.situacao[posicoes] == GD, kind='stable'):
+        centro = (int(round(px[k])), int(round(py[k])))
+        cv2.circle(tile, centro, raio, (*CORES_BGR[int(dados.situacao[posicoes[k]])], 200), -1, cv2.LINE_AA)
+        cv2.circle(tile, centro, raio, (255, 255, 255, 230), 1, cv2.LINE_AA)
+    return tile
+
+
+class ServicoTiles:
+    """Gera e guarda em disco os tiles de resultados; os dados de cada job ficam em memória por versão."""
+
+    def __init__(self, diretorio=TILES_DIR, store=None):
+        self.diretorio = diretorio
+        self.store = store or obter_job_store()
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def _versao(self, job_id):
+        job = self.store.obter_job(job_id)
+        return f"{int(job['atualizado_em'] * 1000)}_{job['total']}" if job else None
+
+    def _dados_job(self, job_id, versao):
+        with self._lock:
+            dados, versao_atual = self._dados.get(job_id, (None, None))
+            if versao_atual != versao:
+                dados = DadosJob(self.store.pontos_mapa(job_id))
+                self._dados[job_id] = (dados, versao)
+                # Versões antigas do job não serão mais pedidas
+                pasta_job = os.path.join(self.diretorio, job_id)
+                if os.path.isdir(pasta_job):
+                    for antiga in os.listdir(pasta_job):
+                        if antiga != versao:
+                            shutil.rmtree(os.path.join(pasta_job, antiga), ignore_errors=True)
+            return dados
+
+    def tile(self, job_id, camada, z, x, y):
+        """Bytes PNG do tile (transparente se não houver nada nele)."""
+        if camada not in CAMADAS or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            return PNG_VAZIO
+        versao = self._versao(job_id)
+        if versao is None:
+            return PNG_VAZIO
+        # Acima de ZOOM_PONTOS os tiles são os mesmos para as duas camadas
+        caminho = os.path.join(self.diretorio, job_id, versao, camada if z < ZOOM_PONTOS else 'pontos',
+                               str(z), str(x), f"{y}.png")
+        try:
+            with open(caminho, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        dados = self._dados_job(job_id, versao)
+        imagem = desenhar_calor(dados, camada, z, x, y) if z < ZOOM_PONTOS else desenhar_pontos(dados, z, x, y)
+        conteudo = PNG_VAZIO if imagem is None else cv2.imencode('.png', imagem)[1].tobytes()
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+        return conteudo
+
+
+def _handler(servico):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            casamento = _RE_CAMINHO.match(self.path.split('?')[0])
+            if not casamento:
+                self.send_error(404)
+                return
+            job_id, camada, z, x, y = casamento.groups()
+            try:
+                corpo = servico.tile(job_id, camada, int(z), int(x), int(y))
+            except Exception as e:
+                print(f"Erro no tile {self.path}: {e}")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            try:
+                self.wfile.write(corpo)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # o mapa mudou de tela antes do tile chegar
+
+        def log_message(self, *args):
+            pass
+
+    return _Handler
+
+
+def criar_servidor(host=TILES_HOST, porta=TILES_PORTA, servico=None):
+    servidor = ThreadingHTTPServer((host, porta), _handler(servico or ServicoTiles()))
+    servidor.daemon_threads = True
+    return servidor
+
+
+def url_tiles(job_id, camada='kw'):
+    """Modelo XYZ para o Leaflet."""
+    return f"{TILES_URL}/tiles/{job_id}/{camada}/{{z}}/{{x}}/{{y}}.png"
+
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def servidor_responde(host=TILES_HOST, porta=TILES_PORTA, timeout=0.5):
+    """Se quem ocupa host:porta é um servidor de tiles da plataforma (responde o tile vazio de um job)."""
+    host = '127.0.0.1' if host in ('', '0.0.0.0') else host
+    try:
+        with urllib.request.urlopen(f"http://{host}:{porta}/tiles/0/kw/0/0/0.png", timeout=timeout) as resposta:
+            return resposta.status == 200 and resposta.headers.get('Content-Type') == 'image/png'
+    except (OSError, ValueError):
+        return False
+
+
+def obter_servidor_tiles():
+    """
+    Sobe o servidor numa thread (uma vez por processo) e devolve o endereço base dos tiles.
+    Se a porta já estiver ocupada, usa o servidor de outro processo da plataforma enquanto ele
+    responder; se não for um servidor de tiles (ou cair), devolve None e o mapa desenha no cliente.
+    """
+    global _servidor
+    with _servidor_lock:
+        if _servidor is None:
+            try:
+                _servidor = criar_servidor(TILES_HOST, TILES_PORTA)
+                threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+            except OSError as e:
+                print(f"Servidor de tiles não iniciado em {TILES_HOST}:{TILES_PORTA} ({e}); "
+                      f"usando o de outro processo, se responder.")
+                _servidor = False
+        if _servidor is False and not servidor_responde(TILES_HOST, TILES_PORTA):
+            return None
+        return TILES_URL
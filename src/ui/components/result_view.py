@@ -1,23 +1,67 @@
+import os
+
 import streamlit as st
 import pandas as pd
 
+from src.services.aneel_mirror import obter_espelho_aneel
+from src.services.cross_reference import (NAO_REGISTRADO, cruzar_deteccoes, deteccoes_do_job,
+                                          relatorio_por_subestacao)
+from src.services.evidence_store import garantir_evidencia, obter_armazem_evidencias
+from src.services.job_store import obter_job_store
+
+ITENS_POR_PAGINA = 24
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _csv_job(job_id, analisados):
+    # 'analisados' entra na chave: o CSV é refeito quando o job avança
+    return pd.DataFrame(obter_job_store().resultados(job_id)).to_csv(index=False).encode('utf-8')
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _cruzamento_job(job_id, analisados, versao_espelho):
+    # Join espacial em lote contra o espelho inteiro: refeito só quando o job ou o espelho mudam
+    espelho = obter_espelho_aneel()
+    cruzado = cruzar_deteccoes(deteccoes_do_job(job_id), espelho.df)
+    return cruzado, relatorio_por_subestacao(cruzado)
+
+
+def _render_cruzamento(job_id, analisados):
+    espelho = obter_espelho_aneel()
+    if espelho is None:
+        st.caption("🔎 Sincronize o espelho da ANEEL (`python -m src.cli sync-aneel`) para cruzar as detecções "
+                   "com as usinas registradas.")
+        return
+    st.markdown("### 🔎 Cruzamento com a ANEEL")
+    cruzado, relatorio = _cruzamento_job(job_id, analisados, os.path.getmtime(espelho.caminho))
+    if cruzado.empty:
+        st.caption("Nenhuma GD detectada para cruzar.")
+        return
+    nao_registradas = int((cruzado['situacao'] == NAO_REGISTRADO).sum())
+    st.metric("GDs sem registro na ANEEL", nao_registradas, f"{nao_registradas / len(cruzado):.0%} das detecções",
+              delta_color="inverse")
+    st.dataframe(relatorio, use_container_width=True, hide_index=True)
+    st.download_button("Baixar cruzamento (CSV)", cruzado.to_csv(index=False).encode('utf-8'),
+                       file_name="cruzamento_aneel.csv", mime="text/csv")
+
 
-def render_results_view(results_ia, raio_km):
+def render_results_view(job_id, raio_km):
     """
     Renderiza o painel de resultados: Métricas, Gráficos e Galeria de Imagens.
     Recebe:
-        - results_ia: Lista de dicionários com as imagens processadas e flags de detecção.
+        - job_id: Job de scan cujos resultados estão no SQLite (KPIs sobre todos os pontos).
         - raio_km: O raio utilizado no scan (para cálculo de área).
     """
-
-    if not results_ia:
+    store = obter_job_store()
+    resumo = store.resumo(job_id)
+    if not resumo['analisados']:
         return
 
     st.markdown("---")
     st.header("📊 Relatório de Inteligência Geoespacial")
 
-    total_analisado = len(results_ia)
-    gds_detectadas = sum(1 for r in results_ia if r.get('tem_gd', False))
+    total_analisado = resumo['analisados']
+    gds_detectadas = resumo['com_gd']
 
     area_coberta = 3.14159 * (raio_km ** 2)
 
@@ -34,7 +78,7 @@ def render_results_view(results_ia, raio_km):
         <div class="metric-card">
             <div class="metric-label">Pontos Analisados</div>
             <div class="metric-value">{total_analisado}</div>
-            <div style="font-size: 12px; color: #aaa;">Amostra Visual</div>
+            <div style="font-size: 12px; color: #aaa;">Todos os Pontos do Scan</div>
         </div>
         """, unsafe_allow_html=True)
 
@@ -76,28 +120,42 @@ def render_results_view(results_ia, raio_km):
         st.write("")
         st.info("📥 Exporte os dados para integração com sistema legado.")
 
-        df_export = pd.DataFrame(results_ia)
-        cols_to_keep = [k for k in df_export.columns if k not in ['img', 'mask']]
-        csv = df_export[cols_to_keep].to_csv(index=False).encode('utf-8')
-
         st.download_button(
             label="Baixar Relatório (CSV)",
-            data=csv,
+            data=_csv_job(job_id, total_analisado),
             file_name="relatorio_radix_scan.csv",
             mime="text/csv",
             use_container_width=True
         )
+
+    _render_cruzamento(job_id, total_analisado)
+
     st.markdown("### 📸 Evidências Visuais")
     st.caption("Imagens processadas pelo algoritmo de Visão Computacional (Verde = Detecção Positiva)")
 
+    c_filtro, c_pagina = st.columns([2, 1])
+    apenas_gd = c_filtro.toggle("Somente GD confirmada", value=False)
+    total_filtro = gds_detectadas if apenas_gd else total_analisado
+    paginas = max(1, -(-total_filtro // ITENS_POR_PAGINA))
+    pagina = c_pagina.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, step=1)
+
+    # Só a página visível sai do SQLite; o navegador recebe só as miniaturas WebP
+    pagina_resultados = store.resultados(job_id, limite=ITENS_POR_PAGINA,
+                                         deslocamento=(pagina - 1) * ITENS_POR_PAGINA, apenas_gd=apenas_gd)
+
     cols = st.columns(4)
-    for i, res in enumerate(results_ia):
+    for i, res in enumerate(pagina_resultados):
         with cols[i % 4]:
-            st.image(res['img'], use_container_width=True)
+            # Evidência que falta é gerada em segundo plano: a página não espera o download do tile
+            _, miniatura = garantir_evidencia(obter_armazem_evidencias(), res, job_id, esperar=False)
+            if miniatura:
+                st.image(miniatura, use_container_width=True)
+            else:
+                st.caption("⏳ Gerando evidência (aparece na próxima atualização)")
 
             if res.get('tem_gd'):
                 st.markdown(":white_check_mark: :green[**GD Confirmada**]")
             else:
                 st.markdown(":small_blue_diamond: :grey[Sem Painel]")
 
-            st.caption(f"Lat: {res.get('lat', 0):.5f}")
\ No newline at end of file
+            st.caption(f"Lat: {res.get('lat', 0):.5f}")
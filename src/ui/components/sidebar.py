@@ -1,5 +1,6 @@
 import streamlit as st
 from src.services.osm_service import buscar_subestacoes_osm
+from src.services.detectors import detectores_disponiveis, DETECTOR_PADRAO
 
 
 def render_sidebar():
@@ -7,8 +8,9 @@ def render_sidebar():
         st.header("RADIX | Controle")
 
         # Opções
-        modo = st.radio("Modo de Varredura", ["Edificações (OSM)", "Grid Inteligente (H3)"])
-        st.info("💡 Use 'Grid Inteligente' se o mapa não tiver casas desenhadas.")
+        modo = st.radio("Modo de Varredura", ["Edificações (OSM)", "Grid Inteligente (H3)", "Grid Regular (30 m)"])
+        st.info("💡 Use 'Grid Inteligente' se o mapa não tiver casas desenhadas: ele varre hexágonos "
+                "grandes e só refina onde encontra telhados.")
 
         cidade = st.text_input("Cidade", "Aracaju")
 
@@ -34,12 +36,20 @@ def render_sidebar():
 
         st.markdown("---")
 
-        # Calibração
         st.header("🔧 Calibrar IA")
+
+        # Motor de detecção
+        opcoes_detector = detectores_disponiveis()
+        detector = st.selectbox(
+            "Motor de Detecção", opcoes_detector,
+            index=opcoes_detector.index(DETECTOR_PADRAO) if DETECTOR_PADRAO in opcoes_detector else 0
+        )
+
+        # Calibração
         with st.expander("Ajuste Fino (Cor)", expanded=True):
             h_min = st.slider("Hue Min", 0, 179, 90)
             h_max = st.slider("Hue Max", 0, 179, 140)
             s_min = st.slider("Sat Min", 0, 255, 30)
             v_min = st.slider("Val Min", 0, 255, 40)
 
-        return modo, ([h_min, s_min, v_min], [h_max, 255, 255])
\ No newline at end of file
+        return modo, ([h_min, s_min, v_min], [h_max, 255, 255]), detector
\ No newline at end of file
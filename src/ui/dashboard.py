@@ -1,15 +1,61 @@
 import streamlit as st
 import pandas as pd
-import time
 
 from src.ui.components.sidebar import render_sidebar
 from src.ui.map_view import render_map_component
 from src.ui.components.result_view import render_results_view
 from src.ui.components.styles import apply_custom_styles
 
-from src.services.building_service import buscar_edificacoes_raio
-from src.utils.processing import prepare_scan_data
-from src.services.satellite_service import analisar_imagem_telhado
+from src.services.job_runner import (FASE_ANALISANDO, FASE_CANCELADA, FASE_CONCLUIDA, FASE_ERRO, FASE_FILA,
+                                     FASE_PREPARANDO, FASES_ATIVAS, obter_executor_jobs)
+from src.services.job_store import obter_job_store
+from src.services.evidence_store import garantir_evidencia, obter_armazem_evidencias
+
+ROTULOS_FASE = {
+    FASE_FILA: "⏳ Na fila",
+    FASE_PREPARANDO: "📡 Buscando edificações e montando a malha",
+    FASE_ANALISANDO: "🛰️ Analisando",
+    FASE_CONCLUIDA: "✅ Concluída",
+    FASE_CANCELADA: "⏸️ Cancelada",
+    FASE_ERRO: "❌ Erro",
+}
+
+
+@st.fragment(run_every=2)
+def _painel_execucoes():
+    """
+    Progresso dos scans em segundo plano. Só este trecho é refeito a cada 2 s: mapa,
+    abas e widgets continuam livres enquanto os jobs rodam.
+    """
+    executor = obter_executor_jobs()
+    vistos = st.session_state.setdefault('execucoes_vistas', {})
+    terminou = False
+    for job_id in executor.recentes()[:6]:
+        estado = executor.estado(job_id)
+        if estado is None:
+            continue  # execução antiga esquecida pelo executor entre as duas consultas
+        progresso = estado['progresso']
+        feitos = progresso['concluido'] + progresso['erro']
+        c_info, c_barra, c_acao = st.columns([2, 3, 1])
+        # A vazão fica no estado do executor: sobrevive aos reruns, ao contrário de um st.success antes do rerun
+        vazao = f" · {estado['imagens_s']:.1f} imagens/s" if estado['imagens_s'] else ""
+        c_info.markdown(f"**{estado['subestacao']}** `{job_id}`  \n{ROTULOS_FASE[estado['fase']]}{vazao}")
+        c_barra.progress(feitos / progresso['total'] if progresso['total'] else 0.0,
+                         text=f"{feitos}/{progresso['total']} pontos")
+        if estado['fase'] in FASES_ATIVAS:
+            if c_acao.button("Cancelar", key=f"cancelar_{job_id}"):
+                executor.cancelar(job_id)
+        elif c_acao.button("Ver", key=f"ver_{job_id}", disabled=st.session_state['job_id'] == job_id):
+            st.session_state['job_id'] = job_id
+            st.rerun()
+        if estado['fase'] == FASE_ERRO:
+            st.error(f"{estado['subestacao']}: {estado['erro']}")
+        # Job que acabou desde a última olhada: a página inteira é refeita com os resultados finais
+        if vistos.get(job_id) in FASES_ATIVAS and estado['fase'] not in FASES_ATIVAS:
+            terminou = True
+        vistos[job_id] = estado['fase']
+    if terminou:
+        st.rerun(scope="app")
 
 
 def render_dashboard():
@@ -17,23 +63,24 @@ def render_dashboard():
     apply_custom_styles()
 
     if 'map_center' not in st.session_state: st.session_state['map_center'] = [-10.9472, -37.0731]
-    if 'pontos_analise' not in st.session_state: st.session_state['pontos_analise'] = []
-    if 'resultados_ia' not in st.session_state: st.session_state['resultados_ia'] = []
     if 'subestacoes' not in st.session_state: st.session_state['subestacoes'] = pd.DataFrame()
+    if 'job_id' not in st.session_state: st.session_state['job_id'] = None
 
-    modo_varredura, calib_params = render_sidebar()
+    modo_varredura, calib_params, detector = render_sidebar()
 
     # 3. Layout Principal
     tab1, tab2 = st.tabs(["🗺️ Operação & Mapa", "⚙️ Laboratório IA"])
 
     with tab1:
-        # Mapa
-        df_mapa = pd.DataFrame(st.session_state['pontos_analise']) if st.session_state['pontos_analise'] else None
+        # Mapa: pontos do job selecionado, lidos do SQLite (o executor não guarda a malha gerada)
+        executor = obter_executor_jobs()
+        job_id = st.session_state['job_id']
         render_map_component(
             st.session_state['map_center'],
             16,
             st.session_state['subestacoes'],
-            df_mapa
+            (obter_job_store().pontos_do_job(job_id) if job_id else None) or None,
+            job_id=job_id
         )
 
         # Controles de Scan
@@ -44,81 +91,62 @@ def render_dashboard():
             escolha = col1.selectbox("Selecione o Ativo:", df_subs['Nome'].unique())
 
             if col2.button("INICIAR SCAN", type="primary", use_container_width=True):
-                # Pega coordenada do alvo
+                # Pega coordenada do alvo; busca, malha e análise rodam em segundo plano
                 alvo = df_subs[df_subs['Nome'] == escolha].iloc[0]
-                lat_alvo, lon_alvo = alvo['latitude'], alvo['longitude']
-
-                # --- PASSO 1: Busca Edificações (Ou Mock) ---
-                casas_df = pd.DataFrame()
-                if modo_varredura == "Edificações (OSM)":
-                    with st.spinner("Obtendo dados de edificações..."):
-                        casas_df = buscar_edificacoes_raio(lat_alvo, lon_alvo, radius_km=0.3)
-
-                with st.spinner("Calculando malha de varredura..."):
-                    lista_casas = casas_df.to_dict('records') if not casas_df.empty else []
-
-                    points = prepare_scan_data(
-                        lat_alvo, lon_alvo,
-                        buildings=lista_casas,
-                        radius_km=0.3,
-                        use_buildings=(modo_varredura == "Edificações (OSM)")
-                    )
-
-                st.session_state['pontos_analise'] = points
-
-                if points:
-                    resultados = []
-                    progresso = st.progress(0)
-                    status = st.empty()
-
-                    amostra = points[:20]
-
-                    for i, pt in enumerate(amostra):
-                        status.text(f"Analisando alvo {i + 1}/{len(amostra)}...")
-
-                        img, ratio, tem_gd = analisar_imagem_telhado(
-                            pt['latitude'],
-                            pt['longitude'],
-                            hsv_config=calib_params
-                        )
-
-                        if img:
-                            resultados.append({
-                                'img': img,
-                                'lat': pt['latitude'],
-                                'tem_gd': tem_gd
-                            })
-
-                        progresso.progress((i + 1) / len(amostra))
-                        time.sleep(0.1)
-
-                    st.session_state['resultados_ia'] = resultados
-                    st.success("Varredura Completa!")
+                st.session_state['job_id'] = executor.submeter_scan(
+                    escolha, float(alvo['latitude']), float(alvo['longitude']), modo_varredura,
+                    hsv_config=calib_params, detector=detector)
+                st.toast(f"Varredura de {escolha} enviada. Acompanhe abaixo; o mapa e o laboratório seguem livres.")
+
+        # Varreduras deste servidor (várias subestações podem rodar ao mesmo tempo)
+        if executor.recentes():
+            st.divider()
+            st.caption("🛰️ Varreduras em segundo plano")
+            _painel_execucoes()
+
+        # Jobs interrompidos (queda de rede, reinício do servidor, cancelamento...)
+        ativos = set(executor.ativos())
+        interrompidos = [j for j in obter_job_store().listar_jobs(apenas_incompletos=True)
+                         if j['parametros'].get('origem') == 'dashboard' and j['id'] not in ativos]
+        if interrompidos:
+            with st.expander(f"⏸️ {len(interrompidos)} varredura(s) interrompida(s)"):
+                rotulos = {f"{j['parametros'].get('subestacao')} ({j['id']})": j for j in interrompidos}
+                escolha_job = st.selectbox("Job:", list(rotulos))
+                if st.button("RETOMAR SCAN", use_container_width=True):
+                    job = rotulos[escolha_job]
+                    st.session_state['job_id'] = executor.retomar(
+                        job['id'], job['parametros'].get('hsv_config'), job['parametros'].get('detector'))
                     st.rerun()
-                else:
-                    st.error("Nenhum ponto gerado para varredura.")
 
         # Resultados
-        if st.session_state['resultados_ia']:
-            render_results_view(st.session_state['resultados_ia'], raio_km=0.3)
+        if st.session_state['job_id']:
+            render_results_view(st.session_state['job_id'], raio_km=0.3)
 
     with tab2:
         st.header("🔬 Laboratório de Visão Computacional")
 
-        if st.session_state['resultados_ia']:
+        resultados_lab = []
+        if st.session_state['job_id']:
+            # Só positivos primeiro: é o que se quer inspecionar num scan grande
+            store = obter_job_store()
+            resultados_lab = (store.resultados(st.session_state['job_id'], limite=200, apenas_gd=True)
+                              or store.resultados(st.session_state['job_id'], limite=200))
+
+        if resultados_lab:
 
-            opcoes_img = [f"Imagem {i + 1} (Lat: {r['lat']:.5f})" for i, r in
-                          enumerate(st.session_state['resultados_ia'])]
+            opcoes_img = [f"Imagem {i + 1} (Lat: {r['lat']:.5f})" for i, r in enumerate(resultados_lab)]
             escolha = st.selectbox("Selecione uma imagem do Scan:", options=opcoes_img)
 
             # Pega o índice da escolha
             idx = opcoes_img.index(escolha)
-            dados_escolhidos = st.session_state['resultados_ia'][idx]
+            dados_escolhidos = resultados_lab[idx]
 
             # Mostra a imagem
             col_a, col_b = st.columns(2)
             with col_a:
-                st.image(dados_escolhidos['img'], caption="Imagem Processada pela IA", use_container_width=True)
+                imagem, _ = garantir_evidencia(obter_armazem_evidencias(), dados_escolhidos,
+                                               st.session_state['job_id'])
+                st.image(imagem, caption="Imagem Processada pela IA", use_container_width=True)
 
             with col_b:
                 st.info("Status da Detecção:")
@@ -138,6 +166,6 @@ def render_dashboard():
             1. Vá na aba 'Operação & Mapa'.
             2. Selecione uma subestação.
             3. Clique em **INICIAR SCAN**.
-            4. Espere o processamento terminar.
+            4. Acompanhe o progresso (os resultados parciais já aparecem aqui).
             5. Volte aqui para analisar os resultados detalhados.
             """)
\ No newline at end of file
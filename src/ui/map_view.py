@@ -1,15 +1,135 @@
+import hashlib
+import os
+
 import folium
-from streamlit_folium import st_folium
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+from branca.element import Template
+from folium.plugins import MarkerCluster
+
+from src.services.job_store import STATUS_CONCLUIDO, STATUS_ERRO, obter_job_store
+from src.services.tile_server import obter_servidor_tiles, url_tiles
+from src.utils.geometria import desempacotar, do_ponto
+from src.utils.spatial_index import areas_de_atendimento
+
+# Acima disto os pontos são agrupados no navegador (Leaflet.markercluster) até o zoom de detalhe
+LIMITE_PONTOS_SEM_CLUSTER = int(os.getenv("PVG_MAPA_LIMITE_PONTOS", "3000"))
+ZOOM_SEM_CLUSTER = 18
+ALTURA_MAPA = 500
+# Com um job, os pontos vêm do servidor de tiles (só o que está na tela); sem job, camada no cliente.
+# Ligado só com PVG_TILES_URL (endereço que o navegador alcança) ou PVG_MAPA_TILES=1 (navegador na
+# mesma máquina): o padrão 127.0.0.1 deixaria a camada vazia para quem acessa o dashboard de fora.
+USAR_SERVIDOR_TILES = os.getenv("PVG_MAPA_TILES", "1" if os.getenv("PVG_TILES_URL") else "0") == "1"
+
+# Situação do ponto no job -> (cor, rótulo); o índice é o código enviado ao navegador
+SITUACOES = (
+    ('pendente', "#9e9e9e", "Pendente"),
+    ('sem_gd', "#00c0f2", "Sem painel"),
+    ('gd', "#00e676", "GD confirmada"),
+    ('erro', "#ff4b4b", "Erro na análise"),
+)
+_CODIGO = {nome: i for i, (nome, _, _) in enumerate(SITUACOES)}
+
+
+class _CamadaPontos(MarkerCluster):
+    """
+    Todos os pontos numa única camada desenhada em canvas: o Python manda só colunas
+    (lat, lon, código da situação) e o navegador cria os marcadores de uma vez.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var dados = {{ this.dados|tojson }};
+                var estilos = {{ this.estilos|tojson }};
+                var renderer = L.canvas({padding: 0.5});
+                var marcadores = new Array(dados.lat.length);
+                for (var i = 0; i < dados.lat.length; i++) {
+                    var e = estilos[dados.codigo[i]];
+                    marcadores[i] = L.circleMarker([dados.lat[i], dados.lon[i]], {
+                        renderer: renderer, radius: 4, weight: 1, color: e.cor, fillColor: e.cor, fillOpacity: 0.7
+                    }).bindTooltip(e.rotulo);
+                }
+                {%- if this.agrupar %}
+                var camada = L.markerClusterGroup({{ this.opcoes|tojson }});
+                camada.addLayers(marcadores);
+                {%- else %}
+                var camada = L.layerGroup(marcadores);
+                {%- endif %}
+                camada.addTo({{ this._parent.get_name() }});
+                return camada;
+            })();
+        {% endmacro %}""")
+
+    def __init__(self, lats, lons, codigos, agrupar, name=None):
+        super().__init__(name=name)
+        self._name = "CamadaPontos"
+        self.agrupar = agrupar
+        self.opcoes = {'disableClusteringAtZoom': ZOOM_SEM_CLUSTER, 'chunkedLoading': True,
+                       'spiderfyOnMaxZoom': False}
+        self.dados = {'lat': np.round(lats, 6).tolist(), 'lon': np.round(lons, 6).tolist(),
+                      'codigo': np.asarray(codigos).tolist()}
+        self.estilos = [{'cor': cor, 'rotulo': rotulo} for _, cor, rotulo in SITUACOES]
+
+
+@st.cache_data(show_spinner=False)
+def _areas_atendimento(lats, lons):
+    return areas_de_atendimento(list(lats), list(lons))
+
+
+def _desenho(ponto):
+    """Polígonos [[lat, lon], ...] do ponto (edificação ou edificações do tile); None vira bolinha."""
+    coords, offsets = do_ponto(ponto)
+    aneis = np.flatnonzero(np.diff(offsets) >= 3)
+    return desempacotar(coords, offsets, aneis.tolist()) if len(aneis) else None
+
+
+def _colunas(pontos):
+    """(ids, lats, lons, geometrias) de uma lista de pontos de prepare_scan_data ou de um DataFrame."""
+    if isinstance(pontos, pd.DataFrame):
+        ids = pontos['id'].tolist() if 'id' in pontos else [None] * len(pontos)
+        geometrias = ([_desenho(p) for p in pontos[['coords', 'offsets']].to_dict('records')]
+                      if 'coords' in pontos else [None] * len(pontos))
+        return ids, pontos['latitude'].to_numpy(float), pontos['longitude'].to_numpy(float), geometrias
+    return ([p.get('id') for p in pontos], np.array([p['latitude'] for p in pontos], dtype=float),
+            np.array([p['longitude'] for p in pontos], dtype=float), [_desenho(p) for p in pontos])
+
 
+def _situacao(situacoes, ponto_id):
+    status, tem_gd = situacoes.get(ponto_id, (None, False))
+    if status == STATUS_CONCLUIDO:
+        return 'gd' if tem_gd else 'sem_gd'
+    return 'erro' if status == STATUS_ERRO else 'pendente'
 
-def render_map_component(center, zoom, subestacoes_df, pontos_df=None):
-    # 1. Mapa Base (Google Satellite)
+
+def _assinatura(center, zoom, subestacoes_df, ids, lats, lons, job_id, versao_job=None):
+    """Chave barata do mapa: muda quando os pontos, as subestações ou a versão do job mudam."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((tuple(center), zoom, job_id)).encode())
+    h.update(lats.tobytes())
+    h.update(lons.tobytes())
+    h.update('\n'.join(map(str, ids)).encode())
+    if not subestacoes_df.empty:
+        h.update(pd.util.hash_pandas_object(subestacoes_df[['Nome', 'latitude', 'longitude']], index=False).values)
+    h.update(repr(versao_job).encode())
+    return h.hexdigest()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _html_mapa(assinatura, center, zoom, _subestacoes_df, _pontos, job_id, tiles=False):
+    # Parâmetros com '_' não entram no hash do Streamlit: a chave é a assinatura
+    ids, lats, lons, geometrias = _colunas(_pontos) if _pontos is not None else ([], np.empty(0), np.empty(0), [])
+
+    # 1. Mapa Base (Google Satellite); canvas para milhares de vetores
     m = folium.Map(
         location=center,
         zoom_start=zoom,
         max_zoom=21,
         control_scale=True,
-        tiles=None
+        tiles=None,
+        prefer_canvas=True
     )
 
     # Camada Google Híbrida
@@ -22,43 +142,89 @@ def render_map_component(center, zoom, subestacoes_df, pontos_df=None):
         max_zoom=21
     ).add_to(m)
 
-    # 2. Subestações (Ícones de Raio)
-    if not subestacoes_df.empty:
-        for _, row in subestacoes_df.iterrows():
-            folium.Marker(
-                [row['latitude'], row['longitude']],
-                icon=folium.Icon(color="red", icon="bolt", prefix="fa"),
-                tooltip=f"Sub: {row['Nome']}"
-            ).add_to(m)
+    # 2. Áreas de atendimento (Voronoi): cada ponto pertence à subestação mais próxima
+    if len(_subestacoes_df) > 1:
+        areas = _areas_atendimento(tuple(_subestacoes_df['latitude']), tuple(_subestacoes_df['longitude']))
+        for nome, poligono in zip(_subestacoes_df['Nome'], areas):
+            if poligono:
+                folium.Polygon(
+                    locations=poligono,
+                    color="#ff4b4b",
+                    weight=1,
+                    dash_array="5, 5",
+                    fill=False,
+                    tooltip=f"Área de atendimento: {nome}"
+                ).add_to(m)
 
-    # 3. Pontos de Análise (Casas ou Grid)
-    if pontos_df is not None and not pontos_df.empty:
-        for _, row in pontos_df.iterrows():
+    # 3. Subestações (Ícones de Raio)
+    for nome, lat, lon in zip(_subestacoes_df.get('Nome', []), _subestacoes_df.get('latitude', []),
+                              _subestacoes_df.get('longitude', [])):
+        folium.Marker(
+            [lat, lon],
+            icon=folium.Icon(color="red", icon="bolt", prefix="fa"),
+            tooltip=f"Sub: {nome}"
+        ).add_to(m)
 
-            # Garante que lê a área corretamente, independente do nome ou se é zero
-            area_val = row.get('area', 0)
+    # 4. Pontos de Análise: cor pela situação no job
+    situacoes = obter_job_store().situacao_pontos(job_id) if job_id else {}
+    codigos = np.array([_CODIGO[_situacao(situacoes, i)] for i in ids], dtype=np.int8)
 
-            # MODO 1: EDIFICAÇÕES (Tem desenho da casa)
-            # Verifica se a coluna 'geometria' existe E se tem dados nela
-            if 'geometria' in row and isinstance(row['geometria'], list) and len(row['geometria']) > 0:
-                folium.Polygon(
-                    locations=row['geometria'],
-                    color="#00c0f2",
-                    weight=2,
-                    fill=True,
-                    fill_opacity=0.1,
-                    popup=f"Área: {area_val:.0f} m²"  # <--- AQUI ESTAVA O ERRO (Corrigido para usar area_val)
-                ).add_to(m)
+    # MODO 1: EDIFICAÇÕES (tem desenho da casa) -> uma única camada GeoJSON
+    com_desenho = np.array([g is not None for g in geometrias], dtype=bool)
+    if com_desenho.any():
+        features = [{
+            'type': 'Feature',
+            'properties': {'situacao': SITUACOES[codigos[k]][2], 'cor': SITUACOES[codigos[k]][1]},
+            'geometry': {'type': 'MultiPolygon',
+                         'coordinates': [[[[lon, lat] for lat, lon in anel]] for anel in geometrias[k]]},
+        } for k in np.flatnonzero(com_desenho)]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name="Edificações",
+            style_function=lambda f: {'color': f['properties']['cor'], 'weight': 2, 'fillOpacity': 0.15},
+            tooltip=folium.GeoJsonTooltip(fields=['situacao'], labels=False)
+        ).add_to(m)
+
+    # MODO 2: GRID / TILES (bolinhas)
+    sem_desenho = ~com_desenho
+    if tiles:
+        # Servidor de tiles: calor agregado em zoom baixo, pontos individuais a partir de ZOOM_PONTOS
+        for camada, nome, visivel in (('kw', "Resultados do scan (kW)", True),
+                                      ('contagem', "Pontos analisados", False)):
+            folium.TileLayer(
+                tiles=url_tiles(job_id, camada),
+                attr='Varredura',
+                name=nome,
+                overlay=True,
+                show=visivel,
+                max_zoom=21,
+                max_native_zoom=21
+            ).add_to(m)
+        folium.LayerControl(collapsed=True).add_to(m)
+    elif sem_desenho.any():
+        # Sem job: uma camada em canvas, agrupada se for grande
+        _CamadaPontos(lats[sem_desenho], lons[sem_desenho], codigos[sem_desenho],
+                      agrupar=int(sem_desenho.sum()) > LIMITE_PONTOS_SEM_CLUSTER, name="Pontos").add_to(m)
+
+    return m.get_root().render()
 
-            # MODO 2: GRID (Força Bruta / Bolinhas)
-            else:
-                folium.CircleMarker(
-                    location=[row['latitude'], row['longitude']],
-                    radius=3,
-                    color="#00c0f2",
-                    fill=True,
-                    fill_opacity=0.6,
-                    popup="Ponto de Grid"
-                ).add_to(m)
 
-    return st_folium(m, width="100%", height=500)
\ No newline at end of file
+def render_map_component(center, zoom, subestacoes_df, pontos_df=None, job_id=None):
+    """
+    Mapa com subestações e pontos do scan. pontos_df: DataFrame ou lista de pontos de prepare_scan_data.
+    O HTML é montado uma vez por conjunto de pontos/progresso e reaproveitado nos reruns.
+    Com job_id, os pontos vão como overlay do servidor de tiles (calor abaixo do zoom ZOOM_PONTOS).
+    """
+    if pontos_df is not None and len(pontos_df):
+        ids, lats, lons, _ = _colunas(pontos_df)
+    else:
+        pontos_df, ids, lats, lons = None, [], np.empty(0), np.empty(0)
+    tiles = bool(job_id) and USAR_SERVIDOR_TILES and bool(obter_servidor_tiles())
+    versao_job = None
+    if job_id:
+        # Com tiles o progresso chega pelos próprios tiles: o HTML (e a posição do mapa) só muda com o status do job
+        job = obter_job_store().obter_job(job_id)
+        versao_job = (job or {}).get('status') if tiles else sorted(obter_job_store().progresso(job_id).items())
+    assinatura = _assinatura(center, zoom, subestacoes_df, ids, lats, lons, job_id, versao_job)
+    html = _html_mapa(assinatura, list(center), zoom, subestacoes_df, pontos_df, job_id, tiles)
+    components.html(html, height=ALTURA_MAPA)
@@ -0,0 +1,153 @@
+"""
+Geometrias em arrays planos: todos os vértices num único array (lat, lon) e um
+array de deslocamentos (offsets) com o início de cada polígono/linha.
+O polígono i ocupa coords[offsets[i]:offsets[i + 1]].
+Áreas e centroides são calculados para todos de uma vez com np.add.reduceat.
+"""
+import numpy as np
+
+RAIO_TERRA_M = 6371008.8
+
+
+def empacotar(geometrias):
+    """Lista de listas [[lat, lon], ...] -> (coords N x 2, offsets)."""
+    tamanhos = np.fromiter((len(g) for g in geometrias), dtype=np.int64, count=len(geometrias))
+    offsets = np.zeros(len(geometrias) + 1, dtype=np.int64)
+    np.cumsum(tamanhos, out=offsets[1:])
+    if not offsets[-1]:
+        return np.empty((0, 2)), offsets
+    coords = np.array([v for g in geometrias for v in g], dtype=float).reshape(-1, 2)
+    return coords, offsets
+
+
+def desempacotar(coords, offsets, indices=None):
+    """Volta para listas [[lat, lon], ...] (só os índices pedidos); só para desenhar (mapa/GeoJSON)."""
+    indices = range(len(offsets) - 1) if indices is None else indices
+    return [coords[offsets[i]:offsets[i + 1]].tolist() for i in indices]
+
+
+def recortar(coords, offsets, indices):
+    """(coords, offsets) só das geometrias pedidas, na ordem pedida, ainda em arrays planos."""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    inicios, tamanhos = offsets[:-1][indices], np.diff(offsets)[indices]
+    novos = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(tamanhos, out=novos[1:])
+    posicoes = np.repeat(inicios - novos[:-1], tamanhos) + np.arange(novos[-1])
+    return np.asarray(coords, dtype=float).reshape(-1, 2)[posicoes], novos
+
+
+def para_ponto(coords, offsets):
+    """Forma guardada nos pontos de scan (JSON): {'coords': [lat, lon, lat, lon, ...], 'offsets': [...]}."""
+    return {'coords': np.asarray(coords, dtype=float).ravel().tolist(),
+            'offsets': np.asarray(offsets, dtype=np.int64).tolist()}
+
+
+def do_ponto(ponto):
+    """(coords N x 2, offsets) de um ponto de scan; ponto sem polígono não tem nenhuma geometria."""
+    coords = np.asarray(ponto.get('coords') or [], dtype=float).reshape(-1, 2)
+    offsets = np.asarray(ponto.get('offsets') or [0], dtype=np.int64)
+    return coords, offsets
+
+
+def _proximos(offsets, n):
+    """Para cada vértice, a posição do vértice seguinte no mesmo anel (fecha no primeiro)."""
+    proximo = np.arange(1, n + 1)
+    fins = offsets[1:][offsets[1:] > offsets[:-1]] - 1
+    inicios = offsets[:-1][offsets[1:] > offsets[:-1]]
+    proximo[fins] = inicios
+    return proximo
+
+
+def _somar_por_anel(valores, offsets):
+    """Soma por polígono; polígonos sem vértices ficam com 0."""
+    somas = np.zeros(len(offsets) - 1)
+    cheios = offsets[1:] > offsets[:-1]
+    if len(valores) and cheios.any():
+        somas[cheios] = np.add.reduceat(valores, offsets[:-1][cheios])
+    return somas
+
+
+def area_poligonos_m2(coords, offsets):
+    """
+    Área (m²) de cada anel na esfera (Chamberlain & Duquette, a mesma do turf):
+    sem projeção por polígono, vale em qualquer latitude.
+    """
+    coords = np.asarray(coords, dtype=float)
+    if not len(coords):
+        return np.zeros(len(offsets) - 1)
+    lat, lon = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    proximo = _proximos(offsets, len(coords))
+    dlon = np.angle(np.exp(1j * (lon[proximo] - lon)))  # diferença em (-pi, pi]
+    termos = dlon * (2 + np.sin(lat) + np.sin(lat[proximo]))
+    return np.abs(_somar_por_anel(termos, offsets)) * RAIO_TERRA_M ** 2 / 2
+
+
+def centroides(coords, offsets):
+    """(lat, lon) do centroide de área de cada anel; anéis degenerados usam a média dos vértices."""
+    coords = np.asarray(coords, dtype=float)
+    n = len(offsets) - 1
+    if not len(coords):
+        return np.full(n, np.nan), np.full(n, np.nan)
+    proximo = _proximos(offsets, len(coords))
+    contagem = np.diff(offsets)
+    media_lat = _somar_por_anel(coords[:, 0], offsets) / np.maximum(contagem, 1)
+    media_lon = _somar_por_anel(coords[:, 1], offsets) / np.maximum(contagem, 1)
+    # Coordenadas relativas ao primeiro vértice: evita cancelamento numérico
+    base = np.repeat(coords[offsets[:-1][contagem > 0]], contagem[contagem > 0], axis=0)
+    y, x = (coords - base).T
+    yp, xp = y[proximo], x[proximo]
+    cruz = x * yp - xp * y
+    area2 = _somar_por_anel(cruz, offsets)
+    cx = _somar_por_anel((x + xp) * cruz, offsets)
+    cy = _somar_por_anel((y + yp) * cruz, offsets)
+    validos = np.abs(area2) > 1e-18
+    lat, lon = media_lat.copy(), media_lon.copy()
+    primeiros = np.zeros((n, 2))
+    primeiros[contagem > 0] = coords[offsets[:-1][contagem > 0]]
+    lat[validos] = primeiros[validos, 0] + cy[validos] / (3 * area2[validos])
+    lon[validos] = primeiros[validos, 1] + cx[validos] / (3 * area2[validos])
+    lat[contagem == 0] = np.nan
+    lon[contagem == 0] = np.nan
+    return lat, lon
+
+
+def caixas(coords, offsets):
+    """(lat_min, lon_min, lat_max, lon_max) de cada geometria (arrays)."""
+    coords = np.asarray(coords, dtype=float)
+    cheios = offsets[1:] > offsets[:-1]
+    saida = np.full((len(offsets) - 1, 4), np.nan)
+    if cheios.any():
+        inicios = offsets[:-1][cheios]
+        saida[cheios, 0] = np.minimum.reduceat(coords[:, 0], inicios)
+        saida[cheios, 1] = np.minimum.reduceat(coords[:, 1], inicios)
+        saida[cheios, 2] = np.maximum.reduceat(coords[:, 0], inicios)
+        saida[cheios, 3] = np.maximum.reduceat(coords[:, 1], inicios)
+    return saida.T
+
+
+def anel_de_cada_ponto(lats, lons, coords, offsets):
+    """
+    Índice do anel que contém cada ponto (regra par-ímpar), ou -1 se nenhum contém.
+    Só os pontos dentro da caixa de cada anel são testados; com anéis sobrepostos, vale o primeiro.
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    resultado = np.full(len(lats), -1, dtype=np.int64)
+    if not len(lats) or len(offsets) < 2:
+        return resultado
+    lat_min, lon_min, lat_max, lon_max = caixas(coords, offsets)
+    for i in range(len(offsets) - 1):
+        candidatos = np.flatnonzero((resultado < 0) & (lats >= lat_min[i]) & (lats <= lat_max[i]) &
+                                    (lons >= lon_min[i]) & (lons <= lon_max[i]))
+        if not len(candidatos):
+            continue
+        anel = np.asarray(coords[offsets[i]:offsets[i + 1]], dtype=float)
+        y0, x0 = anel[:, 0], anel[:, 1]
+        y1, x1 = np.roll(y0, -1), np.roll(x0, -1)
+        py, px = lats[candidatos, None], lons[candidatos, None]
+        cruza = (y0 > py) != (y1 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_corte = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        dentro = (cruza & (px < x_corte)).sum(axis=1) % 2 == 1
+        resultado[candidatos[dentro]] = i
+    return resultado
@@ -0,0 +1,199 @@
+"""
+Grid hexagonal hierárquico para o modo "Grid Inteligente (H3)".
+
+Com a biblioteca `h3` instalada os ids são células H3 de verdade; sem ela usa-se
+um grid hexagonal próprio com a mesma escala de resoluções (aresta / raiz de 7
+por nível). Nos dois casos o id da célula é estável: subestações vizinhas geram
+os mesmos ids para a mesma área e o job descarta as repetidas.
+"""
+import math
+import os
+
+import numpy as np
+
+from src.utils.processing import haversine_km
+from src.utils.tile_planner import LADO_TILE_PX, metros_por_pixel
+
+try:
+    import h3
+except ImportError:
+    h3 = None
+
+RESOLUCAO_GROSSA = int(os.getenv("PVG_HEX_RES_GROSSA", "9"))
+RESOLUCAO_FINA = int(os.getenv("PVG_HEX_RES_FINA", "11"))
+ZOOM_MAXIMO = 19
+
+# Aresta média do H3 na resolução 9; cada nível divide por raiz de 7
+ARESTA_RES9_M = 174.375668
+M_POR_GRAU = 111320.0
+_RAIZ3 = math.sqrt(3)
+
+
+def aresta_m(resolucao):
+    if h3 is not None:
+        return h3.average_hexagon_edge_length(resolucao, unit='m')
+    return ARESTA_RES9_M * 7 ** ((9 - resolucao) / 2)
+
+
+def zoom_para_resolucao(resolucao, lat):
+    """Maior zoom cujo tile cobre a célula inteira (limitado a ZOOM_MAXIMO)."""
+    diametro = 2 * aresta_m(resolucao)
+    zoom = math.floor(math.log2(LADO_TILE_PX * metros_por_pixel(lat, 0) / diametro))
+    return max(1, min(ZOOM_MAXIMO, zoom))
+
+
+# --- Grid hexagonal próprio (sem h3) ---
+# Projeção plana por faixa de 1 grau de latitude: x = lon * cos(faixa), y = lat.
+# Hexágonos "pointy-top" em coordenadas axiais (q, r).
+
+def _faixa(lat):
+    return np.floor(lat).astype(int)
+
+
+def _para_plano(lat, lon, faixa):
+    kx = M_POR_GRAU * np.cos(np.radians(faixa + 0.5))
+    return np.asarray(lon) * kx, np.asarray(lat) * M_POR_GRAU
+
+
+def _do_plano(x, y, faixa):
+    kx = M_POR_GRAU * np.cos(np.radians(faixa + 0.5))
+    return y / M_POR_GRAU, x / kx
+
+
+def _axial(x, y, aresta):
+    q = (_RAIZ3 / 3 * x - y / 3) / aresta
+    r = (2 / 3 * y) / aresta
+    # Arredondamento cúbico
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    corrige_q = (dq > dr) & (dq > ds)
+    corrige_r = ~corrige_q & (dr > ds)
+    rq = np.where(corrige_q, -rr - rs, rq)
+    rr = np.where(corrige_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def _centro_axial(q, r, aresta):
+    return _RAIZ3 * aresta * (q + r / 2), 1.5 * aresta * r
+
+
+def _id_local(resolucao, faixa, q, r):
+    return f"hx{resolucao}_{faixa}_{q}_{r}"
+
+
+def _ler_id_local(celula):
+    resolucao, faixa, q, r = celula[2:].split('_')
+    return int(resolucao), int(faixa), int(q), int(r)
+
+
+def celulas_de_pontos(lats, lons, resolucao):
+    """Id da célula que contém cada ponto."""
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    if h3 is not None:
+        return [h3.latlng_to_cell(la, lo, resolucao) for la, lo in zip(lats.tolist(), lons.tolist())]
+    faixas = _faixa(lats)
+    x, y = _para_plano(lats, lons, faixas)
+    q, r = _axial(x, y, aresta_m(resolucao))
+    return [_id_local(resolucao, f, a, b) for f, a, b in zip(faixas.tolist(), q.tolist(), r.tolist())]
+
+
+def resolucao_celula(celula):
+    if h3 is not None:
+        return h3.get_resolution(celula)
+    return _ler_id_local(celula)[0]
+
+
+def centro_celula(celula):
+    """(lat, lon) do centro da célula."""
+    if h3 is not None:
+        return h3.cell_to_latlng(celula)
+    resolucao, faixa, q, r = _ler_id_local(celula)
+    x, y = _centro_axial(q, r, aresta_m(resolucao))
+    lat, lon = _do_plano(x, y, faixa)
+    return float(lat), float(lon)
+
+
+def celulas_no_raio(center_lat, center_lon, radius_km, resolucao, cobrir=False):
+    """
+    Células cujo centro está a até radius_km do ponto.
+    cobrir=True inclui também as que só tocam o círculo (centro a até radius_km + aresta).
+    """
+    aresta = aresta_m(resolucao)
+    if cobrir:
+        radius_km += aresta / 1000
+    k = math.ceil(radius_km * 1000 / (_RAIZ3 * aresta)) + 1
+
+    if h3 is not None:
+        celulas = sorted(h3.grid_disk(h3.latlng_to_cell(center_lat, center_lon, resolucao), k))
+        centros = np.array([h3.cell_to_latlng(c) for c in celulas])
+        dentro = haversine_km(center_lat, center_lon, centros[:, 0], centros[:, 1]) <= radius_km
+        return [c for c, ok in zip(celulas, dentro.tolist()) if ok]
+
+    faixa = int(_faixa(np.array(center_lat)))
+    x0, y0 = _para_plano(center_lat, center_lon, faixa)
+    q0, r0 = _axial(np.array(x0), np.array(y0), aresta)
+    dq, dr = np.meshgrid(np.arange(-k, k + 1), np.arange(-k, k + 1), indexing='ij')
+    no_disco = np.abs(dq + dr) <= k
+    q, r = int(q0) + dq[no_disco], int(r0) + dr[no_disco]
+    lat, lon = _do_plano(*_centro_axial(q, r, aresta), faixa)
+    dentro = haversine_km(center_lat, center_lon, lat, lon) <= radius_km
+    return [_id_local(resolucao, faixa, a, b) for a, b in zip(q[dentro].tolist(), r[dentro].tolist())]
+
+
+def filhos(celula, resolucao=None):
+    """Células da resolução seguinte (ou da indicada) contidas na célula."""
+    resolucao_pai = resolucao_celula(celula)
+    resolucao = resolucao or resolucao_pai + 1
+    if h3 is not None:
+        return sorted(h3.cell_to_children(celula, resolucao))
+
+    _, faixa, q_pai, r_pai = _ler_id_local(celula)
+    aresta_pai, aresta = aresta_m(resolucao_pai), aresta_m(resolucao)
+    x0, y0 = _centro_axial(q_pai, r_pai, aresta_pai)
+    qc, rc = _axial(np.array(x0), np.array(y0), aresta)
+    k = math.ceil(aresta_pai / (_RAIZ3 * aresta / 2)) + 1
+    dq, dr = np.meshgrid(np.arange(-k, k + 1), np.arange(-k, k + 1), indexing='ij')
+    q, r = int(qc) + dq.ravel(), int(rc) + dr.ravel()
+    # Filho = célula fina cujo centro cai no pai (partição exata, sem sobreposição)
+    qp, rp = _axial(*_centro_axial(q, r, aresta), aresta_pai)
+    meus = (qp == q_pai) & (rp == r_pai)
+    return [_id_local(resolucao, faixa, a, b) for a, b in zip(q[meus].tolist(), r[meus].tolist())]
+
+
+def pontos_de_celulas(celulas, resolucao_alvo=RESOLUCAO_FINA):
+    """Pontos de scan (mesmo formato de prepare_scan_data) centrados em cada célula."""
+    pontos = []
+    for celula in celulas:
+        lat, lon = centro_celula(celula)
+        resolucao = resolucao_celula(celula)
+        pontos.append({
+            'id': f"hex_{celula}",
+            'latitude': lat,
+            'longitude': lon,
+            'type': 'hex',
+            'celula': celula,
+            'resolucao': resolucao,
+            'resolucao_alvo': resolucao_alvo,
+            'zoom': zoom_para_resolucao(resolucao, lat),
+        })
+    return pontos
+
+
+def generate_hex_points(center_lat, center_lon, radius_km=0.5, resolucao=RESOLUCAO_GROSSA,
+                        resolucao_alvo=RESOLUCAO_FINA):
+    """Passada grossa do grid hexagonal: uma célula (um tile) por hexágono de `resolucao`."""
+    celulas = celulas_no_raio(center_lat, center_lon, radius_km, resolucao, cobrir=True)
+    return pontos_de_celulas(celulas, resolucao_alvo)
+
+
+def deve_refinar(ponto, resultado):
+    """A célula grossa só é subdividida se a passada achou telhado/painel candidato."""
+    if ponto.get('type') != 'hex' or ponto.get('resolucao', 0) >= ponto.get('resolucao_alvo', 0):
+        return False
+    return bool(resultado.get('tem_gd') or resultado.get('deteccoes'))
+
+
+def refinar(ponto):
+    """Pontos da resolução seguinte dentro da célula do ponto."""
+    return pontos_de_celulas(filhos(ponto['celula']), ponto['resolucao_alvo'])
@@ -0,0 +1,45 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def criar_sessao(pool_size=16):
+    """Cria uma requests.Session com pool de conexões reaproveitáveis (keep-alive)."""
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    return sessao
+
+
+class LimitadorPorHost:
+    """
+    Limita requisições por segundo para cada host (token bucket).
+    Seguro para uso a partir de várias threads.
+    """
+
+    def __init__(self, req_por_segundo=10.0, rajada=None):
+        self.taxa = float(req_por_segundo)
+        self.rajada = float(rajada or max(1.0, req_por_segundo))
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def aguardar(self, url):
+        """Bloqueia até existir uma ficha disponível para o host da URL."""
+        if self.taxa <= 0:
+            return
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                fichas, ultimo = self._baldes.get(host, (self.rajada, agora))
+                fichas = min(self.rajada, fichas + (agora - ultimo) * self.taxa)
+                if fichas >= 1:
+                    self._baldes[host] = (fichas - 1, agora)
+                    return
+                self._baldes[host] = (fichas, agora)
+                espera = (1 - fichas) / self.taxa
+            time.sleep(espera)
@@ -1,10 +1,16 @@
 import math
 import random
 
+import numpy as np
+
+from src.utils.geometria import para_ponto
+
+RAIO_TERRA_KM = 6371
+
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calcula distância em km entre dois pontos."""
-    R = 6371
+    R = RAIO_TERRA_KM
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
@@ -12,66 +18,150 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
 
 
+def ponto_id(tipo, lat, lon):
+    """Identificador estável do ponto (~10 cm), usado para resultados e evidências."""
+    return f"{tipo}_{lat:.6f}_{lon:.6f}"
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Haversine em arrays (broadcast do NumPy): distâncias em km."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distancia_equiretangular_km(lat1, lon1, lat2, lon2):
+    """Aproximação plana (erro < 0,1% abaixo de ~50 km), mais barata que a haversine."""
+    phi_media = np.radians((np.add(lat1, lat2)) / 2)
+    x = np.radians(np.subtract(lon2, lon1)) * np.cos(phi_media)
+    y = np.radians(np.subtract(lat2, lat1))
+    return RAIO_TERRA_KM * np.hypot(x, y)
+
+
+def gerar_grid(center_lat, center_lon, radius_km=0.5, spacing_meters=30):
+    """
+    Grid matemático vetorizado: dict com arrays 'latitude' e 'longitude'
+    (mesma ordem do laço linha a linha, linhas = latitude).
+    A haversine é separável por linha/coluna, então o teste do raio vira uma soma
+    externa de dois vetores comparada com o limite em 'a' (sem atan2 por célula).
+    """
+    # 1 grau lat ~ 111km
+    lat_step = (spacing_meters / 1000.0) / 111.0
+    lon_step = (spacing_meters / 1000.0) / (111.0 * math.cos(math.radians(center_lat)))
+
+    num_steps = int(radius_km / (spacing_meters / 1000.0))
+    passos = np.arange(-num_steps, num_steps + 1)
+    lats = center_lat + passos * lat_step
+    lons = center_lon + passos * lon_step
+
+    phi0 = math.radians(center_lat)
+    termo_lat = np.sin(np.radians(lats - center_lat) / 2) ** 2
+    termo_cos = math.cos(phi0) * np.cos(np.radians(lats))
+    termo_lon = np.sin(np.radians(lons - center_lon) / 2) ** 2
+    limite = math.sin(min(radius_km / (2 * RAIO_TERRA_KM), math.pi / 2)) ** 2
+
+    dentro = termo_lat[:, None] + termo_cos[:, None] * termo_lon[None, :] <= limite
+    i, j = np.nonzero(dentro)
+    return {'latitude': lats[i], 'longitude': lons[j]}
+
+
 def generate_grid_points(center_lat, center_lon, radius_km=0.5, spacing_meters=30):
-    """Gera grid matemático simples (sem H3)."""
-    points = []
+    """Gera grid matemático simples (sem H3) como lista de dicts (visão de gerar_grid)."""
     try:
-        # 1 grau lat ~ 111km
-        lat_step = (spacing_meters / 1000.0) / 111.0
-        lon_step = (spacing_meters / 1000.0) / (111.0 * math.cos(math.radians(center_lat)))
-
-        num_steps = int(radius_km / (spacing_meters / 1000.0))
-
-        for i in range(-num_steps, num_steps + 1):
-            for j in range(-num_steps, num_steps + 1):
-                lat = center_lat + i * lat_step
-                lon = center_lon + j * lon_step
-                if haversine_distance(center_lat, center_lon, lat, lon) <= radius_km:
-                    points.append({
-                        'latitude': lat,
-                        'longitude': lon,
-                        'type': 'grid',
-                        'geometria': []
-                    })
-        return points
+        grid = gerar_grid(center_lat, center_lon, radius_km, spacing_meters)
+        return [{
+            'id': ponto_id('grid', lat, lon),
+            'latitude': lat,
+            'longitude': lon,
+            'type': 'grid',
+        } for lat, lon in zip(grid['latitude'].tolist(), grid['longitude'].tolist())]
     except Exception as e:
         print(f"Erro grid: {e}")
         return []
 
 
-def prepare_scan_data(center_lat, center_lon, buildings=[], radius_km=0.5, use_buildings=True):
-    """Prepara a lista final de pontos para o scan."""
+def pontos_de_edificacoes(buildings):
+    """
+    Pontos 'building' de um DataFrame de edificacoes_df (polígono em attrs['coords'][inicio:fim])
+    ou de uma lista de dicts do Overpass. O polígono vai no ponto já plano (coords/offsets).
+    """
+    coords = getattr(buildings, 'attrs', {}).get('coords')
+    registros = buildings.to_dict('records') if hasattr(buildings, 'to_dict') else buildings
+    pontos = []
+    for b in registros:
+        # Tenta pegar o centro de várias formas
+        lat = b.get('center', {}).get('lat') or b.get('centro_lat')
+        lon = b.get('center', {}).get('lon') or b.get('centro_lon')
+        if not (lat and lon):
+            continue
+        if coords is not None:
+            anel = coords[int(b['inicio']):int(b['fim'])]
+        else:
+            # Overpass devolve {'lat', 'lon'}
+            anel = [(v['lat'], v['lon']) if isinstance(v, dict) else v for v in b.get('geometry') or []]
+        ponto = {
+            'id': f"osm_{b['id']}" if b.get('id') is not None else ponto_id('building', lat, lon),
+            'latitude': lat,
+            'longitude': lon,
+            'type': 'building',
+        }
+        if len(anel):
+            ponto.update(para_ponto(anel, [0, len(anel)]))
+        pontos.append(ponto)
+    return pontos
+
+
+def prepare_scan_data(center_lat, center_lon, buildings=[], radius_km=0.5, use_buildings=True, hexagonal=False,
+                      agrupar_tiles=False, filtrar_ruas=False):
+    """
+    Prepara a lista final de pontos para o scan.
+    buildings: DataFrame de buscar_edificacoes_raio (ou lista de dicts, ver pontos_de_edificacoes).
+    hexagonal=True (sem edificações): passada grossa do grid hexagonal; as células
+    com telhado/painel são refinadas durante o job.
+    agrupar_tiles=True: edificações que cabem na mesma imagem viram um único ponto 'tile'.
+    filtrar_ruas=True: descarta os pontos do grid regular que caem sobre ruas.
+    """
     final_points = []
 
-    if use_buildings and buildings:
+    if use_buildings and buildings is not None and len(buildings):
         print(f"Usando {len(buildings)} edificações...")
-        for b in buildings:
-            # Tenta pegar o centro de várias formas
-            lat = b.get('center', {}).get('lat') or b.get('centro_lat')
-            lon = b.get('center', {}).get('lon') or b.get('centro_lon')
-            geo = b.get('geometry') or b.get('geometria')
-
-            if lat and lon:
-                final_points.append({
-                    'latitude': lat,
-                    'longitude': lon,
-                    'type': 'building',
-                    'geometria': geo
-                })
+        final_points = pontos_de_edificacoes(buildings)
+
+    if final_points and agrupar_tiles:
+        from src.utils.tile_planner import planejar_tiles
+
+        final_points = planejar_tiles(final_points)
+        print(f"{len(final_points)} imagens cobrem as edificações.")
+
+    if not final_points and hexagonal:
+        from src.utils.hexgrid import generate_hex_points
+
+        print("Gerando Grid Hexagonal...")
+        final_points = generate_hex_points(center_lat, center_lon, radius_km)
 
     if not final_points:
         print("Gerando Grid Matemático...")
         final_points = generate_grid_points(center_lat, center_lon, radius_km)
+        if filtrar_ruas:
+            from src.services.osm_service import filtrar_pontos_em_ruas
+
+            total = len(final_points)
+            final_points = filtrar_pontos_em_ruas(final_points)
+            print(f"{total - len(final_points)} pontos sobre ruas descartados.")
 
     # 3. Fallback de Emergência (Se tudo falhar, gera aleatório)
     if not final_points:
         print("Fallback Emergência...")
         for _ in range(20):
+            lat = center_lat + random.uniform(-0.005, 0.005)
+            lon = center_lon + random.uniform(-0.005, 0.005)
             final_points.append({
-                'latitude': center_lat + random.uniform(-0.005, 0.005),
-                'longitude': center_lon + random.uniform(-0.005, 0.005),
+                'id': ponto_id('random', lat, lon),
+                'latitude': lat,
+                'longitude': lon,
                 'type': 'random',
-                'geometria': []
             })
 
     return final_points
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+Índice espacial em memória para pontos (edificações, pontos de scan, subestações).
+
+Os pontos são projetados num plano métrico local (equiretangular em torno da
+latitude média), o que basta para consultas na escala de uma cidade. Com scipy
+instalado usa cKDTree; sem ele, baldes de grade ordenados com NumPy.
+"""
+import math
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+M_POR_GRAU = 111320.0
+# Acima disto a busca de vizinho mais próximo sem scipy deixa a força bruta e usa os baldes
+LIMITE_FORCA_BRUTA = 4096
+
+
+class IndiceEspacial:
+    """
+    Construído uma vez por scan; consultas em lote de raio, caixa e vizinho mais próximo.
+    Todas as consultas devolvem posições nos arrays de entrada.
+    """
+
+    def __init__(self, lats, lons, tamanho_balde_m=250.0, lat_referencia=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        if lat_referencia is None:
+            lat_referencia = float(np.mean(self.lats)) if len(self.lats) else 0.0
+        self.lat_ref = lat_referencia
+        self._kx = M_POR_GRAU * math.cos(math.radians(self.lat_ref))
+        self.xy = self.projetar(self.lats, self.lons)
+        self.tamanho_balde = tamanho_balde_m
+        self._arvore = cKDTree(self.xy) if cKDTree is not None and len(self.xy) else None
+        if self._arvore is None:
+            self._montar_baldes()
+
+    def __len__(self):
+        return len(self.lats)
+
+    def projetar(self, lats, lons):
+        """(lat, lon) -> metros no plano do índice (array N x 2)."""
+        lats, lons = np.atleast_1d(np.asarray(lats, dtype=float)), np.atleast_1d(np.asarray(lons, dtype=float))
+        return np.column_stack([lons * self._kx, lats * M_POR_GRAU])
+
+    def desprojetar(self, xy):
+        xy = np.atleast_2d(xy)
+        return xy[:, 1] / M_POR_GRAU, xy[:, 0] / self._kx
+
+    # --- Baldes de grade (sem scipy) ---
+
+    def _chaves(self, celulas):
+        return celulas[:, 0] * 1_000_003 + celulas[:, 1]
+
+    def _montar_baldes(self):
+        celulas = np.floor(self.xy / self.tamanho_balde).astype(np.int64)
+        chaves = self._chaves(celulas)
+        self._ordem = np.argsort(chaves, kind='stable')
+        self._chaves_ordenadas = chaves[self._ordem]
+
+    def _candidatos(self, xmin, ymin, xmax, ymax):
+        """Índices dos pontos nos baldes que tocam a caixa (em metros)."""
+        c0 = np.floor(np.array([xmin, ymin]) / self.tamanho_balde).astype(np.int64)
+        c1 = np.floor(np.array([xmax, ymax]) / self.tamanho_balde).astype(np.int64)
+        partes = []
+        for cx in range(c0[0], c1[0] + 1):
+            # Chaves consecutivas numa coluna de baldes: uma busca binária por coluna
+            ini = np.searchsorted(self._chaves_ordenadas, cx * 1_000_003 + c0[1], side='left')
+            fim = np.searchsorted(self._chaves_ordenadas, cx * 1_000_003 + c1[1], side='right')
+            partes.append(self._ordem[ini:fim])
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+
+    # --- Consultas ---
+
+    def no_raio(self, lat, lon, raio_m):
+        """Posições dos pontos a até raio_m de (lat, lon)."""
+        centro = self.projetar(lat, lon)[0]
+        if self._arvore is not None:
+            return np.sort(np.asarray(self._arvore.query_ball_point(centro, raio_m), dtype=np.int64))
+        cand = self._candidatos(centro[0] - raio_m, centro[1] - raio_m, centro[0] + raio_m, centro[1] + raio_m)
+        dentro = np.hypot(*(self.xy[cand] - centro).T) <= raio_m
+        return np.sort(cand[dentro])
+
+    def no_raio_lote(self, lats, lons, raio_m):
+        """no_raio para vários centros: lista de arrays de posições."""
+        if self._arvore is not None:
+            vizinhos = self._arvore.query_ball_point(self.projetar(lats, lons), raio_m)
+            return [np.sort(np.asarray(v, dtype=np.int64)) for v in vizinhos]
+        return [self.no_raio(la, lo, raio_m) for la, lo in zip(np.atleast_1d(lats), np.atleast_1d(lons))]
+
+    def na_caixa(self, lat_min, lon_min, lat_max, lon_max):
+        """Posições dos pontos dentro da caixa lat/lon."""
+        if self._arvore is not None or not len(self):
+            dentro = ((self.lats >= lat_min) & (self.lats <= lat_max) &
+                      (self.lons >= lon_min) & (self.lons <= lon_max))
+            return np.nonzero(dentro)[0]
+        (xmin, ymin), (xmax, ymax) = self.projetar([lat_min, lat_max], [lon_min, lon_max])
+        cand = self._candidatos(xmin, ymin, xmax, ymax)
+        la, lo = self.lats[cand], self.lons[cand]
+        dentro = (la >= lat_min) & (la <= lat_max) & (lo >= lon_min) & (lo <= lon_max)
+        return np.sort(cand[dentro])
+
+    def pares_no_raio(self, lats, lons, raio_m):
+        """
+        Todos os pares (consulta, ponto do índice) a até raio_m, sem laço por consulta.
+        Devolve (posições nas consultas, posições no índice, distâncias em m).
+        """
+        consultas = self.projetar(lats, lons)
+        if not len(self) or not len(consultas):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        if self._arvore is not None:
+            matriz = cKDTree(consultas).sparse_distance_matrix(self._arvore, raio_m, output_type='coo_matrix')
+            return matriz.row.astype(np.int64), matriz.col.astype(np.int64), matriz.data
+        # Grade com célula do tamanho do raio: os vizinhos estão nas 3x3 células em volta
+        ordem = np.argsort(self._chaves(np.floor(self.xy / raio_m).astype(np.int64)), kind='stable')
+        chaves_ordenadas = self._chaves(np.floor(self.xy[ordem] / raio_m).astype(np.int64))
+        celulas = np.floor(consultas / raio_m).astype(np.int64)
+        lado_q, lado_i = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                chaves = self._chaves(celulas + (dx, dy))
+                ini = np.searchsorted(chaves_ordenadas, chaves, side='left')
+                n = np.searchsorted(chaves_ordenadas, chaves, side='right') - ini
+                if not n.any():
+                    continue
+                # Expande cada intervalo [ini, ini + n) sem laço Python
+                deslocamento = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+                lado_q.append(np.repeat(np.arange(len(consultas)), n))
+                lado_i.append(ordem[np.repeat(ini, n) + deslocamento])
+        if not lado_q:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        q, i = np.concatenate(lado_q), np.concatenate(lado_i)
+        distancias = np.hypot(*(self.xy[i] - consultas[q]).T)
+        perto = distancias <= raio_m
+        return q[perto], i[perto], distancias[perto]
+
+    def mais_proximo(self, lats, lons, bloco=8192):
+        """(posição, distância em metros) do ponto do índice mais próximo de cada consulta."""
+        consultas = self.projetar(lats, lons)
+        if not len(self):
+            return np.full(len(consultas), -1, dtype=np.int64), np.full(len(consultas), np.inf)
+        if self._arvore is not None:
+            distancias, posicoes = self._arvore.query(consultas)
+            return np.asarray(posicoes, dtype=np.int64), np.asarray(distancias)
+        if len(self) <= LIMITE_FORCA_BRUTA:
+            # Poucos alvos (ex.: subestações): matriz de distâncias em blocos
+            posicoes = np.empty(len(consultas), dtype=np.int64)
+            distancias = np.empty(len(consultas))
+            for i in range(0, len(consultas), bloco):
+                d2 = ((consultas[i:i + bloco, None, :] - self.xy[None, :, :]) ** 2).sum(axis=2)
+                posicoes[i:i + bloco] = d2.argmin(axis=1)
+                distancias[i:i + bloco] = np.sqrt(d2[np.arange(len(d2)), posicoes[i:i + bloco]])
+            return posicoes, distancias
+        return self._mais_proximo_baldes(consultas)
+
+    def _mais_proximo_baldes(self, consultas):
+        posicoes = np.full(len(consultas), -1, dtype=np.int64)
+        distancias = np.full(len(consultas), np.inf)
+        for k, (x, y) in enumerate(consultas):
+            raio = self.tamanho_balde
+            while True:
+                cand = self._candidatos(x - raio, y - raio, x + raio, y + raio)
+                if len(cand):
+                    d = np.hypot(self.xy[cand, 0] - x, self.xy[cand, 1] - y)
+                    j = d.argmin()
+                    # Só é garantido se o melhor estiver dentro do círculo inscrito na caixa
+                    if d[j] <= raio or len(cand) == len(self):
+                        posicoes[k], distancias[k] = cand[j], d[j]
+                        break
+                raio *= 2
+        return posicoes, distancias
+
+
+def _recortar(poligono, normal, limite):
+    """Sutherland-Hodgman: mantém a parte do polígono com normal . p <= limite."""
+    saida = []
+    n = len(poligono)
+    for i in range(n):
+        atual, proximo = poligono[i], poligono[(i + 1) % n]
+        da, dp = normal @ atual - limite, normal @ proximo - limite
+        if da <= 0:
+            saida.append(atual)
+        if da * dp < 0:
+            saida.append(atual + (proximo - atual) * (da / (da - dp)))
+    return saida
+
+
+def atribuir_mais_proximo(lats, lons, alvo_lats, alvo_lons):
+    """Para cada ponto, a posição do alvo mais próximo (ex.: subestação que o atende) e a distância em m."""
+    return IndiceEspacial(alvo_lats, alvo_lons).mais_proximo(lats, lons)
+
+
+def areas_de_atendimento(lats, lons, margem_km=2.0):
+    """
+    Áreas de atendimento (células de Voronoi) das subestações, recortadas numa caixa
+    com `margem_km` de folga. Devolve um polígono [[lat, lon], ...] por subestação.
+    """
+    indice = IndiceEspacial(lats, lons)
+    pontos = indice.xy
+    if not len(pontos):
+        return []
+    margem = margem_km * 1000
+    (xmin, ymin), (xmax, ymax) = pontos.min(axis=0) - margem, pontos.max(axis=0) + margem
+    caixa = [np.array(p) for p in ((xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax))]
+
+    areas = []
+    for i, p in enumerate(pontos):
+        poligono = caixa
+        distancias = np.hypot(*(pontos - p).T)
+        # Vizinhos mais próximos primeiro: o polígono encolhe rápido e os demais deixam de cortar
+        for j in np.argsort(distancias):
+            if j == i or not poligono:
+                continue
+            alcance = max(np.hypot(*(v - p)) for v in poligono)
+            if distancias[j] / 2 > alcance:
+                break
+            q = pontos[j]
+            if np.allclose(p, q):
+                continue
+            normal = q - p
+            poligono = _recortar(poligono, normal, normal @ (p + q) / 2)
+        lat, lon = indice.desprojetar(np.array(poligono)) if poligono else ([], [])
+        areas.append([[float(a), float(b)] for a, b in zip(lat, lon)])
+    return areas
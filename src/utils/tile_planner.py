@@ -0,0 +1,215 @@
+"""
+Planejamento de tiles: cobre as edificações alvo com o mínimo de imagens
+e devolve as detecções de cada imagem para as edificações (pixel -> lat/lon).
+
+Toda a geometria é feita em pixels do mundo Web Mercator no zoom do tile,
+onde a pegada de uma imagem 600x600 é exatamente 600x600 px em qualquer latitude.
+"""
+import math
+import os
+
+import cv2
+import numpy as np
+
+from src.services.tile_cache import quantizar_coordenada
+from src.utils.geometria import do_ponto, recortar
+
+# Static Maps: lado lógico e escala (a imagem decodificada tem LADO * ESCALA px)
+LADO_TILE_PX = 600
+ESCALA_TILE = 2
+TAMANHO_MUNDO_Z0 = 256
+M_POR_PX_ZOOM0 = 156543.03392
+# Folga na borda (px lógicos) para que a edificação não fique cortada (~9 m no zoom 19)
+MARGEM_TILE_PX = int(os.getenv("PVG_MARGEM_TILE_PX", "30"))
+# Detecção sem polígono da edificação vai para o centroide mais próximo até este raio
+RAIO_ATRIBUICAO_M = float(os.getenv("PVG_RAIO_ATRIBUICAO_M", "12"))
+# Folga da máscara de telhado em volta do polígono OSM (desalinhamento da imagem, beirais)
+MARGEM_TELHADO_M = float(os.getenv("PVG_MARGEM_TELHADO_M", "2"))
+
+
+def metros_por_pixel(lat, zoom):
+    """Metros por pixel lógico no zoom e latitude dados."""
+    return M_POR_PX_ZOOM0 * np.cos(np.radians(lat)) / 2 ** zoom
+
+
+def pegada_tile_m(lat, zoom, lado_px=LADO_TILE_PX):
+    """Lado (m) do terreno coberto por uma imagem."""
+    return lado_px * metros_por_pixel(lat, zoom)
+
+
+def latlon_para_mundo(lat, lon, zoom):
+    """Coordenadas em pixels do mundo Web Mercator (arrays)."""
+    escala = TAMANHO_MUNDO_Z0 * 2 ** zoom
+    sen = np.clip(np.sin(np.radians(lat)), -0.9999, 0.9999)
+    x = (np.asarray(lon) + 180.0) / 360.0 * escala
+    y = (0.5 - np.log((1 + sen) / (1 - sen)) / (4 * math.pi)) * escala
+    return x, y
+
+
+def mundo_para_latlon(x, y, zoom):
+    escala = TAMANHO_MUNDO_Z0 * 2 ** zoom
+    lon = np.asarray(x) / escala * 360.0 - 180.0
+    n = math.pi - 2 * math.pi * np.asarray(y) / escala
+    lat = np.degrees(np.arctan(np.sinh(n)))
+    return lat, lon
+
+
+def pixel_para_latlon(px, py, centro_lat, centro_lon, zoom, escala=ESCALA_TILE, lado_px=LADO_TILE_PX):
+    """Pixel da imagem decodificada (origem no canto superior esquerdo) -> (lat, lon)."""
+    cx, cy = latlon_para_mundo(centro_lat, centro_lon, zoom)
+    x = cx + (np.asarray(px) / escala - lado_px / 2)
+    y = cy + (np.asarray(py) / escala - lado_px / 2)
+    return mundo_para_latlon(x, y, zoom)
+
+
+def latlon_para_pixel(lat, lon, centro_lat, centro_lon, zoom, escala=ESCALA_TILE, lado_px=LADO_TILE_PX):
+    """(lat, lon) -> pixel da imagem decodificada centrada em (centro_lat, centro_lon)."""
+    cx, cy = latlon_para_mundo(centro_lat, centro_lon, zoom)
+    x, y = latlon_para_mundo(lat, lon, zoom)
+    return (x - cx + lado_px / 2) * escala, (y - cy + lado_px / 2) * escala
+
+
+def _cobrir_faixa(xs, lado):
+    """Cobertura ótima 1D: intervalos de comprimento `lado` a partir do primeiro ponto descoberto."""
+    grupos = []
+    inicio = 0
+    while inicio < len(xs):
+        fim = np.searchsorted(xs, xs[inicio] + lado, side='right')
+        grupos.append((inicio, fim))
+        inicio = fim
+    return grupos
+
+
+def planejar_tiles(pontos, zoom=19, margem_px=MARGEM_TILE_PX, lado_px=LADO_TILE_PX):
+    """
+    Agrupa pontos de edificação em tiles (cobertura gulosa por faixas).
+    Varre faixas horizontais da altura útil do tile; dentro de cada faixa a cobertura
+    1D gulosa é ótima. Cada tile é centrado na caixa das edificações que cobre.
+    Devolve pontos de scan do tipo 'tile' com a lista de 'edificacoes' cobertas; os polígonos
+    delas vão planos no tile (coords/offsets), um anel por edificação, talvez vazio, na mesma ordem.
+    """
+    if not pontos:
+        return []
+    util = lado_px - 2 * margem_px
+    lats = np.array([p['latitude'] for p in pontos], dtype=float)
+    lons = np.array([p['longitude'] for p in pontos], dtype=float)
+    x, y = latlon_para_mundo(lats, lons, zoom)
+    aneis = [p.get('coords') or [] for p in pontos]
+
+    tiles = []
+    ordem_y = np.argsort(y, kind='stable')
+    inicio = 0
+    while inicio < len(ordem_y):
+        fim = np.searchsorted(y[ordem_y], y[ordem_y[inicio]] + util, side='right')
+        faixa = ordem_y[inicio:fim]
+        faixa = faixa[np.argsort(x[faixa], kind='stable')]
+        for a, b in _cobrir_faixa(x[faixa], util):
+            membros = faixa[a:b]
+            cx = (x[membros].min() + x[membros].max()) / 2
+            cy = (y[membros].min() + y[membros].max()) / 2
+            lat, lon = mundo_para_latlon(cx, cy, zoom)
+            tiles.append((float(lat), float(lon), membros))
+        inicio = fim
+
+    planejados = []
+    for lat, lon, membros in tiles:
+        # Mesmo arredondamento do cache de tiles: o centro usado na projeção é o da imagem baixada
+        lat, lon = quantizar_coordenada(lat), quantizar_coordenada(lon)
+        membros = membros.tolist()
+        offsets = np.zeros(len(membros) + 1, dtype=np.int64)
+        np.cumsum([len(aneis[i]) // 2 for i in membros], out=offsets[1:])
+        planejados.append({
+            'id': f"tile_z{zoom}_{lat:.5f}_{lon:.5f}",
+            'latitude': lat,
+            'longitude': lon,
+            'type': 'tile',
+            'zoom': zoom,
+            'edificacoes': [{
+                'id': pontos[i].get('id'),
+                'latitude': pontos[i]['latitude'],
+                'longitude': pontos[i]['longitude'],
+            } for i in membros],
+            'coords': [c for i in membros for c in aneis[i]],
+            'offsets': offsets.tolist(),
+        })
+    return planejados
+
+
+def atribuir_deteccoes(ponto_tile, deteccoes, largura_px=None, raio_m=RAIO_ATRIBUICAO_M):
+    """
+    Distribui as detecções (caixas em pixels da imagem) entre as edificações do tile.
+    Com polígono, vale a edificação que contém o centro da caixa; sem polígono, o
+    centroide mais próximo até raio_m. Devolve uma lista de deteccoes por edificação.
+    """
+    edificacoes = ponto_tile.get('edificacoes') or []
+    por_edificacao = [[] for _ in edificacoes]
+    if not deteccoes or not edificacoes:
+        return por_edificacao
+
+    zoom = ponto_tile.get('zoom', 19)
+    escala = (largura_px / LADO_TILE_PX) if largura_px else ESCALA_TILE
+    centro = (ponto_tile['latitude'], ponto_tile['longitude'])
+
+    cx = np.array([d['x'] + d['w'] / 2 for d in deteccoes], dtype=float)
+    cy = np.array([d['y'] + d['h'] / 2 for d in deteccoes], dtype=float)
+    ex, ey = latlon_para_pixel([e['latitude'] for e in edificacoes], [e['longitude'] for e in edificacoes],
+                               *centro, zoom, escala)
+    dist = np.hypot(cx[:, None] - ex[None, :], cy[:, None] - ey[None, :])
+    raio_px = raio_m / metros_por_pixel(centro[0], zoom) * escala
+    dono = np.where(dist.min(axis=1) <= raio_px, dist.argmin(axis=1), -1)
+
+    # Anel j do tile = polígono da edificação j; todos os vértices projetados de uma vez
+    coords, offsets = do_ponto(ponto_tile)
+    gx, gy = latlon_para_pixel(coords[:, 0], coords[:, 1], *centro, zoom, escala)
+    vertices = np.column_stack([gx, gy]).astype(np.float32)
+    for j in range(min(len(edificacoes), len(offsets) - 1)):
+        if offsets[j + 1] - offsets[j] < 3:
+            continue
+        poligono = vertices[offsets[j]:offsets[j + 1]]
+        for i in range(len(deteccoes)):
+            if cv2.pointPolygonTest(poligono, (float(cx[i]), float(cy[i])), False) >= 0:
+                dono[i] = j
+
+    for i, j in enumerate(dono.tolist()):
+        if j >= 0:
+            por_edificacao[j].append(deteccoes[i])
+    return por_edificacao
+
+
+def telhado_do_ponto(ponto):
+    """
+    Polígonos de telhado de um ponto de scan, compactos para mandar ao worker:
+    {'latitude', 'longitude', 'zoom', 'coords', 'offsets'} ou None se não há polígono
+    (grid, hex, edificação sem geometria).
+    """
+    coords, offsets = do_ponto(ponto)
+    com_poligono = np.flatnonzero(np.diff(offsets) >= 3)
+    if not len(com_poligono):
+        return None
+    coords, offsets = recortar(coords, offsets, com_poligono)
+    return {
+        # Mesmo centro da imagem baixada (o cache arredonda a coordenada)
+        'latitude': quantizar_coordenada(ponto['latitude']),
+        'longitude': quantizar_coordenada(ponto['longitude']),
+        'zoom': ponto.get('zoom', 19),
+        'coords': coords,
+        'offsets': offsets,
+    }
+
+
+def mascara_telhado(telhado, largura_px, altura_px=None, margem_m=MARGEM_TELHADO_M):
+    """Máscara uint8 (altura x largura) com 1 nos pixels dos telhados, dilatada de margem_m."""
+    altura_px = altura_px or largura_px
+    escala = largura_px / LADO_TILE_PX
+    px, py = latlon_para_pixel(telhado['coords'][:, 0], telhado['coords'][:, 1],
+                               telhado['latitude'], telhado['longitude'], telhado['zoom'], escala)
+    # Todos os vértices projetados de uma vez; os offsets separam os polígonos
+    vertices = np.round(np.column_stack([px, py])).astype(np.int32)
+    offsets = telhado['offsets']
+    poligonos = [vertices[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    mascara = np.zeros((altura_px, largura_px), dtype=np.uint8)
+    cv2.fillPoly(mascara, poligonos, 1)
+    raio = int(round(margem_m / metros_por_pixel(telhado['latitude'], telhado['zoom']) * escala))
+    if raio > 0:
+        mascara = cv2.dilate(mascara, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * raio + 1, 2 * raio + 1)))
+    return mascara
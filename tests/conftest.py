@@ -0,0 +1,12 @@
+import pytest
+
+from src.services import job_store
+from src.services.job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """JobStore isolado num SQLite temporário, usado por todos os serviços via obter_job_store()."""
+    novo = JobStore(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, '_store', novo)
+    return novo
@@ -0,0 +1,45 @@
+"""Cruzamento das detecções com as usinas da ANEEL."""
+import numpy as np
+import pandas as pd
+
+from src.services.cross_reference import AMBIGUO, NAO_REGISTRADO, REGISTRADO, cruzar_deteccoes, usinas_na_regiao
+from src.utils.spatial_index import M_POR_GRAU
+
+
+def _deslocar_leste(lat, lon, metros):
+    return lon + metros / (M_POR_GRAU * np.cos(np.radians(lat)))
+
+
+def test_distancia_usa_a_latitude_das_deteccoes_e_nao_a_do_espelho():
+    # Espelho nacional: a média das latitudes fica longe do sul (-30°)
+    lat, lon = -30.03, -51.23
+    usinas = pd.DataFrame({
+        'latitude': [lat, 2.8, -3.7, -8.0, 5.0],
+        'longitude': [_deslocar_leste(lat, lon, 45.0), -60.7, -38.5, -35.0, -60.0],
+        'CodCEG': ['POA', 'BV', 'FOR', 'REC', 'RR'],
+    })
+    deteccoes = pd.DataFrame({'subestacao': ['SE'], 'lat': [lat], 'lon': [lon]})
+
+    cruzado = cruzar_deteccoes(deteccoes, usinas, raio_m=50)
+
+    assert cruzado.loc[0, 'situacao'] == REGISTRADO
+    assert cruzado.loc[0, 'usina'] == 'POA'
+    assert abs(cruzado.loc[0, 'distancia_usina_m'] - 45.0) < 0.5
+
+
+def test_usinas_fora_da_caixa_das_deteccoes_nao_entram_no_indice():
+    usinas = pd.DataFrame({'latitude': [-10.95, -10.95, -23.5], 'longitude': [-37.07, -37.5, -46.6]})
+    regiao = usinas_na_regiao(usinas, np.array([-10.95]), np.array([-37.0705]), 100)
+    assert len(regiao) == 1
+
+
+def test_usina_disputada_fica_com_a_deteccao_mais_proxima():
+    lat, lon = -10.95, -37.07
+    usinas = pd.DataFrame({'latitude': [lat], 'longitude': [lon]})
+    deteccoes = pd.DataFrame({'subestacao': ['SE'] * 3, 'lat': [lat] * 3,
+                              'lon': [_deslocar_leste(lat, lon, 10), _deslocar_leste(lat, lon, 30),
+                                      _deslocar_leste(lat, lon, 500)]})
+
+    situacao = list(cruzar_deteccoes(deteccoes, usinas, raio_m=50)['situacao'])
+
+    assert situacao == [REGISTRADO, AMBIGUO, NAO_REGISTRADO]
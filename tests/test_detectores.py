@@ -0,0 +1,28 @@
+"""Detectores: o ultralytics (e o torch) só é importado quando o YOLO roda de fato."""
+import os
+import subprocess
+import sys
+import textwrap
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_listar_detectores_nao_importa_ultralytics(tmp_path):
+    # Pacote falso que quebra se for importado: basta existir para o find_spec
+    pacote = tmp_path / "ultralytics"
+    pacote.mkdir()
+    (pacote / "__init__.py").write_text("raise RuntimeError('ultralytics importado')\n")
+    modelo = tmp_path / "solar_v1.pt"
+    modelo.write_bytes(b"")
+
+    codigo = textwrap.dedent("""
+        import sys
+        from src.services import analysis_engine
+        from src.services.detectors import detectores_disponiveis
+        assert 'yolo' in detectores_disponiveis(), detectores_disponiveis()
+        assert 'ultralytics' not in sys.modules and 'torch' not in sys.modules
+    """)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), RAIZ]), PVG_MODELO_YOLO=str(modelo))
+    processo = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=env, capture_output=True, text=True,
+                              timeout=120)
+    assert processo.returncode == 0, processo.stderr
@@ -0,0 +1,45 @@
+"""Armazém de evidências: caminhos por job e geração sob demanda fora da renderização."""
+import threading
+
+from PIL import Image
+
+from src.services import evidence_store
+from src.services.evidence_store import ArmazemEvidencias, garantir_evidencia
+
+LINHA = {'ponto_id': 'osm_1', 'subestacao': 'SE Jardins', 'lat': -10.95, 'lon': -37.07, 'deteccoes': '[]'}
+
+
+def test_mesmo_ponto_em_jobs_diferentes_nao_se_sobrescreve(tmp_path):
+    armazem = ArmazemEvidencias(str(tmp_path))
+    caminhos_a = armazem.caminhos('osm_1', 'SE Jardins', 'job_a')
+    caminhos_b = armazem.caminhos('osm_1', 'SE Jardins', 'job_b')
+    assert set(caminhos_a).isdisjoint(caminhos_b)
+
+    armazem.guardar('osm_1', Image.new('RGB', (64, 64), 'red'), 'SE Jardins', 'job_a', esperar=True)
+    assert armazem.existe('osm_1', 'SE Jardins', 'job_a')
+    assert not armazem.existe('osm_1', 'SE Jardins', 'job_b')
+
+
+def test_galeria_nao_espera_a_geracao_da_evidencia(tmp_path, monkeypatch):
+    liberar = threading.Event()
+    chamadas = []
+
+    def gerar_evidencia(lat, lon, deteccoes, zoom=None):
+        # Simula o download do tile: só termina quando o teste liberar
+        chamadas.append((lat, lon))
+        liberar.wait(10)
+        return Image.new('RGB', (64, 64), 'blue')
+
+    monkeypatch.setattr(evidence_store, 'gerar_evidencia', gerar_evidencia)
+    armazem = ArmazemEvidencias(str(tmp_path))
+
+    assert garantir_evidencia(armazem, LINHA, 'job_a', esperar=False) == (None, None)
+    # Reruns enquanto gera não agendam de novo
+    futuro = armazem.agendar(LINHA['ponto_id'], lambda: None, LINHA['subestacao'], 'job_a')
+    assert garantir_evidencia(armazem, LINHA, 'job_a', esperar=False) == (None, None)
+
+    liberar.set()
+    futuro.result(timeout=10)
+    assert len(chamadas) == 1
+    assert garantir_evidencia(armazem, LINHA, 'job_a', esperar=False) == \
+        armazem.caminhos(LINHA['ponto_id'], LINHA['subestacao'], 'job_a')
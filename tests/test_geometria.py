@@ -0,0 +1,69 @@
+"""Área e centroide vetorizados sobre polígonos de dimensões conhecidas e a forma plana dos pontos de scan."""
+import numpy as np
+import pytest
+
+from src.utils.geometria import area_poligonos_m2, centroides, desempacotar, do_ponto, empacotar, para_ponto, recortar
+
+M_POR_GRAU_LAT = 111195.0  # esfera de raio 6371 km, a mesma da área
+
+
+def _retangulo(lat, lon, largura_m, altura_m):
+    """Retângulo [lat, lon] centrado em (lat, lon), largura leste-oeste e altura norte-sul em metros."""
+    dlat = altura_m / 2 / M_POR_GRAU_LAT
+    dlon = largura_m / 2 / (M_POR_GRAU_LAT * np.cos(np.radians(lat)))
+    return [[lat - dlat, lon - dlon], [lat - dlat, lon + dlon], [lat + dlat, lon + dlon], [lat + dlat, lon - dlon]]
+
+
+@pytest.mark.parametrize("lat", [0.0, -10.95, -30.0, 60.0])
+def test_area_e_centroide_de_retangulos(lat):
+    geometrias = [_retangulo(lat, -37.07, 100, 50), _retangulo(lat, 120.5, 10, 10),
+                  # Sentido horário e sentido anti-horário dão a mesma área
+                  _retangulo(lat, 0.0, 30, 20)[::-1]]
+    coords, offsets = empacotar(geometrias)
+
+    np.testing.assert_allclose(area_poligonos_m2(coords, offsets), [5000, 100, 600], rtol=2e-3)
+
+    lat_c, lon_c = centroides(coords, offsets)
+    np.testing.assert_allclose(lat_c, lat, atol=1e-9)
+    np.testing.assert_allclose(lon_c, [-37.07, 120.5, 0.0], atol=1e-9)
+
+
+def test_centroide_de_l_e_aneis_degenerados():
+    # L de duas caixas 2x1 e 1x1 (em graus pequenos): centroide de área, não a média dos vértices
+    escala = 1e-4
+    l_forma = [[0, 0], [0, 2], [1, 2], [1, 1], [2, 1], [2, 0]]
+    geometrias = [[[-10 + a * escala, -37 + b * escala] for a, b in l_forma],
+                  [[1.0, 2.0], [1.0, 2.0], [1.0, 2.0]],
+                  []]
+    coords, offsets = empacotar(geometrias)
+
+    lat, lon = centroides(coords, offsets)
+    # Caixa [0,1]x[0,2] (área 2, centro 0.5, 1) + caixa [1,2]x[0,1] (área 1, centro 1.5, 0.5)
+    assert lat[0] == pytest.approx(-10 + (2 * 0.5 + 1 * 1.5) / 3 * escala, abs=1e-12)
+    assert lon[0] == pytest.approx(-37 + (2 * 1.0 + 1 * 0.5) / 3 * escala, abs=1e-12)
+    assert (lat[1], lon[1]) == (1.0, 2.0)
+    assert np.isnan(lat[2]) and np.isnan(lon[2])
+
+    areas = area_poligonos_m2(coords, offsets)
+    assert areas[1] == 0 and areas[2] == 0
+    assert areas[0] == pytest.approx(3 * (escala * M_POR_GRAU_LAT) ** 2 * np.cos(np.radians(-10)), rel=1e-3)
+
+
+def test_recortar_e_forma_do_ponto():
+    geometrias = [[[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], [], [[7.0, 8.0], [9.0, 10.0], [11.0, 12.0], [13.0, 14.0]]]
+    coords, offsets = empacotar(geometrias)
+
+    sub_coords, sub_offsets = recortar(coords, offsets, [2, 1, 0])
+    np.testing.assert_array_equal(sub_offsets, [0, 4, 4, 7])
+    assert desempacotar(sub_coords, sub_offsets) == [geometrias[2], [], geometrias[0]]
+
+    ponto = para_ponto(sub_coords, sub_offsets)
+    # Listas planas de números: o que vai para o JSON do job
+    assert all(isinstance(v, float) for v in ponto['coords']) and ponto['offsets'] == [0, 4, 4, 7]
+    de_volta = do_ponto(ponto)
+    np.testing.assert_array_equal(de_volta[0], sub_coords)
+    np.testing.assert_array_equal(de_volta[1], sub_offsets)
+
+    vazio = do_ponto({'id': 'grid'})
+    assert vazio[0].shape == (0, 2) and vazio[1].tolist() == [0]
+    assert recortar(coords, offsets, [])[1].tolist() == [0]
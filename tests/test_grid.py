@@ -0,0 +1,42 @@
+"""Grid vetorizado: os mesmos pontos, na mesma ordem, do laço ponto a ponto original."""
+import math
+
+import numpy as np
+import pytest
+
+from src.utils.processing import gerar_grid, generate_grid_points, haversine_distance, haversine_km, ponto_id
+
+
+def _grid_laco(center_lat, center_lon, radius_km, spacing_meters):
+    """generate_grid_points antes da vetorização (referência)."""
+    points = []
+    lat_step = (spacing_meters / 1000.0) / 111.0
+    lon_step = (spacing_meters / 1000.0) / (111.0 * math.cos(math.radians(center_lat)))
+    num_steps = int(radius_km / (spacing_meters / 1000.0))
+    for i in range(-num_steps, num_steps + 1):
+        for j in range(-num_steps, num_steps + 1):
+            lat = center_lat + i * lat_step
+            lon = center_lon + j * lon_step
+            if haversine_distance(center_lat, center_lon, lat, lon) <= radius_km:
+                points.append({'id': ponto_id('grid', lat, lon), 'latitude': lat, 'longitude': lon,
+                               'type': 'grid'})
+    return points
+
+
+@pytest.mark.parametrize("center_lat, center_lon", [(-10.95, -37.07), (-30.03, -51.22), (59.9, 10.75)])
+@pytest.mark.parametrize("radius_km, spacing_meters", [(0.3, 30), (1.0, 30), (2.0, 50), (0.03, 30)])
+def test_grid_vetorizado_igual_ao_laco(center_lat, center_lon, radius_km, spacing_meters):
+    esperado = _grid_laco(center_lat, center_lon, radius_km, spacing_meters)
+    assert generate_grid_points(center_lat, center_lon, radius_km, spacing_meters) == esperado
+
+    grid = gerar_grid(center_lat, center_lon, radius_km, spacing_meters)
+    np.testing.assert_array_equal(grid['latitude'], [p['latitude'] for p in esperado])
+    np.testing.assert_array_equal(grid['longitude'], [p['longitude'] for p in esperado])
+
+
+def test_haversine_em_array_igual_a_escalar():
+    rng = np.random.default_rng(0)
+    lat1, lon1 = rng.uniform(-60, 60, 200), rng.uniform(-180, 180, 200)
+    lat2, lon2 = lat1 + rng.normal(0, 2, 200), lon1 + rng.normal(0, 2, 200)
+    esperado = [haversine_distance(*args) for args in zip(lat1, lon1, lat2, lon2)]
+    np.testing.assert_allclose(haversine_km(lat1, lon1, lat2, lon2), esperado, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,50 @@
+"""Executor de jobs: a vazão da execução fica no estado (o painel a mostra depois dos reruns)."""
+import time
+
+from src.services import job_runner
+from src.services.job_runner import FASE_CONCLUIDA, FASES_ATIVAS, ExecutorJobs
+
+
+def _executor_falso(store, monkeypatch):
+    def iterar_job(job_id, **kwargs):
+        for ponto in store.pontos_pendentes(job_id):
+            yield ponto, {}
+
+    pontos = [{'id': f"p{i}", 'latitude': -10.9, 'longitude': -37.0 + i * 1e-4} for i in range(5)]
+    monkeypatch.setattr(job_runner, 'iterar_job', iterar_job)
+    monkeypatch.setattr(job_runner, 'preparar_pontos', lambda *args: pontos)
+    return ExecutorJobs(simultaneos=1)
+
+
+def _esperar(executor, job_id):
+    for _ in range(100):
+        if executor.estado(job_id)['fase'] not in FASES_ATIVAS:
+            break
+        time.sleep(0.05)
+
+
+def test_estado_guarda_vazao_da_execucao(store, monkeypatch):
+    executor = _executor_falso(store, monkeypatch)
+    job_id = executor.submeter_scan("SE Teste", -10.9, -37.0, job_runner.MODOS['grid'])
+
+    _esperar(executor, job_id)
+    estado = executor.estado(job_id)
+    assert estado['fase'] == FASE_CONCLUIDA
+    assert estado['imagens_s'] > 0
+
+
+def test_execucoes_terminadas_nao_acumulam(store, monkeypatch):
+    monkeypatch.setattr(job_runner, 'EXECUCOES_GUARDADAS', 2)
+    executor = _executor_falso(store, monkeypatch)
+    jobs = []
+    for i in range(5):
+        jobs.append(executor.submeter_scan(f"SE {i}", -10.9, -37.0, job_runner.MODOS['grid']))
+        _esperar(executor, jobs[-1])
+
+    # A próxima submissão esquece as mais antigas; a malha nunca fica no executor, só no SQLite
+    executor.submeter_scan("SE 5", -10.9, -37.0, job_runner.MODOS['grid'])
+    assert executor.recentes()[1:] == jobs[:-3:-1]
+    assert executor.estado(jobs[0]) is None
+    assert all('pontos' not in e for e in executor._execucoes.values())
+    assert [p['id'] for p in store.pontos_do_job(jobs[0])] == [f"p{i}" for i in range(5)]
+    assert store.pontos_do_job(jobs[0])[1]['longitude'] == -37.0 + 1e-4
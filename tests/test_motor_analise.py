@@ -0,0 +1,36 @@
+"""Motor de análise: blocos de memória compartilhada não sobram quando o scan é cancelado."""
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from src.services.analysis_engine import MotorAnalise
+
+
+@pytest.fixture
+def motor():
+    motor = MotorAnalise(processos=2, threads_download=1)
+    yield motor
+    motor.fechar()
+
+
+def test_cancelar_gerador_libera_memoria_compartilhada(motor):
+    criados = []
+    submeter = motor._submeter
+
+    def _submeter(*args, **kwargs):
+        fut, shms = submeter(*args, **kwargs)
+        criados.extend(shm.name for shm in shms)
+        return fut, shms
+
+    motor._submeter = _submeter
+    imagens = ((i, np.full((64, 64, 3), i % 255, dtype=np.uint8)) for i in range(50))
+    gerador = motor._iterar(imagens, None, 'heuristico')
+    next(gerador)
+    # Close do gerador = cancelamento do job (resultados.close() no executor)
+    gerador.close()
+
+    assert criados
+    for nome in criados:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=nome)
@@ -0,0 +1,98 @@
+"""Base OSM local: subestações filtradas pelo município e edificações no raio com o polígono plano."""
+import json
+
+import pytest
+
+from src.services import osm_service
+from src.services.osm_store import BaseOSM, ingerir_extrato
+
+# Dois municípios vizinhos (quadrados de 0,1°) e uma subestação em cada; a terceira fica fora dos dois
+ARACAJU = [[-37.10, -11.00], [-37.00, -11.00], [-37.00, -10.90], [-37.10, -10.90], [-37.10, -11.00]]
+SAO_CRISTOVAO = [[-37.20, -11.00], [-37.10, -11.00], [-37.10, -10.90], [-37.20, -10.90], [-37.20, -11.00]]
+
+
+def _feicao(tags, tipo, coordenadas):
+    return {'type': 'Feature', 'properties': tags, 'geometry': {'type': tipo, 'coordinates': coordenadas}}
+
+
+def _municipio(nome, anel):
+    return _feicao({'boundary': 'administrative', 'admin_level': '8', 'name': nome}, 'Polygon', [anel])
+
+
+@pytest.fixture
+def base(tmp_path):
+    extrato = tmp_path / "extrato.geojson"
+    extrato.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        _municipio('Aracaju', ARACAJU),
+        _municipio('São Cristóvão', SAO_CRISTOVAO),
+        _feicao({'power': 'substation', 'name': 'SE Jardins'}, 'Point', [-37.05, -10.95]),
+        _feicao({'power': 'substation', 'name': 'SE São Cristóvão'}, 'Point', [-37.15, -10.95]),
+        _feicao({'power': 'substation', 'name': 'SE Itabaiana', 'addr:city': 'Itabaiana'}, 'Point', [-37.42, -10.68]),
+    ]}))
+    manifesto = ingerir_extrato(str(extrato), str(tmp_path / "osm"))
+    assert manifesto['municipios'] == 2
+    return BaseOSM(str(tmp_path / "osm"))
+
+
+def test_subestacoes_do_municipio(base):
+    assert list(base.subestacoes('Aracaju')['Nome']) == ['SE Jardins']
+    # Sem acento e em outra caixa também casa
+    assert list(base.subestacoes('sao cristovao')['Nome']) == ['SE São Cristóvão']
+    # Fora dos limites do extrato vale a tag addr:city
+    assert list(base.subestacoes('Itabaiana')['Nome']) == ['SE Itabaiana']
+    assert len(base.subestacoes()) == 3
+
+
+def test_cidade_fora_do_extrato_consulta_o_overpass(base, monkeypatch):
+    monkeypatch.setattr(osm_service, 'obter_base_osm', lambda: base)
+    consultas = []
+
+    def _overpass(cidade):
+        consultas.append(cidade)
+        return osm_service.pd.DataFrame([{'Nome': 'SE Centro', 'latitude': -10.0, 'longitude': -36.9,
+                                          'Tipo': 'Real'}])
+
+    monkeypatch.setattr(osm_service, '_subestacoes_overpass', _overpass)
+    assert list(osm_service.buscar_subestacoes_osm('Aracaju')['Nome']) == ['SE Jardins']
+    assert consultas == []
+    assert list(osm_service.buscar_subestacoes_osm('Propriá')['Nome']) == ['SE Centro']
+    assert consultas == ['Propriá']
+
+
+def test_limite_municipal_de_relacao_no_pbf(tmp_path):
+    osmium = pytest.importorskip("osmium")
+    arquivo = str(tmp_path / "extrato.osm.pbf")
+    escritor = osmium.SimpleWriter(arquivo)
+    for i, (lon, lat) in enumerate(ARACAJU[:-1], start=1):
+        escritor.add_node(osmium.osm.mutable.Node(id=i, location=(lon, lat), tags={}))
+    escritor.add_node(osmium.osm.mutable.Node(id=10, location=(-37.05, -10.95),
+                                              tags={'power': 'substation', 'name': 'SE Jardins'}))
+    escritor.add_node(osmium.osm.mutable.Node(id=11, location=(-37.15, -10.95),
+                                              tags={'power': 'substation', 'name': 'SE Vizinha'}))
+    escritor.add_way(osmium.osm.mutable.Way(id=100, nodes=[1, 2, 3, 4, 1], tags={}))
+    escritor.add_relation(osmium.osm.mutable.Relation(
+        id=1000, members=[('w', 100, 'outer')],
+        tags={'type': 'boundary', 'boundary': 'administrative', 'admin_level': '8', 'name': 'Aracaju'}))
+    escritor.close()
+
+    ingerir_extrato(arquivo, str(tmp_path / "osm"))
+    assert list(BaseOSM(str(tmp_path / "osm")).subestacoes('Aracaju')['Nome']) == ['SE Jardins']
+
+
+def test_edificacoes_raio_recorta_os_poligonos_planos(tmp_path):
+    # Casas de ~11 m a cada 0,001° para leste; só as primeiras ficam no raio de 250 m
+    aneis = [[[-37.07 + k * 0.001 + dx, -10.95 + dy] for dx, dy in ((0, 0), (1e-4, 0), (1e-4, 1e-4), (0, 1e-4))]
+             for k in range(10)]
+    extrato = tmp_path / "extrato.geojson"
+    extrato.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        _feicao({'building': 'yes', '@id': f"way/{100 + k}"}, 'Polygon', [anel]) for k, anel in enumerate(aneis)]}))
+    ingerir_extrato(str(extrato), str(tmp_path / "osm"))
+
+    casas = BaseOSM(str(tmp_path / "osm")).edificacoes_raio(-10.95, -37.07, 0.25)
+    assert list(casas['id']) == [100, 101, 102]
+    assert list(casas.columns) == ['id', 'centro_lat', 'centro_lon', 'area_m2', 'inicio', 'fim']
+    # Só os polígonos das casas no raio saem do mmap, na ordem das linhas
+    coords = casas.attrs['coords']
+    assert coords.shape == (12, 2)
+    for inicio, fim, anel in zip(casas['inicio'], casas['fim'], aneis):
+        assert coords[inicio:fim].tolist() == [[lat, lon] for lon, lat in anel]
@@ -0,0 +1,45 @@
+"""Grid hexagonal: células grossas refinadas não contam junto com as filhas."""
+from src.services import scan_service
+from src.services.cross_reference import deteccoes_do_job
+from src.services.evidence_store import ArmazemEvidencias
+from src.services.scan_service import criar_job_scan, iterar_job
+from src.utils.hexgrid import celulas_de_pontos, pontos_de_celulas, refinar
+
+
+def _analise_falsa(gd_por_id):
+    def iterar_scan(pontos, hsv_config=None, detector=None, desenhar=True):
+        for i, ponto in enumerate(pontos):
+            paineis = gd_por_id.get(ponto['id'], 0)
+            yield i, {'tem_gd': paineis > 0, 'paineis_estimados': paineis, 'classe': 'residencial' if paineis else None,
+                      'deteccoes': [{'conf': 0.9}] * paineis}
+    return iterar_scan
+
+
+def test_celula_refinada_sai_dos_kpis_das_exportacoes_e_do_cruzamento(store, tmp_path, monkeypatch):
+    celula = celulas_de_pontos([-10.95], [-37.07], 9)[0]
+    mae = pontos_de_celulas([celula], resolucao_alvo=10)[0]
+    filhas = refinar(mae)
+    # A passada grossa vê o painel; na fina ele aparece numa filha só
+    monkeypatch.setattr(scan_service, 'iterar_scan', _analise_falsa({mae['id']: 5, filhas[0]['id']: 2}))
+
+    job_id = criar_job_scan([('SE', [mae])])
+    resultados = list(iterar_job(job_id, evidencias='nenhuma', armazem=ArmazemEvidencias(str(tmp_path / "ev"))))
+
+    assert len(resultados) == 1 + len(filhas)
+    assert resultados[0][1].get('refinado') is True
+    assert store.progresso(job_id)['concluido'] == 1 + len(filhas)
+
+    resumo = store.resumo(job_id)
+    assert resumo['analisados'] == len(filhas)
+    assert resumo['com_gd'] == 1
+    assert resumo['paineis_estimados'] == 2
+
+    por_subestacao = store.resumo_por_subestacao(job_id)[0]
+    assert (por_subestacao['analisados'], por_subestacao['com_gd']) == (len(filhas), 1)
+    assert por_subestacao['concluidos'] == 1 + len(filhas)
+
+    assert {l['ponto_id'] for l in store.resultados(job_id)} == {f['id'] for f in filhas}
+    linhas, _ = store.resultados_desde(job_id, apenas_gd=True)
+    assert [l['ponto_id'] for l in linhas] == [filhas[0]['id']]
+    assert list(deteccoes_do_job(job_id)['ponto_id']) == [filhas[0]['id']]
+    assert sum(gd for _, _, _, gd in store.pontos_mapa(job_id)) == 1
@@ -0,0 +1,93 @@
+"""Linhas de resultado: pontos 'tile' contam por edificação no resumo e na expansão por edificação."""
+import json
+
+import numpy as np
+
+from src.services import scan_service
+from src.services.evidence_store import ArmazemEvidencias
+from src.services.result_writer import linha_resultado, linhas_por_edificacao
+from src.services.scan_service import criar_job_scan, iterar_job
+from src.utils.geometria import para_ponto
+from src.utils.tile_planner import latlon_para_pixel, planejar_tiles
+
+
+def _edificacao(i, lat, lon, lado_m=10):
+    dlat = lado_m / 2 / 111320.0
+    dlon = dlat / np.cos(np.radians(lat))
+    anel = [[lat - dlat, lon - dlon], [lat - dlat, lon + dlon], [lat + dlat, lon + dlon], [lat + dlat, lon - dlon]]
+    return {'id': f"way/{i}", 'latitude': lat, 'longitude': lon, 'type': 'building', **para_ponto(anel, [0, 4])}
+
+
+def _caixa(tile, edificacao):
+    """Caixa no centro do telhado, em pixels da imagem decodificada do tile."""
+    x, y = latlon_para_pixel(edificacao['latitude'], edificacao['longitude'], tile['latitude'], tile['longitude'],
+                             tile['zoom'])
+    return {'x': float(x) - 5, 'y': float(y) - 5, 'w': 10, 'h': 10, 'conf': 0.9}
+
+
+def test_tile_conta_cada_edificacao_no_resumo_e_nas_linhas(store, tmp_path, monkeypatch):
+    passo = 20 / 111320.0
+    edificacoes = [_edificacao(i, -10.95, -37.07 + i * passo) for i in range(4)]
+    tile = planejar_tiles(edificacoes)[0]
+    assert len(tile['edificacoes']) == 4
+    sozinha = _edificacao(9, -10.90, -37.00)
+    vazio = {'id': 'grid_vazio', 'latitude': -10.80, 'longitude': -37.00, 'type': 'grid'}
+    falha = {'id': 'grid_falha', 'latitude': -10.81, 'longitude': -37.00, 'type': 'grid'}
+
+    # Duas caixas na primeira edificação, uma na segunda, nenhuma nas outras
+    caixas_tile = [_caixa(tile, edificacoes[0]), _caixa(tile, edificacoes[0]), _caixa(tile, edificacoes[1])]
+    respostas = {
+        tile['id']: {'tem_gd': True, 'paineis_estimados': 3, 'classe': 'residencial', 'deteccoes': caixas_tile},
+        sozinha['id']: {'tem_gd': True, 'paineis_estimados': 2, 'classe': 'comercial', 'deteccoes': [{}]},
+        vazio['id']: {'tem_gd': False, 'paineis_estimados': 0, 'deteccoes': []},
+        falha['id']: {'tem_gd': False, 'deteccoes': [], 'erro': 'timeout'},
+    }
+
+    def iterar_scan(pontos, hsv_config=None, detector=None, desenhar=True):
+        for i, ponto in enumerate(pontos):
+            yield i, dict(respostas[ponto['id']])
+
+    monkeypatch.setattr(scan_service, 'iterar_scan', iterar_scan)
+    job_id = criar_job_scan([('SE', [tile, sozinha, vazio, falha])])
+    list(iterar_job(job_id, armazem=ArmazemEvidencias(str(tmp_path / "ev"))))
+
+    resumo = store.resumo(job_id)
+    # 4 edificações do tile + a edificação sozinha + o ponto de grid; o ponto com erro não conta
+    assert resumo['analisados'] == 6
+    assert resumo['com_gd'] == 3
+    assert resumo['paineis_estimados'] == 5
+    assert resumo['por_classe'] == {'residencial': 1, 'comercial': 1}
+    por_subestacao = store.resumo_por_subestacao(job_id)[0]
+    assert (por_subestacao['analisados'], por_subestacao['com_gd'], por_subestacao['erros']) == (6, 3, 1)
+
+    linhas = store.resultados(job_id)
+    assert [l['ponto_id'] for l in linhas] == [tile['id'], sozinha['id'], vazio['id']]
+    linha_tile = linhas[0]
+    assert (linha_tile['n_edificacoes'], linha_tile['edificacoes_gd'], linha_tile['n_deteccoes']) == (4, 2, 3)
+
+    expandidas = [e for linha in linhas for e in linhas_por_edificacao(linha)]
+    assert [e['ponto_id'] for e in expandidas] == [e['id'] for e in tile['edificacoes']] + [sozinha['id'], vazio['id']]
+    por_id = {e['ponto_id']: e for e in expandidas}
+    assert [por_id[e['id']]['n_deteccoes'] for e in edificacoes] == [2, 1, 0, 0]
+    assert [por_id[e['id']]['tem_gd'] for e in edificacoes] == [True, True, False, False]
+    for e in edificacoes:
+        linha = por_id[e['id']]
+        assert linha['tipo'] == 'building'
+        assert (linha['lat'], linha['lon']) == (e['latitude'], e['longitude'])
+        assert (linha['n_edificacoes'], linha['edificacoes']) == (1, None)
+        assert len(json.loads(linha['deteccoes'])) == linha['n_deteccoes']
+        # Mesma evidência e subestação do tile
+        assert (linha['subestacao'], linha['evidencia']) == ('SE', linha_tile['evidencia'])
+    # Expandir não muda a contagem: uma linha por edificação, com GD onde o resumo contou
+    assert len(expandidas) == resumo['analisados']
+    assert sum(e['edificacoes_gd'] for e in expandidas) == resumo['com_gd']
+    # Linhas que não são de tile passam inalteradas
+    assert por_id[sozinha['id']] == linhas[1]
+    assert por_id[vazio['id']] == linhas[2]
+
+
+def test_linha_sem_edificacoes_vale_por_uma():
+    ponto = {'id': 'p', 'latitude': -10.9, 'longitude': -37.0, 'type': 'building'}
+    linha = linha_resultado({'tem_gd': True, 'deteccoes': [{}, {}]}, ponto, 'SE')
+    assert (linha['n_edificacoes'], linha['edificacoes_gd'], linha['edificacoes']) == (1, 1, None)
+    assert list(linhas_por_edificacao(linha)) == [linha]
@@ -0,0 +1,106 @@
+"""Retomada de scans pela CLI: o processo morre entre o buffer do escritor e o checkpoint do SQLite."""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+import pytest
+
+from src.services.job_store import JobStore
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_PONTOS = 30
+
+# Análise falsa (sem rede); MORTE=n mata o processo (sem flush nem checkpoint) antes do n-ésimo resultado
+DRIVER = textwrap.dedent("""
+    import functools, os, sys
+    from src import cli
+    from src.services import result_writer, scan_service
+
+    morte = int(os.environ['MORTE'])
+    feitos = [0]
+
+    def iterar_scan(pontos, hsv_config=None, detector=None, desenhar=True):
+        for i, ponto in enumerate(pontos):
+            if feitos[0] == morte:
+                os._exit(9)
+            feitos[0] += 1
+            yield i, {'tem_gd': i % 3 == 0, 'deteccoes': []}
+
+    scan_service.iterar_scan = iterar_scan
+    cli.EscritorResultados = functools.partial(result_writer.EscritorResultados,
+                                               linhas_por_lote=int(os.environ['LOTE']))
+    sys.exit(cli.main(sys.argv[1:]))
+""")
+
+
+def _rodar(tmp_path, argumentos, morte, lote, checkpoint_pontos):
+    env = dict(os.environ, PYTHONPATH=RAIZ, MORTE=str(morte), LOTE=str(lote),
+               PVG_JOBS_DB=str(tmp_path / "jobs.sqlite"), PVG_CACHE_DIR=str(tmp_path / "cache"),
+               PVG_CHECKPOINT_PONTOS=str(checkpoint_pontos), PVG_CHECKPOINT_SEGUNDOS="1000")
+    driver = tmp_path / "driver.py"
+    driver.write_text(DRIVER)
+    return subprocess.run([sys.executable, str(driver), *argumentos], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=120)
+
+
+def _ids_gravados(caminho, formato):
+    if not os.path.exists(caminho):
+        return []
+    if formato == 'parquet':
+        return list(pd.read_parquet(caminho)['ponto_id'])
+    with open(caminho, encoding='utf-8') as f:
+        return [json.loads(linha)['ponto_id'] for linha in f if linha.strip()]
+
+
+def _scan(tmp_path, formato, saida):
+    pd.DataFrame([{'Nome': 'SE Teste', 'latitude': -10.95, 'longitude': -37.07}]).to_csv(
+        tmp_path / "subs.csv", index=False)
+    return ["scan", "--arquivo-subestacoes", "subs.csv", "--modo", "grid", "--raio-km", "0.2",
+            "--limite", str(N_PONTOS), "--evidencias", "nenhuma", "--formato", formato, "--saida", str(saida)]
+
+
+@pytest.mark.parametrize("formato", ["jsonl", "parquet"])
+@pytest.mark.parametrize("lote, checkpoint_pontos", [
+    (500, 10),   # checkpoint gravado, linhas ainda no buffer do escritor
+    (7, 1000),   # linhas já no arquivo, checkpoint ainda não gravado
+], ids=["checkpoint_antes_do_arquivo", "arquivo_antes_do_checkpoint"])
+def test_retomada_apos_morte_nao_perde_nem_repete_linhas(tmp_path, formato, lote, checkpoint_pontos):
+    saida = tmp_path / "saida"
+    inicial = _rodar(tmp_path, _scan(tmp_path, formato, saida), morte=25, lote=lote,
+                     checkpoint_pontos=checkpoint_pontos)
+    assert inicial.returncode == 9, inicial.stderr
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    job_id = store.listar_jobs()[0]['id']
+    assert store.progresso(job_id)['total'] == N_PONTOS
+
+    retomada = _rodar(tmp_path, ["scan", "--retomar", job_id], morte=-1, lote=lote,
+                      checkpoint_pontos=checkpoint_pontos)
+    assert retomada.returncode == 0, retomada.stderr
+
+    ids = _ids_gravados(str(saida / f"resultados_{job_id}.{formato}"), formato)
+    assert len(ids) == N_PONTOS
+    assert len(set(ids)) == N_PONTOS
+    assert store.progresso(job_id)['concluido'] == N_PONTOS
+
+
+@pytest.mark.parametrize("formato", ["jsonl", "parquet"])
+def test_jobs_com_a_mesma_saida_nao_se_misturam(tmp_path, formato):
+    saida = tmp_path / "saida"
+    assert _rodar(tmp_path, _scan(tmp_path, formato, saida), morte=-1, lote=7, checkpoint_pontos=10).returncode == 0
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    primeiro = store.listar_jobs()[0]['id']
+    arquivo_primeiro = saida / f"resultados_{primeiro}.{formato}"
+    conteudo = arquivo_primeiro.read_bytes()
+
+    # Segundo job na mesma pasta: morre no meio e é retomado
+    assert _rodar(tmp_path, _scan(tmp_path, formato, saida), morte=12, lote=7, checkpoint_pontos=10).returncode == 9
+    segundo = next(j['id'] for j in store.listar_jobs() if j['id'] != primeiro)
+    assert _rodar(tmp_path, ["scan", "--retomar", segundo], morte=-1, lote=7, checkpoint_pontos=10).returncode == 0
+
+    assert arquivo_primeiro.read_bytes() == conteudo
+    assert len(_ids_gravados(str(arquivo_primeiro), formato)) == N_PONTOS
+    assert len(set(_ids_gravados(str(saida / f"resultados_{segundo}.{formato}"), formato))) == N_PONTOS
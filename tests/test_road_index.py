@@ -0,0 +1,78 @@
+"""Filtro de pontos sobre ruas: shapely/pyproj e a máscara rasterizada do OpenCV dão o mesmo resultado."""
+import numpy as np
+import pytest
+
+from src.services import road_index
+from src.services.road_index import BUFFER_RUAS_M, M_POR_GRAU, IndiceRuas, chave_tile_ruas, mascara_na_rua
+
+LAT0, LON0 = -10.9512, -37.0631
+
+
+@pytest.fixture(params=["shapely", "mascara"])
+def backend(request, monkeypatch):
+    if request.param == "shapely":
+        pytest.importorskip("shapely")
+        pytest.importorskip("pyproj")
+        assert road_index.shapely is not None
+    else:
+        monkeypatch.setattr(road_index, 'shapely', None)
+    monkeypatch.setattr(road_index, '_indices', {})
+    return request.param
+
+
+def _ao_norte(metros):
+    return LAT0 + np.asarray(metros, dtype=float) / M_POR_GRAU
+
+
+def _rua_leste_oeste():
+    """Rua de ~400 m ao longo do paralelo LAT0, como [lon, lat] (formato do Overpass)."""
+    return [[LON0 - 0.002, LAT0], [LON0, LAT0], [LON0 + 0.002, LAT0]]
+
+
+def test_indice_ruas_distancia_ao_eixo(backend):
+    i, j = chave_tile_ruas(LAT0, LON0)
+    indice = IndiceRuas([_rua_leste_oeste()], road_index.caixa_tile_ruas(int(i), int(j)))
+
+    # Longe da borda do buffer (8 m) para a máscara de 1 m não decidir no arredondamento
+    metros = np.array([0.0, 3.0, -5.0, 6.0, 11.0, -12.0, 25.0, -40.0])
+    lats, lons = _ao_norte(metros), np.full(len(metros), LON0 + 0.0005)
+    np.testing.assert_array_equal(indice.na_rua(lats, lons), np.abs(metros) < BUFFER_RUAS_M)
+
+    # Depois do fim da rua (mais de 8 m a leste do último vértice) não há faixa
+    assert not indice.na_rua([LAT0], [LON0 + 0.0025])[0]
+    assert not IndiceRuas([], indice.caixa).na_rua([LAT0], [LON0]).any()
+
+
+def test_mascara_na_rua_baixa_cada_tile_uma_vez(backend):
+    chamadas = []
+
+    def baixar_ruas(lat_min, lon_min, lat_max, lon_max):
+        chamadas.append((lat_min, lon_min, lat_max, lon_max))
+        if not lat_min <= LAT0 <= lat_max:
+            return []
+        return [_rua_leste_oeste()]
+
+    # Pontos no tile da rua e num tile vizinho ao norte (sem ruas)
+    outro_tile = LAT0 + road_index.TILE_RUAS_GRAUS
+    lats = np.concatenate([_ao_norte([0.0, 2.0, 30.0]), [outro_tile, outro_tile]])
+    lons = np.full(len(lats), LON0)
+    esperado = [True, True, False, False, False]
+
+    np.testing.assert_array_equal(mascara_na_rua(lats, lons, baixar_ruas), esperado)
+    np.testing.assert_array_equal(mascara_na_rua(lats[::-1], lons, baixar_ruas), esperado[::-1])
+    assert len(chamadas) == 2
+    assert len(mascara_na_rua([], [], baixar_ruas)) == 0
+
+
+def test_falha_ao_baixar_nao_filtra_e_tenta_de_novo(backend):
+    tentativas = []
+
+    def baixar_ruas(*caixa):
+        tentativas.append(caixa)
+        if len(tentativas) == 1:
+            raise RuntimeError("Overpass fora do ar")
+        return [_rua_leste_oeste()]
+
+    assert not mascara_na_rua([LAT0], [LON0], baixar_ruas).any()
+    assert mascara_na_rua([LAT0], [LON0], baixar_ruas).all()
+    assert len(tentativas) == 2
@@ -0,0 +1,44 @@
+"""Memoização dos serviços: cópias independentes e uma consulta ao Overpass por chamada sem cache."""
+import pandas as pd
+
+from src.services import building_service, osm_service
+from src.services.service_cache import CacheServico
+
+
+def test_hits_devolvem_copias_independentes(tmp_path):
+    cache = CacheServico('teste', ttl_s=60, diretorio=str(tmp_path))
+    calcular = lambda: pd.DataFrame({'Nome': ['SE A', 'SE B']})  # noqa: E731
+
+    primeiro = cache.obter('chave', calcular)
+    primeiro.loc[0, 'Nome'] = 'alterado'
+    primeiro.drop(index=1, inplace=True)
+
+    segundo = cache.obter('chave', calcular)
+    assert list(segundo['Nome']) == ['SE A', 'SE B']
+    assert cache.hits_memoria == 1 and cache.misses == 1
+
+
+class _ClienteFalso:
+    def __init__(self, elementos):
+        self.elementos = elementos
+        self.chamadas = []
+
+    def consultar(self, query):
+        self.chamadas.append(query)
+        return {'elements': self.elementos}
+
+
+def test_chamadas_memoizadas_consultam_o_overpass(monkeypatch):
+    cliente = _ClienteFalso([{'lat': -10.9, 'lon': -37.0, 'tags': {'name': 'SE'},
+                              'geometry': [{'lat': -10.9, 'lon': -37.0}, {'lat': -10.91, 'lon': -37.01}]}])
+    monkeypatch.setattr(osm_service, 'obter_cliente_overpass', lambda: cliente)
+    monkeypatch.setattr(building_service, 'obter_cliente_overpass', lambda: cliente)
+
+    osm_service._subestacoes_overpass.sem_cache('Aracaju')
+    ruas = osm_service._ruas_overpass.sem_cache(-10.92, -37.02, -10.89, -36.99)
+    building_service._edificacoes_overpass.sem_cache(-10.9, -37.0, 0.1)
+
+    assert len(cliente.chamadas) == 3
+    assert 'around:100.0,-10.9,-37.0' in cliente.chamadas[2]
+    # Ruas voltam imutáveis: o cache de 'ruas' não copia nos hits
+    assert ruas == (((-37.0, -10.9), (-37.01, -10.91)),)
@@ -0,0 +1,73 @@
+"""pares_no_raio: a grade sem scipy e a cKDTree devolvem os mesmos pares da força bruta."""
+import numpy as np
+import pytest
+
+from src.utils import spatial_index
+from src.utils.spatial_index import IndiceEspacial
+
+
+def _nuvem(n, seed, lat0=-10.95, lon0=-37.07, extensao_m=3000):
+    rng = np.random.default_rng(seed)
+    lats = lat0 + rng.uniform(-1, 1, n) * extensao_m / 111320.0
+    lons = lon0 + rng.uniform(-1, 1, n) * extensao_m / (111320.0 * np.cos(np.radians(lat0)))
+    return lats, lons
+
+
+def _forca_bruta(indice, lats, lons, raio_m):
+    consultas = indice.projetar(lats, lons)
+    dist = np.hypot(*(consultas[:, None, :] - indice.xy[None, :, :]).transpose(2, 0, 1))
+    q, i = np.nonzero(dist <= raio_m)
+    return q, i, dist[q, i]
+
+
+def _ordenados(q, i, d):
+    ordem = np.lexsort((i, q))
+    return q[ordem], i[ordem], d[ordem]
+
+
+def _comparar(indice, lats, lons, raio_m):
+    obtido = _ordenados(*indice.pares_no_raio(lats, lons, raio_m))
+    esperado = _forca_bruta(indice, lats, lons, raio_m)
+    np.testing.assert_array_equal(obtido[0], esperado[0])
+    np.testing.assert_array_equal(obtido[1], esperado[1])
+    np.testing.assert_allclose(obtido[2], esperado[2], rtol=1e-9)
+    return len(obtido[0])
+
+
+@pytest.mark.parametrize("raio_m", [5.0, 40.0, 250.0])
+def test_pares_no_raio_grade_igual_forca_bruta(monkeypatch, raio_m):
+    monkeypatch.setattr(spatial_index, 'cKDTree', None)
+    lats, lons = _nuvem(1500, seed=1)
+    indice = IndiceEspacial(lats, lons)
+    consultas = _nuvem(700, seed=2)
+    assert _comparar(indice, *consultas, raio_m) > 0
+    # Consultas sobre os próprios pontos (pares consigo mesmo, distância 0) e pontos repetidos
+    assert _comparar(indice, lats[:300], lons[:300], raio_m) >= 300
+
+
+def test_pares_no_raio_grade_coordenadas_negativas_e_vazios(monkeypatch):
+    monkeypatch.setattr(spatial_index, 'cKDTree', None)
+    # Do outro lado do meridiano e do equador: células com chaves negativas
+    lats, lons = _nuvem(500, seed=3, lat0=0.0, lon0=0.0, extensao_m=500)
+    indice = IndiceEspacial(lats, lons)
+    _comparar(indice, *_nuvem(200, seed=4, lat0=0.0, lon0=0.0, extensao_m=600), 30.0)
+
+    q, i, d = indice.pares_no_raio([50.0], [50.0], 30.0)
+    assert len(q) == len(i) == len(d) == 0
+    q, i, d = IndiceEspacial([], []).pares_no_raio(lats, lons, 30.0)
+    assert len(q) == 0
+
+
+def test_pares_no_raio_arvore_igual_grade(monkeypatch):
+    pytest.importorskip("scipy")
+    lats, lons = _nuvem(1500, seed=5)
+    consultas = _nuvem(700, seed=6)
+    com_arvore = IndiceEspacial(lats, lons)
+    assert com_arvore._arvore is not None
+    arvore = _ordenados(*com_arvore.pares_no_raio(*consultas, 40.0))
+
+    monkeypatch.setattr(spatial_index, 'cKDTree', None)
+    grade = _ordenados(*IndiceEspacial(lats, lons).pares_no_raio(*consultas, 40.0))
+    np.testing.assert_array_equal(arvore[0], grade[0])
+    np.testing.assert_array_equal(arvore[1], grade[1])
+    np.testing.assert_allclose(arvore[2], grade[2], rtol=1e-9)
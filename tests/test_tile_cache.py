@@ -0,0 +1,44 @@
+"""Cache de tiles: o limite conta cada blob uma vez e o blob só sai do disco sem nenhuma chave."""
+import os
+
+from src.services.tile_cache import TileCache
+
+KB = 1024
+
+
+def _cache(tmp_path, limite_kb):
+    return TileCache(str(tmp_path / "tiles"), tamanho_max_mb=limite_kb / 1024)
+
+
+def _blobs(cache):
+    return sorted(nome for _, _, nomes in os.walk(os.path.join(cache.diretorio, "blobs")) for nome in nomes)
+
+
+def test_chaves_com_o_mesmo_conteudo_contam_uma_vez(tmp_path):
+    cache = _cache(tmp_path, limite_kb=25)
+    oceano = b'a' * 10 * KB
+    # Dez centros sobre o mar: a mesma imagem, um blob de 10 KB sob o limite de 25 KB
+    for i in range(10):
+        cache.guardar(f"oceano_{i}", oceano)
+
+    assert cache.evictions == 0
+    assert all(cache.obter(f"oceano_{i}") == oceano for i in range(10))
+    assert len(_blobs(cache)) == 1
+    assert cache.estatisticas()['tamanho_mb'] * 1024 == 10
+
+
+def test_blob_compartilhado_fica_ate_a_ultima_chave_sair(tmp_path):
+    cache = _cache(tmp_path, limite_kb=25)
+    oceano, cidade, campo = b'a' * 10 * KB, b'b' * 10 * KB, b'c' * 10 * KB
+    cache.guardar("oceano_0", oceano)
+    cache.guardar("oceano_1", oceano)
+    cache.guardar("cidade", cidade)
+    cache.obter("oceano_1")
+
+    # 30 KB distintos: sai o mais antigo (oceano_0), mas o blob continua com oceano_1 e não libera
+    # espaço, então a cidade também sai
+    cache.guardar("campo", campo)
+    assert cache.obter("oceano_0") is None and cache.obter("cidade") is None
+    assert cache.obter("oceano_1") == oceano and cache.obter("campo") == campo
+    assert len(_blobs(cache)) == 2
+    assert cache.estatisticas()['tamanho_mb'] * 1024 == 20
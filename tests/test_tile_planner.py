@@ -0,0 +1,138 @@
+"""Planejamento de tiles: cobertura das edificações e atribuição das detecções de volta a elas."""
+import json
+
+import numpy as np
+import pytest
+
+from src.services.building_service import edificacoes_de_elementos
+from src.utils.geometria import do_ponto, para_ponto
+from src.utils.processing import prepare_scan_data
+from src.utils.tile_planner import (ESCALA_TILE, LADO_TILE_PX, MARGEM_TILE_PX, atribuir_deteccoes,
+                                    latlon_para_mundo, latlon_para_pixel, mascara_telhado, metros_por_pixel,
+                                    planejar_tiles, telhado_do_ponto)
+
+ZOOM = 19
+
+
+def _retangulo(lat, lon, lado_m):
+    """Quadrado de lado_m metros centrado em (lat, lon), na forma dos pontos de scan (coords/offsets)."""
+    dlat = lado_m / 2 / 111320.0
+    dlon = dlat / np.cos(np.radians(lat))
+    anel = [[lat - dlat, lon - dlon], [lat - dlat, lon + dlon], [lat + dlat, lon + dlon], [lat + dlat, lon - dlon]]
+    return para_ponto(anel, [0, 4])
+
+
+def _aneis(tile):
+    """Polígono de cada edificação do tile, na ordem de 'edificacoes'."""
+    coords, offsets = do_ponto(tile)
+    assert len(offsets) == len(tile['edificacoes']) + 1
+    return [coords[offsets[j]:offsets[j + 1]] for j in range(len(tile['edificacoes']))]
+
+
+def _bairro(n, lat0, lon0, extensao_m, seed):
+    rng = np.random.default_rng(seed)
+    lats = lat0 + rng.uniform(-1, 1, n) * extensao_m / 111320.0
+    lons = lon0 + rng.uniform(-1, 1, n) * extensao_m / (111320.0 * np.cos(np.radians(lat0)))
+    return [{'id': f"b{i}", 'latitude': float(la), 'longitude': float(lo), **_retangulo(la, lo, 10)}
+            for i, (la, lo) in enumerate(zip(lats, lons))]
+
+
+@pytest.mark.parametrize("lat0, lon0", [(-10.95, -37.07), (-30.03, -51.22), (45.0, 7.0)])
+def test_toda_edificacao_fica_dentro_do_seu_tile_apos_quantizar(lat0, lon0):
+    pontos = _bairro(400, lat0, lon0, 800, seed=1)
+    tiles = planejar_tiles(pontos, zoom=ZOOM)
+
+    ids = [e['id'] for t in tiles for e in t['edificacoes']]
+    assert sorted(ids) == sorted(p['id'] for p in pontos)
+    assert len(tiles) < len(pontos)
+
+    # Centro quantizado pelo cache (o mesmo da imagem baixada): o polígono inteiro cabe na imagem
+    # e o centroide ainda fica dentro da área útil, descontado o arredondamento de 1e-5 grau
+    arredondamento_px = 1.2 / metros_por_pixel(lat0, ZOOM)
+    for t in tiles:
+        cx, cy = latlon_para_mundo(t['latitude'], t['longitude'], ZOOM)
+        for e, g in zip(t['edificacoes'], _aneis(t)):
+            x, y = latlon_para_mundo(g[:, 0], g[:, 1], ZOOM)
+            assert np.all(np.abs(x - cx) < LADO_TILE_PX / 2)
+            assert np.all(np.abs(y - cy) < LADO_TILE_PX / 2)
+            ex, ey = latlon_para_mundo(e['latitude'], e['longitude'], ZOOM)
+            assert abs(ex - cx) <= LADO_TILE_PX / 2 - MARGEM_TILE_PX + arredondamento_px
+            assert abs(ey - cy) <= LADO_TILE_PX / 2 - MARGEM_TILE_PX + arredondamento_px
+
+
+def _quarteirao(lat0, lon0, lado, passo_m):
+    """Edificações de 10 m numa malha regular (sem sobreposição), em [lat, lon]."""
+    pontos = []
+    for i in range(lado):
+        for j in range(lado):
+            lat = lat0 + i * passo_m / 111320.0
+            lon = lon0 + j * passo_m / (111320.0 * np.cos(np.radians(lat0)))
+            pontos.append({'id': f"b{i}_{j}", 'latitude': lat, 'longitude': lon, **_retangulo(lat, lon, 10)})
+    return pontos
+
+
+def test_caixa_desenhada_sobre_o_poligono_vai_para_a_edificacao():
+    tile = planejar_tiles(_quarteirao(-10.95, -37.07, 6, 20), zoom=ZOOM)[0]
+    assert len(tile['edificacoes']) == 36
+
+    deteccoes = []
+    for e, g in zip(tile['edificacoes'], _aneis(tile)):
+        px, py = latlon_para_pixel(g[:, 0], g[:, 1], tile['latitude'], tile['longitude'], ZOOM)
+        # Caixa perto do canto do telhado, em pixels da imagem decodificada (escala 2)
+        deteccoes.append({'x': float(px.min() + 2), 'y': float(py.min() + 2), 'w': 6.0, 'h': 6.0, 'id': e['id']})
+
+    por_edificacao = atribuir_deteccoes(tile, deteccoes, largura_px=LADO_TILE_PX * ESCALA_TILE)
+    assert [[d['id'] for d in ds] for ds in por_edificacao] == [[e['id']] for e in tile['edificacoes']]
+
+    # Imagem baixada em escala 1: mesma atribuição com as caixas reescaladas
+    reduzidas = [{**d, 'x': d['x'] / ESCALA_TILE, 'y': d['y'] / ESCALA_TILE, 'w': 3.0, 'h': 3.0} for d in deteccoes]
+    por_edificacao = atribuir_deteccoes(tile, reduzidas, largura_px=LADO_TILE_PX)
+    assert [[d['id'] for d in ds] for ds in por_edificacao] == [[e['id']] for e in tile['edificacoes']]
+
+
+def test_sem_poligono_usa_o_centroide_mais_proximo_ate_o_raio():
+    pontos = [{'id': 'a', 'latitude': -10.95, 'longitude': -37.07},
+              {'id': 'b', 'latitude': -10.95, 'longitude': -37.0695}]
+    tile = planejar_tiles(pontos, zoom=ZOOM)[0]
+    ax, ay = latlon_para_pixel(-10.95, -37.07, tile['latitude'], tile['longitude'], ZOOM)
+    bx, by = latlon_para_pixel(-10.95, -37.0695, tile['latitude'], tile['longitude'], ZOOM)
+    m_px = metros_por_pixel(tile['latitude'], ZOOM) / ESCALA_TILE
+    deteccoes = [
+        {'x': float(ax) + 1, 'y': float(ay), 'w': 2, 'h': 2},
+        {'x': float(bx) - 3, 'y': float(by), 'w': 2, 'h': 2},
+        # Longe de tudo (30 m abaixo de 'a'): não é atribuída
+        {'x': float(ax), 'y': float(ay) + 30 / m_px, 'w': 2, 'h': 2},
+    ]
+    a, b = atribuir_deteccoes(tile, deteccoes, raio_m=12)
+    assert a == [deteccoes[0]]
+    assert b == [deteccoes[1]]
+
+
+def test_poligonos_chegam_planos_do_overpass_ao_telhado():
+    # Ways `out geom` do Overpass -> DataFrame -> pontos de scan agrupados em tile -> máscara do worker
+    quadras = _quarteirao(-10.95, -37.07, 3, 20)
+    elementos = [{'id': i, 'geometry': [{'lat': la, 'lon': lo} for la, lo in np.reshape(q['coords'], (-1, 2))]}
+                 for i, q in enumerate(quadras)]
+    elementos.append({'id': 99, 'geometry': [{'lat': -10.95, 'lon': -37.07}]})  # sem polígono: descartada
+    casas = edificacoes_de_elementos(elementos)
+    assert list(casas.columns) == ['id', 'centro_lat', 'centro_lon', 'area_m2', 'inicio', 'fim']
+    assert casas.attrs['coords'].shape == (4 * len(quadras), 2)
+
+    # Filtrar linhas (como a CLI faz por área de atendimento) não perde os polígonos
+    casas = casas.iloc[::-1]
+    tile, = prepare_scan_data(-10.95, -37.07, buildings=casas, agrupar_tiles=True)
+    assert tile['type'] == 'tile' and 'geometria' not in tile
+    assert all(set(e) == {'id', 'latitude', 'longitude'} for e in tile['edificacoes'])
+    json.dumps(tile)
+    assert all(isinstance(v, float) for v in tile['coords'])
+
+    por_id = {f"osm_{i}": np.reshape(q['coords'], (-1, 2)) for i, q in enumerate(quadras)}
+    for e, anel in zip(tile['edificacoes'], _aneis(tile)):
+        np.testing.assert_allclose(anel, por_id[e['id']])
+
+    telhado = telhado_do_ponto(tile)
+    assert telhado['offsets'].tolist() == tile['offsets']
+    mascara = mascara_telhado(telhado, LADO_TILE_PX * ESCALA_TILE, margem_m=0)
+    for e in tile['edificacoes']:
+        px, py = latlon_para_pixel(e['latitude'], e['longitude'], telhado['latitude'], telhado['longitude'], ZOOM)
+        assert mascara[int(py), int(px)] == 1
@@ -0,0 +1,51 @@
+"""Servidor de tiles: porta ocupada por outro programa faz o mapa voltar à camada no cliente."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.services import tile_server
+from src.services.tile_server import ServicoTiles, criar_servidor, servidor_responde
+
+
+class _OutroPrograma(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(b"<html></html>")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servir():
+    servidores = []
+
+    def _servir(servidor):
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidores.append(servidor)
+        return servidor.server_address[1]
+
+    yield _servir
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_servidor_responde_so_para_servidor_de_tiles(store, tmp_path, servir):
+    porta_tiles = servir(criar_servidor('127.0.0.1', 0, ServicoTiles(str(tmp_path / "tiles"), store)))
+    porta_outro = servir(ThreadingHTTPServer(('127.0.0.1', 0), _OutroPrograma))
+
+    assert servidor_responde('127.0.0.1', porta_tiles)
+    assert not servidor_responde('127.0.0.1', porta_outro)
+
+
+def test_porta_ocupada_por_outro_programa_desliga_os_tiles(store, servir, monkeypatch):
+    porta = servir(ThreadingHTTPServer(('127.0.0.1', 0), _OutroPrograma))
+    monkeypatch.setattr(tile_server, 'TILES_HOST', '127.0.0.1')
+    monkeypatch.setattr(tile_server, 'TILES_PORTA', porta)
+    monkeypatch.setattr(tile_server, '_servidor', None)
+
+    assert tile_server.obter_servidor_tiles() is None